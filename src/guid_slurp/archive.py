@@ -0,0 +1,142 @@
+import io
+import os
+import tarfile
+import threading
+from queue import Queue
+from typing import BinaryIO, Callable
+
+# Read, write and queue in 1 MB chunks
+CHUNK_SIZE = 1024 * 1024
+# Chunks buffered between the download and the extracting thread
+QUEUE_CHUNKS = 64
+
+
+def member_matches(member: tarfile.TarInfo, name: str) -> bool:
+    return os.path.normpath(member.name) == os.path.normpath(name)
+
+
+def extract_member(
+    fileobj: BinaryIO,
+    name: str,
+    destination: str,
+    progress: Callable[[int], object] | None = None,
+) -> bool:
+    """
+    Extract the member `name` of the gzipped tar stream `fileobj` to
+    `destination`, reading the archive once from the start and stopping as
+    soon as the member has been written. The file is written next to
+    `destination` and renamed into place when complete. Returns False if
+    the archive has no such member.
+    """
+    tmp_path = f"{destination}.tmp"
+    with tarfile.open(fileobj=fileobj, mode="r|gz", bufsize=CHUNK_SIZE) as tar:
+        for member in tar:
+            if not member_matches(member, name):
+                continue
+            source = tar.extractfile(member)
+            try:
+                with open(tmp_path, "wb", buffering=CHUNK_SIZE) as f:
+                    while chunk := source.read(CHUNK_SIZE):
+                        f.write(chunk)
+                        if progress:
+                            progress(len(chunk))
+                    if f.tell() != member.size:
+                        raise EOFError(f"Archive ended inside {member.name}")
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            os.replace(tmp_path, destination)
+            return True
+    return False
+
+
+class ChunkReader(io.RawIOBase):
+    """
+    Read only file object over chunks of bytes put on a queue, None marking
+    the end of the stream.
+    """
+
+    def __init__(self, chunks: Queue):
+        self._chunks = chunks
+        self._buffer = memoryview(b"")
+        self._finished = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buffer and not self._finished:
+            chunk = self._chunks.get()
+            if chunk is None:
+                self._finished = True
+            else:
+                self._buffer = memoryview(chunk)
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+    def drain(self) -> None:
+        while not self._finished:
+            if self._chunks.get() is None:
+                self._finished = True
+
+
+class StreamingExtractor:
+    """
+    Extract a member of a .tgz while it is still being downloaded. Chunks
+    passed to `write` are decompressed and written to disk by a second
+    thread, so the download, gunzip and disk writes overlap.
+
+    Used as a context manager; leaving it ends the stream, waits for the
+    extracting thread and raises its error, if any, or FileNotFoundError if
+    the member was not in the archive.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        destination: str,
+        progress: Callable[[int], object] | None = None,
+    ):
+        self.name = name
+        self.destination = destination
+        self._chunks: Queue = Queue(maxsize=QUEUE_CHUNKS)
+        self._reader = ChunkReader(self._chunks)
+        self._found = False
+        self._error: BaseException | None = None
+        self._thread = threading.Thread(
+            target=self._extract, args=(progress,), name="extract"
+        )
+
+    def _extract(self, progress) -> None:
+        try:
+            self._found = extract_member(
+                io.BufferedReader(self._reader, CHUNK_SIZE),
+                self.name,
+                self.destination,
+                progress,
+            )
+        except BaseException as ex:
+            self._error = ex
+        finally:
+            # Keep consuming so the download is never blocked on the queue
+            self._reader.drain()
+
+    def __enter__(self) -> "StreamingExtractor":
+        self._thread.start()
+        return self
+
+    def write(self, chunk: bytes) -> None:
+        self._chunks.put(chunk)
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self._chunks.put(None)
+        self._thread.join()
+        if exc_type is not None:
+            return
+        if self._error is not None:
+            raise self._error
+        if not self._found:
+            raise FileNotFoundError(f"{self.name} not found in the archive")
@@ -0,0 +1,515 @@
+"""
+Load test the API against a synthetic dataset.
+
+    python -m guid_slurp.benchmark --rows 200000 --workers 4 \\
+        --concurrency 64 --duration 30 --output benchmark.json
+
+A synthetic PodcastIndex dump is published as a generation the way
+database_sync publishes one (lookup snapshot, lookup file and duplicates
+report) in a scratch directory, and gunicorn serves it with the mmap or
+memory lookup backend, so no MongoDB is needed. Client processes then keep
+`--concurrency` requests in flight for `--duration` seconds after a warm
+up, picking keys with a Zipfian skew, a share of them for podcasts that
+do not exist. The report printed (and written to --output) holds the
+requests per second and latency percentiles overall and per route, and
+the memory of every API worker. The same arguments send the same
+sequence of requests, so reports can be compared across commits.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from itertools import accumulate
+from timeit import default_timer as timer
+from typing import Any, Dict, Iterator, List, Tuple
+from urllib.parse import quote
+
+import httpx
+
+from guid_slurp import database_sync
+from guid_slurp.duplicates import duplicate_groups
+from guid_slurp.generations import generation_id
+from guid_slurp.synthetic import synthetic_rows, write_dump
+
+ROUTES = ("guid", "url", "itunesId", "podcastIndexId", "duplicates")
+DEFAULT_MIX = "guid=40,url=30,itunesId=10,podcastIndexId=18,duplicates=2"
+# Lookups time out into MongoDB when the lookup index is not loaded, this
+# makes them fail fast instead
+UNREACHABLE_MONGODB = "mongodb://127.0.0.1:9/?serverSelectionTimeoutMS=100"
+ETAG = '"benchmark"'
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """
+    Route weights from `guid=40,url=30,...`
+    """
+    weights = {}
+    for item in mix.split(","):
+        route, _, weight = item.partition("=")
+        if route not in ROUTES:
+            raise ValueError(f"Unknown route {route}, expected one of {ROUTES}")
+        weights[route] = float(weight)
+    return weights
+
+
+class KeyPicker:
+    """
+    Picks keys from `keys` with a Zipfian skew: after a seeded shuffle the
+    key of rank r is picked with a weight of 1 / r ** `skew`.
+    """
+
+    def __init__(self, keys: List[Any], skew: float, seed: int):
+        self.keys = list(keys)
+        random.Random(seed).shuffle(self.keys)
+        self.cum_weights = list(
+            accumulate(1 / rank**skew for rank in range(1, len(self.keys) + 1))
+        )
+
+    def pick(self, rng: random.Random) -> Any:
+        return rng.choices(self.keys, cum_weights=self.cum_weights)[0]
+
+
+def request_stream(
+    rows: List[Tuple], mix: Dict[str, float], skew: float, miss_rate: float, seed: int
+) -> Iterator[Tuple[str, str]]:
+    """
+    An endless, reproducible sequence of `(route, path)` to request
+    """
+    rng = random.Random(seed)
+    pickers = {
+        "guid": KeyPicker(sorted({row[0] for row in rows}), skew, seed),
+        "url": KeyPicker([row[1] for row in rows], skew, seed),
+        "itunesId": KeyPicker([row[4] for row in rows if row[4]], skew, seed),
+        "podcastIndexId": KeyPicker([row[3] for row in rows], skew, seed),
+    }
+    routes = list(mix)
+    weights = [mix[route] for route in routes]
+    while True:
+        (route,) = rng.choices(routes, weights)
+        if route == "duplicates":
+            yield route, "/duplicates/"
+            continue
+        miss = rng.random() < miss_rate
+        if route == "guid":
+            guid = uuid.UUID(int=rng.getrandbits(128), version=4) if miss else None
+            yield route, f"/guid/{guid or pickers[route].pick(rng)}"
+        elif route == "url":
+            url = (
+                f"https://missing.example.com/{rng.getrandbits(32)}.xml"
+                if miss
+                else pickers[route].pick(rng)
+            )
+            yield route, f"/url/?url={quote(url, safe='')}"
+        else:
+            key = (
+                rng.randrange(10**10, 10**11) if miss else pickers[route].pick(rng)
+            )
+            yield route, f"/{route}/{key}"
+
+
+def latency_summary(latencies: List[float], seconds: float) -> Dict[str, Any]:
+    """
+    Requests per second and nearest rank percentiles of `latencies` (ms)
+    """
+    ordered = sorted(latencies)
+
+    def percentile(share: float) -> float | None:
+        if not ordered:
+            return None
+        rank = max(1, math.ceil(share * len(ordered)))
+        return round(ordered[rank - 1], 3)
+
+    return {
+        "requests": len(ordered),
+        "requests_per_second": round(len(ordered) / seconds, 1),
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "max_ms": round(ordered[-1], 3) if ordered else None,
+    }
+
+
+@contextmanager
+def configured(**values: Any) -> Iterator[None]:
+    """
+    Set database_sync's module settings for the block and restore them
+    afterwards
+    """
+    saved = {name: getattr(database_sync, name) for name in values}
+    for name, value in values.items():
+        setattr(database_sync, name, value)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(database_sync, name, value)
+
+
+def build_dataset(
+    directory: str, rows: List[Tuple], timestamp: datetime
+) -> Dict[str, Any]:
+    """
+    Publish `rows` as a generation in `directory` with database_sync's own
+    writers. The duplicates report is built from the lookup snapshot, as
+    there is no duplicates collection.
+    """
+    dump_path = os.path.join(directory, "podcastindex_feeds.db")
+    os.makedirs(directory, exist_ok=True)
+    write_dump(dump_path, rows)
+    generation = generation_id(ETAG, timestamp)
+    with configured(DIRECTORY=directory, UNTAR_PATH=dump_path):
+        snapshot = database_sync.write_lookup_snapshot(generation)
+        index = database_sync.write_lookup_index(generation, snapshot, timestamp)
+        groups = sorted(
+            duplicate_groups(os.path.join(directory, snapshot)),
+            key=lambda group: (-group["count"], group["_id"]),
+        )
+        report = database_sync.write_duplicates_report(generation, groups)
+        database_sync.publish_generation(
+            generation,
+            {"etag": ETAG, "timestamp": timestamp},
+            {"sqlite": snapshot, "index": index, "duplicates": report},
+        )
+    os.remove(dump_path)
+    return {"generation": generation, "duplicate_groups": len(groups)}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(
+    scratch: str, port: int, backend: str, workers: int, cache_entries: int
+) -> subprocess.Popen:
+    """
+    Start gunicorn the way the api-gs service runs it, on the generation
+    published under `scratch`. The API's DIRECTORY is TMPDIR/podcastindex,
+    or data/podcastindex in its working directory when run in Docker.
+    """
+    source = os.path.dirname(os.path.dirname(os.path.abspath(database_sync.__file__)))
+    env = {
+        **os.environ,
+        "TMPDIR": scratch,
+        "PYTHONPATH": os.pathsep.join(
+            filter(None, [source, os.environ.get("PYTHONPATH")])
+        ),
+        "LOOKUP_BACKEND": backend,
+        "CACHE_MAX_ENTRIES": str(cache_entries),
+        "MONGODB_CONNECTION": UNREACHABLE_MONGODB,
+        "PROMETHEUS_MULTIPROC_DIR": os.path.join(scratch, "metrics"),
+    }
+    log = open(os.path.join(scratch, "gunicorn.log"), "wb")
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "guid_slurp.main:app",
+            "--config",
+            os.path.join(source, "gunicorn.conf.py"),
+            "--workers",
+            str(workers),
+            "--worker-class",
+            "uvicorn.workers.UvicornWorker",
+            "--bind",
+            f"127.0.0.1:{port}",
+        ],
+        env=env,
+        cwd=scratch,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+
+
+def wait_until_ready(
+    base_url: str, path: str, workers: int, server: subprocess.Popen, timeout: float
+) -> None:
+    """
+    Wait until every worker answers from its lookup index: `path` must
+    succeed many times in a row, each request may reach another worker
+    """
+    deadline = timer() + timeout
+    in_a_row = 0
+    with httpx.Client(base_url=base_url, timeout=5) as client:
+        while in_a_row < 20 * workers:
+            if server.poll() is not None:
+                raise RuntimeError("gunicorn exited, see gunicorn.log")
+            if timer() > deadline:
+                raise TimeoutError("The API workers did not load the generation")
+            try:
+                ok = client.get(path).status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            in_a_row = in_a_row + 1 if ok else 0
+
+
+async def drive(
+    base_url: str,
+    requests: Iterator[Tuple[str, str]],
+    concurrency: int,
+    warmup: float,
+    duration: float,
+) -> Dict[str, Any]:
+    """
+    Keep `concurrency` requests in flight, recording the latency of every
+    request started after `warmup` seconds until `duration` more passed
+    """
+    latencies: Dict[str, List[float]] = {route: [] for route in ROUTES}
+    statuses: Dict[str, int] = {}
+    errors = 0
+    limits = httpx.Limits(
+        max_connections=concurrency, max_keepalive_connections=concurrency
+    )
+    async with httpx.AsyncClient(
+        base_url=base_url, limits=limits, timeout=30
+    ) as client:
+        start = timer()
+        measure_from = start + warmup
+        end = measure_from + duration
+
+        async def worker():
+            nonlocal errors
+            while timer() < end:
+                route, path = next(requests)
+                sent = timer()
+                try:
+                    response = await client.get(path)
+                    status = str(response.status_code)
+                except httpx.HTTPError:
+                    status = "error"
+                took = (timer() - sent) * 1000
+                if sent < measure_from:
+                    continue
+                statuses[status] = statuses.get(status, 0) + 1
+                if status in ("200", "404"):
+                    latencies[route].append(took)
+                else:
+                    errors += 1
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return {"latencies": latencies, "statuses": statuses, "errors": errors}
+
+
+def run_client(
+    base_url: str,
+    rows: List[Tuple],
+    mix: Dict[str, float],
+    skew: float,
+    miss_rate: float,
+    seed: int,
+    concurrency: int,
+    warmup: float,
+    duration: float,
+) -> Dict[str, Any]:
+    """
+    One client process, with its own seed so processes send different
+    but reproducible requests
+    """
+    requests = request_stream(rows, mix, skew, miss_rate, seed)
+    return asyncio.run(drive(base_url, requests, concurrency, warmup, duration))
+
+
+def process_memory(pid: int) -> Dict[str, Any]:
+    """
+    Resident and proportional set size of a process, from /proc. PSS
+    splits pages shared between workers, such as the lookup file.
+    """
+    memory: Dict[str, Any] = {"pid": pid, "rss_bytes": None, "pss_bytes": None}
+    for path, field, key in (
+        (f"/proc/{pid}/status", "VmRSS:", "rss_bytes"),
+        (f"/proc/{pid}/smaps_rollup", "Pss:", "pss_bytes"),
+    ):
+        try:
+            with open(path) as f:
+                for line in f:
+                    if line.startswith(field):
+                        memory[key] = int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            pass
+    return memory
+
+
+def worker_pids(parent: int) -> List[int]:
+    pids = []
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name in brackets may hold spaces, the parent pid is
+        # the second field after it
+        if int(stat.rsplit(")", 1)[1].split()[1]) == parent:
+            pids.append(int(name))
+    return sorted(pids)
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    mix = parse_mix(args.mix)
+    rows = list(synthetic_rows(args.rows, args.seed, args.duplicate_rate))
+    report: Dict[str, Any] = {
+        "commit": git_commit(),
+        "started": datetime.now(timezone.utc).isoformat(),
+        # The clients share the machine with the API workers
+        "host": {"cpus": os.cpu_count(), "python": sys.version.split()[0]},
+        "config": vars(args),
+    }
+    with tempfile.TemporaryDirectory() as scratch:
+        start = timer()
+        directory = os.path.join(scratch, "data", "podcastindex")
+        dataset = build_dataset(directory, rows, datetime.now(timezone.utc))
+        os.symlink(directory, os.path.join(scratch, "podcastindex"))
+        report["dataset"] = {
+            "rows": len(rows),
+            "build_seconds": round(timer() - start, 3),
+            **dataset,
+        }
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        server = start_server(
+            scratch, port, args.backend, args.workers, args.cache_entries
+        )
+        try:
+            wait_until_ready(
+                base_url, f"/podcastIndexId/{rows[0][3]}", args.workers, server, 60
+            )
+            clients = [
+                (
+                    base_url,
+                    rows,
+                    mix,
+                    args.skew,
+                    args.miss_rate,
+                    args.seed + client,
+                    share,
+                    args.warmup,
+                    args.duration,
+                )
+                for client, share in enumerate(
+                    split(args.concurrency, args.client_processes)
+                )
+            ]
+            with multiprocessing.get_context("spawn").Pool(len(clients)) as pool:
+                results = pool.starmap(run_client, clients)
+            report["workers"] = [process_memory(pid) for pid in worker_pids(server.pid)]
+        finally:
+            server.terminate()
+            server.wait(30)
+
+    latencies = {
+        route: [took for result in results for took in result["latencies"][route]]
+        for route in ROUTES
+    }
+    statuses: Dict[str, int] = {}
+    for result in results:
+        for status, count in result["statuses"].items():
+            statuses[status] = statuses.get(status, 0) + count
+    report["overall"] = {
+        **latency_summary(
+            [took for route in ROUTES for took in latencies[route]], args.duration
+        ),
+        "errors": sum(result["errors"] for result in results),
+        "statuses": statuses,
+    }
+    report["routes"] = {
+        route: latency_summary(latencies[route], args.duration)
+        for route in ROUTES
+        if route in mix
+    }
+    return report
+
+
+def split(total: int, parts: int) -> List[int]:
+    """
+    `total` split into `parts` nearly equal, non zero shares
+    """
+    parts = max(1, min(parts, total))
+    return [total // parts + (part < total % parts) for part in range(parts)]
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument(
+        "--duplicate-rate",
+        type=float,
+        default=0.02,
+        help="Share of podcasts reusing an earlier podcast's GUID",
+    )
+    parser.add_argument("--backend", choices=("mmap", "memory"), default="mmap")
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn workers")
+    parser.add_argument(
+        "--cache-entries",
+        type=int,
+        default=50000,
+        help="Response cache entries per worker, 0 disables the cache",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=64, help="Requests kept in flight"
+    )
+    parser.add_argument(
+        "--client-processes",
+        type=int,
+        default=2,
+        help="Processes sharing the concurrency, so the client is not the limit",
+    )
+    parser.add_argument("--duration", type=float, default=30, help="Seconds measured")
+    parser.add_argument(
+        "--warmup", type=float, default=5, help="Seconds sent before measuring"
+    )
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Route weights")
+    parser.add_argument(
+        "--skew", type=float, default=1.1, help="Zipf exponent of the key popularity"
+    )
+    parser.add_argument(
+        "--miss-rate", type=float, default=0.05, help="Share of lookups that miss"
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
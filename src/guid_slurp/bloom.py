@@ -0,0 +1,261 @@
+import math
+import mmap
+import os
+import sqlite3
+import struct
+from hashlib import blake2b
+from typing import Any, Dict, Iterable
+
+from guid_slurp.memory_index import LOOKUP_FIELDS
+from guid_slurp.urls import canonical_url
+
+# On disk Bloom filters of one generation, one per lookup field, so the API
+# can answer a lookup of an identifier that is not in the dump without
+# asking MongoDB. Memory mapped, so all workers share one copy.
+#
+# Layout (little endian):
+#   header       HEADER, then the generation id as UTF-8
+#   per field    the filter's bits, starting on an 8 byte boundary
+#
+# Each field's header entry holds the offset of its bits, the number of
+# bits and of hash functions, the keys added and the bits set, from which
+# the false positive rate is estimated.
+MAGIC = b"GSLPBLM\x00"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sIId" + "QQQQQ" * len(LOOKUP_FIELDS))
+MAX_HASHES = 16
+
+# The values of each field, as the resolver looks them up. URLs are looked
+# up by the canonical form of both `url` and `originalUrl`.
+KEY_QUERIES = {
+    "podcastGuid": (
+        "SELECT podcastGuid FROM podcasts "
+        "WHERE podcastGuid IS NOT NULL AND podcastGuid != ''"
+    ),
+    "url": (
+        "SELECT url FROM podcasts WHERE url IS NOT NULL AND url != '' "
+        "UNION ALL SELECT originalUrl FROM podcasts "
+        "WHERE originalUrl IS NOT NULL AND originalUrl != '' AND originalUrl != url"
+    ),
+    "podcastIndexId": "SELECT id FROM podcasts",
+    "itunesId": "SELECT itunesId FROM podcasts WHERE typeof(itunesId) = 'integer'",
+}
+
+
+def filter_key(field: str, value: Any) -> bytes | None:
+    """
+    The bytes `value` is added to and looked up in the filter of `field`
+    by, or None for a value the filter cannot rule out
+    """
+    if field in ("podcastGuid", "url"):
+        if not isinstance(value, str) or not value:
+            return None
+        return (canonical_url(value) if field == "url" else value).encode()
+    if isinstance(value, int) and not isinstance(value, bool):
+        return str(value).encode()
+    return None
+
+
+def filter_size(keys: int, false_positive_rate: float) -> tuple[int, int]:
+    """
+    Bits, rounded up to whole 64 bit words, and hash functions of a filter
+    holding `keys` keys with the given false positive rate
+    """
+    keys = max(keys, 1)
+    bits = math.ceil(-keys * math.log(false_positive_rate) / math.log(2) ** 2)
+    bits = max(64, -(-bits // 64) * 64)
+    hashes = min(MAX_HASHES, max(1, round(bits / keys * math.log(2))))
+    return bits, hashes
+
+
+class BloomFilter:
+    """
+    A Bloom filter over `bits` bits held in `data`, which can be a
+    bytearray while it is built or a view of a mapped file. The positions
+    of a key come from one 128 bit blake2b hash split in two (double
+    hashing), the same in every process.
+    """
+
+    def __init__(
+        self, bits: int, hashes: int, data=None, keys: int = 0, bits_set: int = 0
+    ):
+        self.bits = bits
+        self.hashes = hashes
+        self.data = bytearray(bits // 8) if data is None else data
+        self.keys = keys
+        self.bits_set = bits_set
+
+    def _positions(self, key: bytes) -> Iterable[int]:
+        digest = blake2b(key, digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        step = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * step) % self.bits for i in range(self.hashes))
+
+    def add(self, key: bytes) -> None:
+        data = self.data
+        for position in self._positions(key):
+            data[position >> 3] |= 1 << (position & 7)
+        self.keys += 1
+
+    def __contains__(self, key: bytes) -> bool:
+        data = self.data
+        return all(
+            data[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+    def count_bits_set(self) -> int:
+        self.bits_set = int.from_bytes(self.data, "little").bit_count()
+        return self.bits_set
+
+    @property
+    def false_positive_rate(self) -> float:
+        """
+        The chance that a key never added is reported as present, from the
+        share of bits set
+        """
+        return (self.bits_set / self.bits) ** self.hashes
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "keys": self.keys,
+            "bytes": self.bits // 8,
+            "hashes": self.hashes,
+            "false_positive_rate": round(self.false_positive_rate, 6),
+        }
+
+
+def write_filters(
+    sqlite_path: str, path: str, generation: str, false_positive_rate: float
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Build the Bloom filters of one generation from a SQLite file holding
+    the podcasts table, sized for the keys each field has. The file is
+    written next to its final name and renamed into place. Returns the
+    stats of each filter.
+    """
+    generation_bytes = generation.encode()
+    filters: Dict[str, BloomFilter] = {}
+    conn = sqlite3.connect(f"file:{sqlite_path}?mode=ro", uri=True)
+    try:
+        for field in LOOKUP_FIELDS:
+            (count,) = conn.execute(
+                f"SELECT COUNT(*) FROM ({KEY_QUERIES[field]})"
+            ).fetchone()
+            bloom = BloomFilter(*filter_size(count, false_positive_rate))
+            cursor = conn.execute(KEY_QUERIES[field])
+            while rows := cursor.fetchmany(10000):
+                for (value,) in rows:
+                    key = filter_key(field, value)
+                    if key is not None:
+                        bloom.add(key)
+            bloom.count_bits_set()
+            filters[field] = bloom
+    finally:
+        conn.close()
+
+    tmp_path = f"{path}.tmp"
+    sections = []
+    position = HEADER.size + len(generation_bytes)
+    with open(tmp_path, "wb") as f:
+        f.write(b"\x00" * position)
+        for field in LOOKUP_FIELDS:
+            bloom = filters[field]
+            padding = -position % 8
+            f.write(b"\x00" * padding)
+            position += padding
+            f.write(bloom.data)
+            sections += (position, bloom.bits, bloom.hashes, bloom.keys, bloom.bits_set)
+            position += len(bloom.data)
+        f.seek(0)
+        f.write(
+            HEADER.pack(
+                MAGIC,
+                FORMAT_VERSION,
+                len(generation_bytes),
+                false_positive_rate,
+                *sections,
+            )
+        )
+        f.write(generation_bytes)
+    os.replace(tmp_path, path)
+    return {field: bloom.stats() for field, bloom in filters.items()}
+
+
+class BloomFilters:
+    """
+    Read only view of the Bloom filters written by `write_filters`
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (
+                magic,
+                version,
+                generation_length,
+                self.target_false_positive_rate,
+                *sections,
+            ) = HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a guid-slurp Bloom filter file")
+            if version != FORMAT_VERSION:
+                raise ValueError(
+                    f"{path} has format version {version}, expected {FORMAT_VERSION}"
+                )
+        except Exception:
+            self._map.close()
+            raise
+        self.generation = bytes(
+            self._map[HEADER.size : HEADER.size + generation_length]
+        ).decode()
+        self._view = memoryview(self._map)
+        self.filters: Dict[str, BloomFilter] = {}
+        for i, field in enumerate(LOOKUP_FIELDS):
+            offset, bits, hashes, keys, bits_set = sections[i * 5 : i * 5 + 5]
+            self.filters[field] = BloomFilter(
+                bits, hashes, self._view[offset : offset + bits // 8], keys, bits_set
+            )
+
+    @classmethod
+    def from_generation(cls, directory: str, current: Dict[str, Any]) -> "BloomFilters":
+        """
+        Map the Bloom filters of the generation described by `current.json`,
+        checking the file really is the generation the pointer names
+        """
+        filters = cls(os.path.join(directory, current["bloom"]))
+        if filters.generation != current["generation"]:
+            generation = filters.generation
+            filters.close()
+            raise ValueError(
+                f"Bloom filter file holds generation {generation}, "
+                f"expected {current['generation']}"
+            )
+        return filters
+
+    def close(self) -> None:
+        for bloom in self.filters.values():
+            bloom.data.release()
+        self.filters = {}
+        self._view.release()
+        self._map.close()
+
+    def might_contain(self, field: str, value: Any) -> bool:
+        """
+        False only when no podcast of the generation has `value` as its
+        `field`
+        """
+        bloom = self.filters.get(field)
+        key = filter_key(field, value)
+        if bloom is None or key is None:
+            return True
+        return key in bloom
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "generation": self.generation,
+            "target_false_positive_rate": self.target_false_positive_rate,
+            "filters": {field: bloom.stats() for field, bloom in self.filters.items()},
+        }
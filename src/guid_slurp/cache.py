@@ -0,0 +1,75 @@
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Callable, Dict, Hashable, List, Tuple
+
+# Returned by ResponseCache.get when a key is not cached, so a cached empty
+# result (a 404) can be told apart from a miss.
+MISSING = object()
+
+
+class ResponseCache:
+    """
+    Bounded in-process LRU cache for resolver results.
+
+    Found results and not found (empty) results have their own time to
+    live. Callers put the dataset generation in the key so a new import
+    never serves stale entries; old generations simply age out of the LRU.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl: float,
+        negative_ttl: float,
+        clock: Callable[[], float] = monotonic,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._clock = clock
+        self._entries: OrderedDict[Hashable, Tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Any:
+        """
+        Returns the cached value or MISSING.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires, value = entry
+            if expires > self._clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+        self.misses += 1
+        return MISSING
+
+    def set(self, key: Hashable, value: List[Any]) -> None:
+        if self.max_entries <= 0:
+            return
+        ttl = self.ttl if value else self.negative_ttl
+        self._entries[key] = (self._clock() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,130 @@
+"""
+Check that the guidUrl indexes cover every resolver query.
+
+    python -m guid_slurp.coverage --mongodb mongodb://localhost:27017
+
+Each query `main.py` sends for a single or batch lookup is explained with
+its projection, using the values of a podcast from the live collection.
+A query is covered when its winning plan reads only indexes: no FETCH of
+documents and no collection scan. Exits with status 1 when any query is
+not covered.
+"""
+
+import argparse
+import json
+import sys
+from typing import Any, Dict, Iterator, List
+
+from pymongo import MongoClient
+from pymongo.collection import Collection
+
+from guid_slurp.mongo import MONGODB_COLLECTION, MONGODB_CONNECTION, MONGODB_DATABASE
+from guid_slurp.schema import (
+    FULL,
+    PROJECTIONS,
+    SCHEMA_VERSION,
+    field_name,
+    lookup_filter,
+    public_document,
+    url_filter,
+)
+
+# Plan stages that read documents rather than index keys
+DOCUMENT_STAGES = {"FETCH", "COLLSCAN", "IDHACK", "CLUSTERED_IXSCAN"}
+
+
+def plan_stages(plan: Dict[str, Any]) -> Iterator[str]:
+    """
+    The stage names of an explained query plan, depth first
+    """
+    if "stage" in plan:
+        yield plan["stage"]
+    for child in plan.get("inputStages", []):
+        yield from plan_stages(child)
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from plan_stages(plan[key])
+
+
+def uncovered_stages(explain: Dict[str, Any]) -> List[str]:
+    """
+    The stages of the winning plan in `explain` that read documents, empty
+    when the query is covered
+    """
+    winning_plan = explain["queryPlanner"]["winningPlan"]
+    stages = [stage for stage in plan_stages(winning_plan) if stage in DOCUMENT_STAGES]
+    docs_examined = explain.get("executionStats", {}).get("totalDocsExamined", 0)
+    if docs_examined and not stages:
+        stages.append(f"{docs_examined} documents examined")
+    return stages
+
+
+def resolver_queries(
+    schema: str, podcast: Dict[str, Any], version: int = SCHEMA_VERSION
+) -> Dict[str, Dict[str, Any]]:
+    """
+    The single and batch lookup queries the resolvers send for the public
+    fields of `podcast`
+    """
+    queries = {}
+    for field in ("podcastGuid", "podcastIndexId", "itunesId"):
+        value = podcast[field]
+        queries[field] = lookup_filter(schema, field, [value])
+        queries[f"{field} batch"] = lookup_filter(schema, field, [value, value])
+    url = podcast["url"]
+    queries["url"] = url_filter(schema, [url], version)
+    queries["url batch"] = url_filter(schema, [url, podcast["originalUrl"]], version)
+    return queries
+
+
+def check_coverage(
+    collection: Collection, schema: str = FULL, version: int = SCHEMA_VERSION
+) -> Dict[str, List[str]]:
+    """
+    Explain every resolver query against `collection`, returning the stages
+    that read documents for each one, empty lists when all are covered
+    """
+    itunes_field = field_name(schema, "itunesId")
+    stored = collection.find_one(
+        {itunes_field: {"$ne": None}}, PROJECTIONS[schema]
+    ) or collection.find_one({}, PROJECTIONS[schema])
+    if stored is None:
+        raise ValueError(f"{collection.name} is empty")
+    podcast = public_document(schema, stored, None)
+    return {
+        name: uncovered_stages(collection.find(query, PROJECTIONS[schema]).explain())
+        for name, query in resolver_queries(schema, podcast, version).items()
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--mongodb", default=MONGODB_CONNECTION, help="MongoDB connection string"
+    )
+    parser.add_argument("--database", default=MONGODB_DATABASE)
+    parser.add_argument("--collection", default=MONGODB_COLLECTION)
+    args = parser.parse_args()
+
+    with MongoClient(args.mongodb) as client:
+        db = client[args.database]
+        file_info = (
+            db["fileInfo"].find_one(
+                {"importedAt": {"$exists": True}}, sort=[("importedAt", -1)]
+            )
+            or {}
+        )
+        report = check_coverage(
+            db[args.collection],
+            file_info.get("schema", FULL),
+            file_info.get("schemaVersion", 1),
+        )
+    print(json.dumps(report, indent=2))
+    if any(report.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
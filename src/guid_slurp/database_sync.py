@@ -1,37 +1,94 @@
 import asyncio
 import csv
+import gzip
+import json
 import logging
 import os
 import sqlite3
-import tarfile
 import tempfile
+from contextlib import ExitStack
 from datetime import datetime, timedelta, timezone
 from time import mktime, strptime
 from timeit import default_timer as timer
-from typing import Any, List, Mapping, Sequence
+from typing import Any, Dict, Iterable, List, Mapping, Sequence
 from urllib.parse import urlparse
 
 import httpx
 from pydantic import UUID5, AnyUrl, BaseModel, Field
-from pymongo import DESCENDING, MongoClient
+from pymongo import DESCENDING, DeleteMany, MongoClient, ReplaceOne
+from pymongo.collection import Collection
 from pymongo.mongo_client import MongoClient as MongoClientType
 from tqdm import tqdm
 from tqdm.utils import CallbackIOWrapper
 
-MONGODB_CONNECTION = "mongodb://10.0.0.11:27017"
+from guid_slurp.archive import StreamingExtractor, extract_member
+from guid_slurp.bloom import write_filters
+from guid_slurp.download import download
+from guid_slurp.duplicates import GUID_INDEX, duplicate_groups
+from guid_slurp.generations import (
+    generation_id,
+    read_current_generation,
+    write_current_generation,
+)
+from guid_slurp.ingest import bulk_load
+from guid_slurp.mmap_index import write_index
+from guid_slurp.schema import (
+    FULL,
+    SCHEMA_VERSION,
+    field_name,
+    index_layout,
+    stored_document,
+)
+from guid_slurp.snapshot_diff import SNAPSHOT_COLUMNS, SnapshotDiff, register_functions
+from guid_slurp.sqlite_reader import MMAP_SIZE, PartitionedReader
+from guid_slurp.telemetry import ImportTelemetry
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+MONGODB_CONNECTION = os.getenv("MONGODB_CONNECTION", "mongodb://10.0.0.11:27017")
 MONGODB_DATABASE = "podcastGuidUrl"
 MONGODB_COLLECTION = "guidUrl"
 MONGODB_DUPLICATES = "duplicateGuidUrl"
+# New generations are built in collections with this suffix and renamed over
+# the live ones once indexed, so the API never sees a half imported dataset.
+STAGING_SUFFIX = "_staging"
 
 
 DIRECTORY = os.path.join(tempfile.gettempdir(), "podcastindex")
 DOWNLOAD_FILENAME = "podcastindex_feeds.db.tgz"
+DOWNLOAD_URL = f"https://public.podcastindex.org/{DOWNLOAD_FILENAME}"
 DOWNLOAD_PATH = os.path.join(DIRECTORY, DOWNLOAD_FILENAME)
 UNTAR_PATH = os.path.join(DIRECTORY, "podcastindex_feeds.db")
 CSV_PATH = os.path.join(DIRECTORY, "podcasts.csv")
+# The database file inside the downloaded archive
+DB_MEMBER = "./podcastindex_feeds.db"
+# "stream" extracts the database while the archive downloads, "file"
+# downloads the whole archive before untar_file extracts it
+DOWNLOAD_MODE = os.getenv("DOWNLOAD_MODE", "stream")
 
 
 COUNT_LINES = 0
+# Rows per insert_many and the number of concurrent insert_many writers
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+IMPORT_WRITERS = int(os.getenv("IMPORT_WRITERS", "4"))
+# Processes reading rowid ranges of the dump in parallel
+IMPORT_READERS = int(os.getenv("IMPORT_READERS", "4"))
+# "diff" applies only the rows that changed since the previous generation
+# when its snapshot has row hashes, "full" always reloads the whole dump
+IMPORT_MODE = os.getenv("IMPORT_MODE", "diff")
+# Storage schema of the guidUrl collection, see guid_slurp.schema
+MONGODB_SCHEMA = os.getenv("MONGODB_SCHEMA", FULL)
+# Record peak Python allocations per import phase with tracemalloc (slow)
+IMPORT_TRACEMALLOC = os.getenv("IMPORT_TRACEMALLOC", "") == "1"
+# Target false positive rate of the Bloom filters the API uses to answer
+# lookups of identifiers that are not in the dump without asking MongoDB
+BLOOM_FALSE_POSITIVE_RATE = float(os.getenv("BLOOM_FALSE_POSITIVE_RATE", "0.01"))
+# Number of published generations to keep on disk. The previous one is kept
+# so API workers still loading it are not left with a missing file.
+KEEP_GENERATIONS = 2
 # Construct the path using os.path.join
 
 # Create a logger instance
@@ -46,6 +103,10 @@ def check_database_fileinfo() -> dict[Any, Any]:
     return latest_record
 
 
+def staging_name(collection_name: str) -> str:
+    return f"{collection_name}{STAGING_SUFFIX}"
+
+
 def write_database_fileinfo(headers: dict[Any, Any]):
     with MongoClient(MONGODB_CONNECTION) as client:  # type: MongoClientType
         db = client[MONGODB_DATABASE]
@@ -64,7 +125,7 @@ def check_new_podcastindex_database() -> bool:
     """
     Check for a new database to download
     """
-    url = f"https://public.podcastindex.org/{DOWNLOAD_FILENAME}"
+    url = DOWNLOAD_URL
 
     if os.path.exists(DOWNLOAD_PATH):
         logger.info(f"File already downloaded {DOWNLOAD_PATH}")
@@ -85,107 +146,96 @@ def check_new_podcastindex_database() -> bool:
     return True
 
 
-def fetch_new_podcastindex_database():
+def fetch_new_podcastindex_database() -> dict[str, Any] | None:
+    """
+    Download the PodcastIndex dump, resuming a partial download left by an
+    earlier run. In stream mode the database file is extracted from the
+    archive while it downloads, so `untar_file` finds it already in place.
+    The download is only recorded in fileInfo once it has been verified.
+    Returns the response headers recorded, or None if the download failed.
+    """
     try:
-        # Send a GET request to the URL and stream the response
-        url = f"https://public.podcastindex.org/{DOWNLOAD_FILENAME}"
-        with httpx.stream("GET", url) as response:
-            # Get the total file size from the Content-Length header
-            total_size = int(response.headers.get("Content-Length", 0))
-            write_database_fileinfo(response.headers)
-            # Open a file for writing in binary mode
-            with open(DOWNLOAD_PATH, "wb") as f:
-                # Wrap the write method of the file object with tqdm
-                with tqdm.wrapattr(
-                    f,
-                    "write",
-                    desc=f"Downloading: {DOWNLOAD_FILENAME}",
-                    unit="B",
-                    unit_scale=True,
-                    total=total_size,
-                ) as wrapped_file:
-                    # Iterate over the response content in
-                    # chunks and write them to the file
-                    for chunk in response.iter_bytes(chunk_size=4096):
-                        wrapped_file.write(chunk)
-
-                    # Close the wrapped file object
-                    wrapped_file.close()
-            # Get the web modified time
-            web_modified = response.headers.get("Last-Modified")
+        url = DOWNLOAD_URL
+        headers = None
+        try:
+            with ExitStack() as stack:
+                extractor = (
+                    stack.enter_context(StreamingExtractor(DB_MEMBER, UNTAR_PATH))
+                    if DOWNLOAD_MODE == "stream"
+                    else None
+                )
+                t = stack.enter_context(
+                    tqdm(
+                        desc=f"Downloading: {DOWNLOAD_FILENAME}",
+                        unit="B",
+                        unit_scale=True,
+                    )
+                )
+                headers = download(
+                    url,
+                    DOWNLOAD_PATH,
+                    consumer=extractor.write if extractor else None,
+                    progress=t.update,
+                )
+        except Exception as ex:
+            if headers is None:
+                # The database may have been extracted before the download
+                # failed its size or MD5 check, it must not be imported
+                if os.path.exists(UNTAR_PATH):
+                    os.remove(UNTAR_PATH)
+                raise
+            # The download itself is fine, untar_file extracts it instead
+            logger.error(f"Streaming extraction failed: {ex}")
+        write_database_fileinfo(headers)
+        # Get the web modified time
+        web_modified = headers.get("Last-Modified")
+        if web_modified:
             web_modified_timestamp = mktime(
                 strptime(web_modified, "%a, %d %b %Y %H:%M:%S %Z")
             )
 
             # Set the modified time of the local file
             os.utime(DOWNLOAD_PATH, (web_modified_timestamp, web_modified_timestamp))
+        return headers
 
     except Exception as ex:
         logger.info("Error loading database")
         logger.info(ex)
+    return None
 
 
 def untar_file():
-    # Open the tar.gz file
-    CHUNK_SIZE = 1024 * 1024  # 1 MB
+    """
+    Extract the database from the downloaded archive, reading the archive
+    once and stopping at the database file
+    """
     if os.path.exists(UNTAR_PATH):
         logger.info(f"File already untarred {UNTAR_PATH}")
         return
-    with tarfile.open(DOWNLOAD_PATH, "r:gz") as tar:
-        # Get the total number of members (files/directories) in the tar file
-        # Extract each member in the tar file
-        logger.info("Examining tarfile ...")
-        for member in tar.getmembers():
-            # Open a new file for writing
-            if member.name == "./podcastindex_feeds.db":
-                logger.info(f"Extracting file {member.name}")
-                extracted_size = 0
-                with tar.extractfile(member) as source, open(
-                    UNTAR_PATH, "wb"
-                ) as destination:
-                    with tqdm(
-                        total=member.size,
-                        unit="B",
-                        unit_scale=True,
-                        unit_divisor=1024,
-                        desc=f"Extracting: {member.name}",
-                    ) as t:
-                        fobj = CallbackIOWrapper(t.update, source, "read")
-
-                        while extracted_size < member.size:
-                            # Read a chunk of data from the source file
-                            chunk = fobj.read(CHUNK_SIZE)
-                            if not chunk:
-                                break
-
-                            # Write the chunk to the destination file
-                            destination.write(chunk)
-
-                            # Update the extracted size
-                            extracted_size += len(chunk)
+    logger.info(f"Extracting file {DB_MEMBER}")
+    with open(DOWNLOAD_PATH, "rb") as source, tqdm(
+        total=os.path.getsize(DOWNLOAD_PATH),
+        unit="B",
+        unit_scale=True,
+        unit_divisor=1024,
+        desc=f"Extracting: {DB_MEMBER}",
+    ) as t:
+        fobj = CallbackIOWrapper(t.update, source, "read")
+        if not extract_member(fobj, DB_MEMBER, UNTAR_PATH):
+            logger.error(f"{DB_MEMBER} not found in {DOWNLOAD_PATH}")
 
 
 def decode_sql():
     # Connect to the database
     global COUNT_LINES
-    conn = sqlite3.connect(UNTAR_PATH)
-    c = conn.cursor()
-
-    # Execute the query to count the rows in the table
-    c.execute("SELECT COUNT(*) FROM podcasts")
-
-    # Fetch the result and store it in a variable
-    COUNT_LINES = c.fetchone()[0]
-
-    # Print the count
-    logger.info("Number of rows:", COUNT_LINES)
-
     if os.path.exists(CSV_PATH):
         logger.info("CSV File already exists")
         return
-    # Execute the query to select the fields from the table
-    c.execute(
-        "SELECT podcastGuid, url, originalUrl, id as podcastIndexId, itunesId FROM podcasts"
+    reader = PartitionedReader(
+        UNTAR_PATH,
+        "podcastGuid, url, originalUrl, id as podcastIndexId, itunesId",
+        partitions=IMPORT_READERS,
+        batch_size=IMPORT_BATCH_SIZE,
     )
 
     # Write the rows to a CSV file using an iterator
@@ -195,50 +245,47 @@ def decode_sql():
         writer.writerow(
             ["podcastGuid", "url", "originalUrl", "podcastIndexId", "itunesId"]
         )  # Write the header row
-        for row in tqdm(c, total=COUNT_LINES, desc="Creating CSV file", unit="rows"):
-            writer.writerow(row)
+        with tqdm(
+            total=reader.estimated_rows, desc="Creating CSV file", unit="rows"
+        ) as t:
+            for rows in reader:
+                writer.writerows(rows)
+                t.update(len(rows))
 
-    # Close the database connection
-    conn.close()
+    # The count comes from the rows read, not a separate scan
+    COUNT_LINES = reader.rows
+    logger.info(f"Number of rows: {COUNT_LINES}")
 
 
-def create_indexes(client: MongoClient):
+def create_indexes(client: MongoClient, collection_name: str = MONGODB_COLLECTION):
     # Connect to MongoDB
     db = client[MONGODB_DATABASE]
 
     # Access the collection
-    collection = db[MONGODB_COLLECTION]
+    collection = db[collection_name]
 
-    # Create an index
-    index_key = "podcastGuid"
-    index_name = "podcastGuid"
-    collection.create_index([(index_key, 1)], name=index_name)
+    # One covering index per lookup field, see guid_slurp.schema.index_layout
+    for index_name, keys, options in index_layout(MONGODB_SCHEMA):
+        collection.create_index(keys, name=index_name, **options)
 
-    # Create an index
-    index_key = "url"
-    index_name = "url"
-    collection.create_index([(index_key, 1)], name=index_name)
 
-    # Create an index
-    index_key = "podcastIndexId"
-    index_name = "podcastIndexId"
-    collection.create_index([(index_key, 1)], name=index_name)
-
-    # Create an index
-    index_key = "itunesId"
-    index_name = "itunesId"
-    collection.create_index([(index_key, 1)], name=index_name)
-
-
-def create_duplicate_collection(client: MongoClient):
+def create_duplicate_collection(
+    client: MongoClient,
+    source: str = MONGODB_COLLECTION,
+    target: str = MONGODB_DUPLICATES,
+):
     """
-    Create the Duplicate collection in the database
+    Create the Duplicate collection `target` from the podcasts in `source`.
+    The live collection is only built when missing, a staging collection is
+    always rebuilt.
     """
     # check if collection duplicatesGuid exists
     db = client[MONGODB_DATABASE]
-    if MONGODB_DUPLICATES in db.list_collection_names():
-        logger.info("Collection duplicatesGuid already exists")
-        return
+    if target in db.list_collection_names():
+        if target == MONGODB_DUPLICATES:
+            logger.info("Collection duplicatesGuid already exists")
+            return
+        db[target].drop()
     # Duplicates of GUID
     pipeline: Sequence[Mapping[str, Any]] = [
         {
@@ -252,10 +299,12 @@ def create_duplicate_collection(client: MongoClient):
         },
         {"$match": {"count": {"$gt": 1}}},
         {"$sort": {"count": -1}},
-        {"$out": MONGODB_DUPLICATES},
+        {"$out": target},
     ]
     logger.info("Creating collection of duplicatesGuidUrl  .... slow operation")
-    db[MONGODB_COLLECTION].aggregate(pipeline)
+    db[source].aggregate(pipeline)
+    # Keyset pagination order used by the /duplicates/ API
+    db[target].create_index([("count", DESCENDING), ("_id", 1)])
     logger.info("🟢Created collection of duplicatesGuidUrl")
 
 
@@ -273,7 +322,9 @@ class Duplicates(BaseModel):
 def process_duplicates(client: MongoClient):
     """
     Takes the duplicate colleciton and highlights where the duplicates are
-    all from the same base URL
+    all from the same base URL. Only needed for a collection built by
+    `create_duplicate_collection`, `write_duplicate_collection` includes
+    these fields already.
     """
     db = client[MONGODB_DATABASE]
     collection = db[MONGODB_DUPLICATES]
@@ -298,77 +349,451 @@ def process_duplicates(client: MongoClient):
     logger.info("🟢Finished the process of duplicatesGuidUrl  .... slow operation")
 
 
-def create_database():
-    global COUNT_LINES
-    with sqlite3.connect(UNTAR_PATH) as conn:
-        c = conn.cursor()
+def podcast_document(row: Sequence[Any], timestamp: datetime) -> dict[str, Any]:
+    """
+    The guidUrl document for a row of SNAPSHOT_COLUMNS in MONGODB_SCHEMA
+    """
+    return stored_document(MONGODB_SCHEMA, row, timestamp)
+
 
-        # Execute the query to count the rows in the table
-        c.execute("SELECT COUNT(*) FROM podcasts")
+def apply_snapshot_diff(
+    collection: Collection, diff: SnapshotDiff, timestamp: datetime
+) -> dict[str, int]:
+    """
+    Bring `collection` from the previous generation to the new one with
+    unordered bulk writes. Changed podcasts are replaced by podcastIndexId
+    with upserts so re-applying a diff is harmless.
+    """
+    counts = {"inserted": 0, "updated": 0, "deleted": 0}
+    operations: List[Any] = []
+    id_field = field_name(MONGODB_SCHEMA, "podcastIndexId")
+
+    def flush():
+        if operations:
+            collection.bulk_write(operations, ordered=False)
+            operations.clear()
+
+    for inserted, row in diff.changed(IMPORT_BATCH_SIZE):
+        operations.append(
+            ReplaceOne(
+                {id_field: row[3]},
+                podcast_document(row, timestamp),
+                upsert=True,
+            )
+        )
+        counts["inserted" if inserted else "updated"] += 1
+        if len(operations) >= IMPORT_BATCH_SIZE:
+            flush()
+    for ids in diff.deleted(IMPORT_BATCH_SIZE):
+        operations.append(DeleteMany({id_field: {"$in": ids}}))
+        counts["deleted"] += len(ids)
+        flush()
+    flush()
+    return counts
+
+
+def create_database(
+    snapshot: str | None = None,
+    previous: str | None = None,
+    telemetry: ImportTelemetry | None = None,
+    previous_etag: str | None = None,
+) -> bool:
+    """
+    Load the PodcastIndex dump into MongoDB.
+
+    In diff mode, when the lookup snapshots of this generation and the
+    previous one (paths relative to DIRECTORY) both have row hashes, and
+    the previous generation, `previous_etag`, is the one the live
+    collection holds, only the podcasts that changed are written to the
+    live collection and False is returned. Otherwise, and always when the
+    live collection is stored in another schema or schema version than
+    this import writes, the whole
+    dump is loaded into the staging collection, leaving the live collection
+    serving until `finish_database_import` swaps them, and True is returned.
+    The full load reads the lookup snapshot, which holds the same columns,
+    so the dump itself is only scanned once, by `write_lookup_snapshot`.
+    """
+    global COUNT_LINES
+    telemetry = telemetry or ImportTelemetry()
+    # Connect to MongoDB
+    with MongoClient(MONGODB_CONNECTION) as client, telemetry.phase("insert") as record:
+        db = client[MONGODB_DATABASE]
 
-        # Fetch the result and store it in a variable
-        COUNT_LINES = c.fetchone()[0]
+        # Access the collection
+        collection = db[MONGODB_COLLECTION]
+        timestamp = datetime.now(timezone.utc)
 
-        # Print the count
+        live_info = db["fileInfo"].find_one(
+            {"importedAt": {"$exists": True}}, sort=[("importedAt", DESCENDING)]
+        )
+        live_schema = (live_info or {}).get("schema", FULL)
+        live_version = (live_info or {}).get("schemaVersion", 1)
+        live_etag = (live_info or {}).get("etag")
+        if (
+            IMPORT_MODE == "diff"
+            and previous
+            and (previous_etag is None or previous_etag != live_etag)
+        ):
+            # An import swapped in after the last published generation, a
+            # diff from that generation would miss the import's changes
+            logger.info(
+                f"MongoDB holds {live_etag}, not the published {previous_etag}, "
+                "full import"
+            )
+        elif (
+            IMPORT_MODE == "diff"
+            and live_schema == MONGODB_SCHEMA
+            and live_version == SCHEMA_VERSION
+            and snapshot
+            and previous
+            and os.path.exists(os.path.join(DIRECTORY, previous))
+            and collection.estimated_document_count()
+        ):
+            with SnapshotDiff(
+                os.path.join(DIRECTORY, snapshot), os.path.join(DIRECTORY, previous)
+            ) as diff:
+                if diff.usable():
+                    counts = apply_snapshot_diff(collection, diff, timestamp)
+                    logger.info(f"Applied changes since {previous}: {counts}")
+                    record.update(mode="diff", rows=sum(counts.values()), **counts)
+                    return False
+            logger.info("No row hashes for the previous generation, full import")
+
+        # Start from an empty staging collection, a previous import may
+        # have been interrupted
+        collection = db[staging_name(MONGODB_COLLECTION)]
+        collection.drop()
+
+        def build_document(row: Sequence[Any]) -> dict[str, Any]:
+            return podcast_document(row, timestamp)
+
+        start = timer()
+        reader = PartitionedReader(
+            os.path.join(DIRECTORY, snapshot) if snapshot else UNTAR_PATH,
+            SNAPSHOT_COLUMNS,
+            partitions=IMPORT_READERS,
+            batch_size=IMPORT_BATCH_SIZE,
+        )
+        with tqdm(desc="Inserting Data", total=reader.estimated_rows, unit="rows") as t:
+            stages = bulk_load(
+                reader,
+                collection,
+                build_document,
+                writers=IMPORT_WRITERS,
+                progress=t.update,
+            )
+        elapsed = timer() - start
+        COUNT_LINES = reader.rows
         logger.info(f"Number of rows: {COUNT_LINES}")
+        record.update(
+            mode="full",
+            rows=COUNT_LINES,
+            stages=[
+                {
+                    "name": stage.name,
+                    "workers": stage.workers,
+                    "rows": stage.rows,
+                    "rows_per_second": round(stage.rows_per_second, 1),
+                }
+                for stage in stages
+            ],
+        )
+        for stage in stages:
+            logger.info(f"Ingest {stage}")
+        logger.info(
+            f"Ingest total   : {COUNT_LINES / elapsed if elapsed else 0:,.0f} rows/s"
+        )
+    return True
 
-        # Execute the query to select the fields from the table
-        c.execute(
-            "SELECT podcastGuid, url, originalUrl, id as podcastIndexId, itunesId FROM podcasts"
+
+def swap_staging_collections(client: MongoClient, staged: bool = True):
+    """
+    Rename the staging collections over the live ones and mark the latest
+    fileInfo record as imported, in MONGODB_SCHEMA and SCHEMA_VERSION. Each
+    rename is atomic, readers see either the old or the new collection,
+    never an empty or unindexed one. The podcasts collection is only swapped when it was
+    `staged`, a diff import updates it in place.
+    """
+    db = client[MONGODB_DATABASE]
+    collection_names = [MONGODB_DUPLICATES]
+    if staged:
+        collection_names.insert(0, MONGODB_COLLECTION)
+    for collection_name in collection_names:
+        db[staging_name(collection_name)].rename(collection_name, dropTarget=True)
+    latest_record = db["fileInfo"].find_one(sort=[("timestamp", DESCENDING)])
+    if latest_record:
+        db["fileInfo"].update_one(
+            {"_id": latest_record["_id"]},
+            {
+                "$set": {
+                    "importedAt": datetime.now(timezone.utc),
+                    "schema": MONGODB_SCHEMA,
+                    "schemaVersion": SCHEMA_VERSION,
+                }
+            },
         )
+    logger.info("🟢Swapped staging collections into place")
 
-        # Connect to MongoDB
-        with MongoClient(MONGODB_CONNECTION) as client:
-            db = client[MONGODB_DATABASE]
 
-            # Access the collection
-            collection = db[MONGODB_COLLECTION]
+def write_duplicate_collection(client: MongoClient, snapshot: str, target: str) -> int:
+    """
+    Build the duplicates collection `target` from a lookup snapshot (path
+    relative to DIRECTORY) with unordered bulk inserts, including the
+    unique domains and podcastIndexIds `process_duplicates` used to add.
+    Returns the number of duplicate groups.
+    """
+    collection = client[MONGODB_DATABASE][target]
+    collection.drop()
+    logger.info(f"Writing {target} from {snapshot}")
+    count = 0
+    batch = []
+    for group in duplicate_groups(os.path.join(DIRECTORY, snapshot)):
+        batch.append(group)
+        if len(batch) == IMPORT_BATCH_SIZE:
+            collection.insert_many(batch, ordered=False)
+            count += len(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+        count += len(batch)
+    # Keyset pagination order used by the /duplicates/ API
+    collection.create_index([("count", DESCENDING), ("_id", 1)])
+    logger.info(f"🟢Wrote {count} duplicate groups")
+    return count
+
+
+def finish_database_import(
+    staged: bool = True,
+    snapshot: str | None = None,
+    telemetry: ImportTelemetry | None = None,
+):
+    """
+    Finish the database import: index the podcasts collection
+    `create_database` wrote to, rebuild the duplicates collection from the
+    generation's lookup snapshot, or from the podcasts collection when
+    there is none, and swap the staging collections in.
+    """
+    telemetry = telemetry or ImportTelemetry()
+    with MongoClient(MONGODB_CONNECTION) as client:
+        collection_name = (
+            staging_name(MONGODB_COLLECTION) if staged else MONGODB_COLLECTION
+        )
+        with telemetry.phase("index_build"):
+            create_indexes(client, collection_name)
+        with telemetry.phase("duplicates") as record:
+            if snapshot:
+                record["rows"] = write_duplicate_collection(
+                    client, snapshot, staging_name(MONGODB_DUPLICATES)
+                )
+            else:
+                create_duplicate_collection(
+                    client, collection_name, staging_name(MONGODB_DUPLICATES)
+                )
+        with telemetry.phase("swap"):
+            swap_staging_collections(client, staged)
+
+
+def record_import_telemetry(file_info: dict[Any, Any], telemetry: ImportTelemetry):
+    """
+    Store the import's telemetry on the generation's fileInfo record, where
+    `/admin` shows it
+    """
+    if not file_info.get("_id"):
+        return
+    with MongoClient(MONGODB_CONNECTION) as client:  # type: MongoClientType
+        client[MONGODB_DATABASE]["fileInfo"].update_one(
+            {"_id": file_info["_id"]},
+            {"$set": {"importTelemetry": telemetry.as_dict()}},
+        )
+
 
-            if COUNT_LINES == collection.count_documents({}):
-                logger.info("Database already created")
-                return
+def write_lookup_snapshot(generation: str) -> str:
+    """
+    Copy the five lookup columns out of the PodcastIndex dump into a small
+    SQLite file which the API can load into memory, with a hash of each row
+    for the next import's diff. Returns the path relative to DIRECTORY.
 
-            # Delete all data in the collection
-            collection.drop()
+    The dump is read once, by one statement, attached read only, immutable
+    (no locking) and memory mapped. Everything after this reads the
+    snapshot, not the dump.
+    """
+    snapshot_dir = os.path.join(DIRECTORY, "snapshots")
+    os.makedirs(snapshot_dir, exist_ok=True)
+    snapshot_path = os.path.join(snapshot_dir, f"{generation}.db")
+    tmp_path = f"{snapshot_path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    logger.info(f"Writing lookup snapshot {snapshot_path}")
+    # URI file names, so the dump is attached read only and immutable
+    conn = sqlite3.connect(f"file:{tmp_path}", uri=True)
+    try:
+        conn.execute(
+            "ATTACH DATABASE ? AS dump", (f"file:{UNTAR_PATH}?mode=ro&immutable=1",)
+        )
+        conn.execute(f"PRAGMA dump.mmap_size = {MMAP_SIZE}")
+        register_functions(conn)
+        conn.execute(
+            f"CREATE TABLE podcasts AS SELECT {SNAPSHOT_COLUMNS}, "
+            f"row_hash({SNAPSHOT_COLUMNS}) AS hash FROM dump.podcasts"
+        )
+        # Used to diff the next generation against this one
+        conn.execute("CREATE INDEX podcasts_id ON podcasts (id)")
+        conn.execute(GUID_INDEX)
+        conn.commit()
+        conn.execute("DETACH DATABASE dump")
+    finally:
+        conn.close()
+    os.replace(tmp_path, snapshot_path)
+    return os.path.relpath(snapshot_path, DIRECTORY)
+
+
+def snapshot_rows(snapshot: str) -> int:
+    """
+    Rows in a lookup snapshot, which are numbered from 1 as it is written
+    """
+    conn = sqlite3.connect(
+        f"file:{os.path.join(DIRECTORY, snapshot)}?mode=ro", uri=True
+    )
+    try:
+        return conn.execute("SELECT MAX(rowid) FROM podcasts").fetchone()[0] or 0
+    finally:
+        conn.close()
 
-            # Chunk size for batch insert
-            chunk_size = 1000
 
-            # Read the CSV file and insert data in chunks
-            data = []
-            timestamp = datetime.now(timezone.utc)
+def write_lookup_index(generation: str, snapshot: str, timestamp: datetime) -> str:
+    """
+    Build the memory mapped lookup file the API workers share from the
+    lookup snapshot. Returns the path relative to DIRECTORY.
+    """
+    index_dir = os.path.join(DIRECTORY, "indexes")
+    os.makedirs(index_dir, exist_ok=True)
+    index_path = os.path.join(index_dir, f"{generation}.idx")
+    logger.info(f"Writing lookup index {index_path}")
+    write_index(os.path.join(DIRECTORY, snapshot), index_path, generation, timestamp)
+    return os.path.relpath(index_path, DIRECTORY)
 
-            for row in tqdm(c, desc="Inserting Data", total=COUNT_LINES, unit="rows"):
-                data_item = {
-                    "podcastGuid": row[0],
-                    "url": row[1],
-                    "originalUrl": row[2],
-                    "podcastIndexId": row[3],
-                    "itunesId": row[4],
-                    "timestamp": timestamp,
-                }
 
-                data.append(data_item)
+def write_bloom_filters(generation: str, snapshot: str) -> str:
+    """
+    Build the Bloom filters of the lookup keys from the lookup snapshot,
+    which holds every podcast of the generation even when the import only
+    applied the changes. Returns the path relative to DIRECTORY.
+    """
+    bloom_dir = os.path.join(DIRECTORY, "bloom")
+    os.makedirs(bloom_dir, exist_ok=True)
+    bloom_path = os.path.join(bloom_dir, f"{generation}.bloom")
+    logger.info(f"Writing Bloom filters {bloom_path}")
+    stats = write_filters(
+        os.path.join(DIRECTORY, snapshot),
+        bloom_path,
+        generation,
+        BLOOM_FALSE_POSITIVE_RATE,
+    )
+    for field, field_stats in stats.items():
+        logger.info(f"Bloom filter {field}: {field_stats}")
+    return os.path.relpath(bloom_path, DIRECTORY)
 
-                # Insert data in chunks
-                if len(data) == chunk_size:
-                    collection = db[MONGODB_COLLECTION]
-                    collection.insert_many(data)
-                    data = []  # Clear the data list after inserting a chunk
 
-            # Insert remaining data (less than chunk size) if any
-            if data:
-                collection = db[MONGODB_COLLECTION]
-                collection.insert_many(data)
+def write_duplicates_report(
+    generation: str, groups: Iterable[Dict[str, Any]] | None = None
+) -> str:
+    """
+    Write the full duplicates report, exactly as `/duplicates/` returns it,
+    as JSON plus gzip and (when brotli is installed) brotli copies so the
+    API can serve it straight from disk. The duplicate `groups` are read
+    from the duplicates collection unless given, already in report order.
+    Returns the path of the JSON file relative to DIRECTORY, the compressed
+    copies add `.gz` and `.br`.
+    """
+    report_dir = os.path.join(DIRECTORY, "duplicates")
+    os.makedirs(report_dir, exist_ok=True)
+    report_path = os.path.join(report_dir, f"{generation}.json")
+    paths = [report_path, f"{report_path}.gz"]
+    compressor = brotli.Compressor(quality=9) if brotli else None
+    if compressor:
+        paths.append(f"{report_path}.br")
+    logger.info(f"Writing duplicates report {report_path}")
+    with ExitStack() as stack:
+        if groups is None:
+            client = stack.enter_context(MongoClient(MONGODB_CONNECTION))
+            groups = (
+                client[MONGODB_DATABASE][MONGODB_DUPLICATES]
+                .find({})
+                .sort([("count", DESCENDING), ("_id", 1)])
+                .batch_size(1000)
+            )
+        plain = stack.enter_context(open(f"{paths[0]}.tmp", "wb"))
+        gz = stack.enter_context(gzip.open(f"{paths[1]}.tmp", "wb", compresslevel=9))
+        br = stack.enter_context(open(f"{paths[2]}.tmp", "wb")) if compressor else None
+
+        def write(data: bytes):
+            plain.write(data)
+            gz.write(data)
+            if br:
+                br.write(compressor.process(data))
+
+        write(b"[")
+        for count, doc in enumerate(groups):
+            doc["podcastGuid"] = doc.pop("_id")
+            separator = b"," if count else b""
+            write(separator + json.dumps(doc, default=str).encode())
+        write(b"]")
+        if br:
+            br.write(compressor.finish())
+    for path in paths:
+        os.replace(f"{path}.tmp", path)
+    return os.path.relpath(report_path, DIRECTORY)
+
+
+def prune_generation_files():
+    """
+    Remove all but the newest KEEP_GENERATIONS of each published file
+    """
+    for sub_directory, suffix in (
+        ("snapshots", ".db"),
+        ("indexes", ".idx"),
+        ("bloom", ".bloom"),
+        ("duplicates", ".json"),
+        ("duplicates", ".json.gz"),
+        ("duplicates", ".json.br"),
+    ):
+        path = os.path.join(DIRECTORY, sub_directory)
+        if not os.path.exists(path):
+            continue
+        files = sorted(
+            (
+                os.path.join(path, name)
+                for name in os.listdir(path)
+                if name.endswith(suffix)
+            ),
+            key=os.path.getmtime,
+            reverse=True,
+        )
+        for old_file in files[KEEP_GENERATIONS:]:
+            logger.info(f"Removing old generation file {old_file}")
+            os.remove(old_file)
 
 
-def finish_database_import():
+def publish_generation(
+    generation: str, file_info: dict[Any, Any], artifacts: dict[str, str]
+):
     """
-    Finish the database import
+    Tell the API workers a new generation is ready. `artifacts` maps each
+    published file ("sqlite", "index", "bloom", "duplicates") to its path
+    relative to DIRECTORY.
     """
-    with MongoClient(MONGODB_CONNECTION) as client:
-        create_indexes(client)
-        create_duplicate_collection(client)
+    timestamp = file_info.get("timestamp") or datetime.now(timezone.utc)
+    write_current_generation(
+        DIRECTORY,
+        {
+            "generation": generation,
+            "etag": file_info.get("etag"),
+            "timestamp": timestamp.isoformat(),
+            **artifacts,
+        },
+    )
+    logger.info(f"Published generation {generation}")
+    prune_generation_files()
 
 
 def is_running_in_docker() -> bool:
@@ -420,7 +845,9 @@ def setup_paths():
 
     if is_running_in_docker():
         MONGODB_DATABASE = "podcastGuidUrl"
-        MONGODB_CONNECTION = "mongodb://mongodb-gs:27017/"
+        MONGODB_CONNECTION = os.getenv(
+            "MONGODB_CONNECTION", "mongodb://mongodb-gs:27017/"
+        )
         DIRECTORY = os.path.join("data/", "podcastindex")
         DOWNLOAD_FILENAME = "podcastindex_feeds.db.tgz"
         DOWNLOAD_PATH = os.path.join(DIRECTORY, DOWNLOAD_FILENAME)
@@ -448,23 +875,69 @@ async def startup_import():
 
     logger.info(f"MongoDB connection: {MONGODB_CONNECTION}")
 
-    if check_new_podcastindex_database():
-        fetch_new_podcastindex_database()
+    telemetry = ImportTelemetry(trace_memory=IMPORT_TRACEMALLOC)
+    with telemetry.phase("download") as record:
+        if check_new_podcastindex_database():
+            headers = fetch_new_podcastindex_database()
+            if headers is None:
+                logger.error("Download failed, nothing imported")
+                telemetry.finish()
+                return
+            record["bytes"] = int(headers.get("Content-Length") or 0) or None
+            record["streamed"] = DOWNLOAD_MODE == "stream"
 
     logger.info(
         f"Finished downloading database                    : {fmt_time(timer()-start)}"
     )
-    untar_file()
+    with telemetry.phase("extract") as record:
+        untar_file()
+        record["bytes"] = os.path.getsize(UNTAR_PATH)
     logger.info(
         f"Finished untar                                   : {fmt_time(timer()-start)}"
     )
-    create_database()
+    file_info = check_database_fileinfo() or {}
+    generation_timestamp = file_info.get("timestamp", datetime.now(timezone.utc))
+    generation = generation_id(file_info.get("etag"), generation_timestamp)
+    previous = read_current_generation(DIRECTORY) or {}
+    with telemetry.phase("read") as record:
+        snapshot = write_lookup_snapshot(generation)
+        record["rows"] = snapshot_rows(snapshot)
+        record["bytes"] = os.path.getsize(os.path.join(DIRECTORY, snapshot))
+    staged = create_database(
+        snapshot, previous.get("sqlite"), telemetry, previous.get("etag")
+    )
+    with telemetry.phase("lookup_index") as record:
+        index = write_lookup_index(generation, snapshot, generation_timestamp)
+        record["bytes"] = os.path.getsize(os.path.join(DIRECTORY, index))
+    with telemetry.phase("bloom_filters") as record:
+        bloom = write_bloom_filters(generation, snapshot)
+        record["bytes"] = os.path.getsize(os.path.join(DIRECTORY, bloom))
     # Remove the untarred file
     os.remove(UNTAR_PATH)
     logger.info(
         f"Finished database creation                       : {fmt_time(timer()-start)}"
     )
-    finish_database_import()
+    finish_database_import(staged, snapshot, telemetry)
+    with telemetry.phase("duplicates_report") as record:
+        duplicates_report = write_duplicates_report(generation)
+        record["bytes"] = os.path.getsize(os.path.join(DIRECTORY, duplicates_report))
+    publish_generation(
+        generation,
+        file_info,
+        {
+            "sqlite": snapshot,
+            "index": index,
+            "bloom": bloom,
+            "duplicates": duplicates_report,
+        },
+    )
+    telemetry.finish()
+    record_import_telemetry(file_info, telemetry)
+    for phase in telemetry.phases:
+        logger.info(
+            f"{phase['name']:<18}: {fmt_time(phase['seconds'])} "
+            f"rows {phase['rows']} bytes {phase['bytes']}"
+        )
     logger.info(
         f"Finished database finalisation                   : {fmt_time(timer()-start)}"
     )
@@ -0,0 +1,160 @@
+import json
+import os
+import re
+from hashlib import md5
+from typing import Callable, Dict
+
+import httpx
+
+from guid_slurp.archive import CHUNK_SIZE
+
+# An etag that is the MD5 of the body, as S3 style stores give single part
+# uploads. Multipart etags ("<md5>-<parts>") are not checked.
+MD5_ETAG = re.compile(r'^(?:W/)?"?([0-9a-fA-F]{32})"?$')
+CONTENT_RANGE = re.compile(r"^bytes (\d+)-(\d+)/(\d+|\*)$")
+
+
+class DownloadError(Exception):
+    pass
+
+
+def _part_paths(path: str) -> tuple[str, str]:
+    return f"{path}.part", f"{path}.part.json"
+
+
+def _read_part_info(info_path: str) -> Dict[str, str]:
+    try:
+        with open(info_path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _remove(*paths: str) -> None:
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def download(
+    url: str,
+    path: str,
+    consumer: Callable[[bytes], object] | None = None,
+    progress: Callable[[int], object] | None = None,
+    client: httpx.Client | None = None,
+) -> Dict[str, str | None]:
+    """
+    Download `url` to `path`, resuming an earlier partial download when the
+    server still has the same file.
+
+    Bytes are written to `<path>.part`, with the response's etag kept in
+    `<path>.part.json`. A later call asks only for the missing bytes with
+    `Range` and `If-Range`, so a changed file is sent again in full. Once
+    complete the size is checked against the server's, the MD5 against the
+    etag when the etag is one, and the file renamed to `path`. A failed
+    check removes the partial file and raises DownloadError.
+
+    `consumer` receives every byte of the file in order, including bytes
+    already on disk from an earlier attempt, so a streaming extractor sees
+    the whole archive. Returns the etag, Last-Modified and Content-Length
+    of the complete file.
+    """
+    part_path, info_path = _part_paths(path)
+    owns_client = client is None
+    client = client or httpx.Client(follow_redirects=True)
+    try:
+        for _ in range(2):
+            part_info = _read_part_info(info_path)
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            headers = {}
+            if offset and part_info.get("etag"):
+                headers = {
+                    "Range": f"bytes={offset}-",
+                    "If-Range": part_info["etag"],
+                }
+            with client.stream("GET", url, headers=headers) as response:
+                if response.status_code == 416 or (
+                    response.status_code == 206 and _range_start(response) != offset
+                ):
+                    # The partial file does not line up with the server's
+                    _remove(part_path, info_path)
+                    continue
+                response.raise_for_status()
+                if response.status_code == 206:
+                    total = _range_total(response)
+                else:
+                    offset = 0
+                    total = response.headers.get("Content-Length")
+                    part_info = {
+                        "etag": response.headers.get("etag"),
+                        "Last-Modified": response.headers.get("Last-Modified"),
+                        "Content-Length": total,
+                    }
+                    with open(info_path, "w") as f:
+                        json.dump(part_info, f)
+                return _write(
+                    response, path, offset, part_info, total, consumer, progress
+                )
+        raise DownloadError(f"Could not resume the download of {url}")
+    finally:
+        if owns_client:
+            client.close()
+
+
+def _range_start(response: httpx.Response) -> int | None:
+    match = CONTENT_RANGE.match(response.headers.get("Content-Range", ""))
+    return int(match.group(1)) if match else None
+
+
+def _range_total(response: httpx.Response) -> str | None:
+    match = CONTENT_RANGE.match(response.headers.get("Content-Range", ""))
+    return match.group(3) if match and match.group(3) != "*" else None
+
+
+def _write(
+    response: httpx.Response,
+    path: str,
+    offset: int,
+    part_info: Dict[str, str],
+    total: str | None,
+    consumer: Callable[[bytes], object] | None,
+    progress: Callable[[int], object] | None,
+) -> Dict[str, str | None]:
+    part_path, info_path = _part_paths(path)
+    digest = md5()
+    with open(part_path, "r+b" if offset else "wb", buffering=CHUNK_SIZE) as f:
+        # Replay what an earlier attempt already downloaded
+        while f.tell() < offset and (
+            chunk := f.read(min(CHUNK_SIZE, offset - f.tell()))
+        ):
+            digest.update(chunk)
+            if consumer:
+                consumer(chunk)
+            if progress:
+                progress(len(chunk))
+        f.seek(offset)
+        f.truncate()
+        for chunk in response.iter_bytes(chunk_size=CHUNK_SIZE):
+            f.write(chunk)
+            digest.update(chunk)
+            if consumer:
+                consumer(chunk)
+            if progress:
+                progress(len(chunk))
+        size = f.tell()
+
+    if total is not None and size != int(total):
+        _remove(part_path, info_path)
+        raise DownloadError(f"Downloaded {size} bytes, expected {total}")
+    etag = part_info.get("etag")
+    match = MD5_ETAG.match(etag or "")
+    if match and match.group(1).lower() != digest.hexdigest():
+        _remove(part_path, info_path)
+        raise DownloadError(f"MD5 {digest.hexdigest()} does not match etag {etag}")
+    os.replace(part_path, path)
+    _remove(info_path)
+    return {
+        "etag": etag,
+        "Last-Modified": part_info.get("Last-Modified"),
+        "Content-Length": str(size),
+    }
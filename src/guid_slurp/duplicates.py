@@ -0,0 +1,58 @@
+import sqlite3
+from itertools import groupby
+from operator import itemgetter
+from typing import Any, Dict, Iterator
+from urllib.parse import urlparse
+
+# Index on the lookup snapshot which hands back each podcastGuid's rows
+# together, so duplicate groups are found in one streaming pass without
+# holding every GUID in memory
+GUID_INDEX = "CREATE INDEX podcasts_guid ON podcasts (podcastGuid, id)"
+
+
+def duplicate_group(guid: str | None, rows: list) -> Dict[str, Any]:
+    """
+    The duplicateGuidUrl document for the `(podcastGuid, id, url)` rows
+    sharing one GUID: the group itself, the distinct domains its feeds are
+    on and the distinct PodcastIndex ids.
+    """
+    domains = dict.fromkeys(urlparse(url or "").netloc for _, _, url in rows)
+    podcast_index_ids = dict.fromkeys(
+        podcast_index_id for _, podcast_index_id, _ in rows
+    )
+    return {
+        "_id": guid,
+        "count": len(rows),
+        "duplicates": [
+            {"url": url, "podcastIndexId": podcast_index_id}
+            for _, podcast_index_id, url in rows
+        ],
+        "uniqueDomainCount": len(domains),
+        "uniqueDomains": list(domains),
+        "podcastIndexId": list(podcast_index_ids),
+    }
+
+
+def duplicate_groups(
+    snapshot_path: str, batch_size: int = 10000
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield a document for every podcastGuid shared by more than one podcast
+    in a lookup snapshot, reading it once in GUID order.
+    """
+    conn = sqlite3.connect(f"file:{snapshot_path}?mode=ro", uri=True)
+    try:
+        cursor = conn.execute(
+            "SELECT podcastGuid, id, url FROM podcasts ORDER BY podcastGuid, id"
+        )
+
+        def rows():
+            while batch := cursor.fetchmany(batch_size):
+                yield from batch
+
+        for guid, group in groupby(rows(), key=itemgetter(0)):
+            group = list(group)
+            if len(group) > 1:
+                yield duplicate_group(guid, group)
+    finally:
+        conn.close()
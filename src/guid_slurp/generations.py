@@ -0,0 +1,47 @@
+import json
+import os
+import re
+from datetime import datetime
+from typing import Any
+
+# database_sync writes the artifacts for each import into its DIRECTORY and
+# then publishes them by atomically replacing this file. API workers poll it
+# and switch to the new generation when its contents change.
+CURRENT_FILENAME = "current.json"
+
+
+def generation_id(etag: str | None, timestamp: datetime) -> str:
+    """
+    Build a file name safe identifier for a dataset generation from the
+    PodcastIndex etag, falling back to the import timestamp.
+    """
+    if etag:
+        cleaned = re.sub(r"[^A-Za-z0-9_-]", "", etag)
+        if cleaned:
+            return cleaned
+    return timestamp.strftime("%Y%m%d%H%M%S")
+
+
+def write_current_generation(directory: str, generation: dict[str, Any]) -> None:
+    """
+    Publish a generation. The pointer file is replaced atomically so readers
+    never see a half written file.
+    """
+    path = os.path.join(directory, CURRENT_FILENAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(generation, f, default=str)
+    os.replace(tmp_path, path)
+
+
+def read_current_generation(directory: str) -> dict[str, Any] | None:
+    """
+    Returns the currently published generation or None if nothing has
+    been published yet.
+    """
+    path = os.path.join(directory, CURRENT_FILENAME)
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
@@ -0,0 +1,152 @@
+import threading
+from queue import Empty, Full, Queue
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterable, List, Sequence
+
+from pymongo.collection import Collection
+
+# How long a blocked queue operation waits before checking whether another
+# stage has failed
+POLL_SECONDS = 0.1
+
+
+class StageStats:
+    """
+    Rows handled by one pipeline stage and the time its workers spent busy,
+    excluding time spent waiting on the other stages.
+    """
+
+    def __init__(self, name: str, workers: int = 1):
+        self.name = name
+        self.workers = workers
+        self.rows = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, rows: int, seconds: float) -> None:
+        with self._lock:
+            self.rows += rows
+            self.seconds += seconds
+
+    @property
+    def rows_per_second(self) -> float:
+        if not self.seconds:
+            return 0.0
+        return self.rows * self.workers / self.seconds
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name:<8}: {self.rows:>10,} rows "
+            f"{self.rows_per_second:>12,.0f} rows/s ({self.workers} workers)"
+        )
+
+
+class _Stopped(Exception):
+    pass
+
+
+def _put(queue: Queue, item: Any, stop: threading.Event) -> None:
+    while True:
+        try:
+            queue.put(item, timeout=POLL_SECONDS)
+            return
+        except Full:
+            if stop.is_set():
+                raise _Stopped
+
+
+def _get(queue: Queue, stop: threading.Event) -> Any:
+    while True:
+        try:
+            return queue.get(timeout=POLL_SECONDS)
+        except Empty:
+            if stop.is_set():
+                raise _Stopped
+
+
+def bulk_load(
+    batches: Iterable[Sequence[Sequence[Any]]],
+    collection: Collection,
+    build_document: Callable[[Sequence[Any]], Dict[str, Any]],
+    writers: int = 4,
+    progress: Callable[[int], Any] | None = None,
+) -> List[StageStats]:
+    """
+    Copy the row `batches` into `collection` through three stages joined
+    by bounded queues: one thread reading the batches, for example from a
+    PartitionedReader, one building the documents and `writers` threads
+    each running unordered `insert_many` calls, so reading, building and
+    the round trips to MongoDB overlap.
+
+    `progress` is called with the number of rows after each insert. The
+    first error in any stage stops the pipeline and is raised. Returns the
+    stats of the read, build and write stages.
+    """
+    read_stats = StageStats("read")
+    build_stats = StageStats("build")
+    write_stats = StageStats("write", writers)
+    rows_queue: Queue = Queue(maxsize=writers * 2)
+    documents_queue: Queue = Queue(maxsize=writers * 2)
+    stop = threading.Event()
+    errors: List[BaseException] = []
+
+    def run(stage: Callable[[], None]) -> Callable[[], None]:
+        def target():
+            try:
+                stage()
+            except _Stopped:
+                pass
+            except BaseException as ex:
+                errors.append(ex)
+                stop.set()
+
+        return target
+
+    def read():
+        iterator = iter(batches)
+        try:
+            while True:
+                start = perf_counter()
+                rows = next(iterator, None)
+                if rows is None:
+                    break
+                read_stats.add(len(rows), perf_counter() - start)
+                _put(rows_queue, rows, stop)
+        finally:
+            # Stop a reader that still has rows, e.g. after a failed insert
+            close = getattr(iterator, "close", None)
+            if close:
+                close()
+        _put(rows_queue, None, stop)
+
+    def build():
+        while (rows := _get(rows_queue, stop)) is not None:
+            start = perf_counter()
+            documents = [build_document(row) for row in rows]
+            build_stats.add(len(documents), perf_counter() - start)
+            _put(documents_queue, documents, stop)
+        for _ in range(writers):
+            _put(documents_queue, None, stop)
+
+    def write():
+        while (documents := _get(documents_queue, stop)) is not None:
+            start = perf_counter()
+            collection.insert_many(documents, ordered=False)
+            write_stats.add(len(documents), perf_counter() - start)
+            if progress:
+                progress(len(documents))
+
+    threads = [
+        threading.Thread(target=run(read), name="ingest-read"),
+        threading.Thread(target=run(build), name="ingest-build"),
+    ] + [
+        threading.Thread(target=run(write), name=f"ingest-write-{number}")
+        for number in range(writers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return [read_stats, build_stats, write_stats]
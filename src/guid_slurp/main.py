@@ -1,24 +1,55 @@
+import asyncio
+import base64
+import json
 import logging
 import os
 import sys
+from contextlib import asynccontextmanager
 from datetime import UTC, datetime, timedelta
+from email.utils import parsedate_to_datetime
+from hashlib import blake2b
 from timeit import default_timer as timer
+from typing import Any, AsyncIterator, List, Literal
 
 from fastapi import BackgroundTasks, FastAPI, HTTPException, Path, Query, Request
 from fastapi import __version__ as fastapi_version
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import UUID5, HttpUrl
-from pymongo import DESCENDING, MongoClient
-from pymongo.mongo_client import MongoClient as MongoClientType
+from fastapi.responses import (
+    FileResponse,
+    JSONResponse,
+    Response,
+    StreamingResponse,
+)
+from motor.motor_asyncio import AsyncIOMotorClient
+from pydantic import UUID5, BaseModel, Field, HttpUrl, TypeAdapter, ValidationError
+from pymongo import DESCENDING
 from single_source import get_version
 
+from guid_slurp.bloom import BloomFilters
+from guid_slurp.cache import MISSING, ResponseCache
 from guid_slurp.database_sync import (
+    DIRECTORY,
     MONGODB_COLLECTION,
     MONGODB_CONNECTION,
     MONGODB_DATABASE,
     MONGODB_DUPLICATES,
 )
+from guid_slurp.generations import read_current_generation
+from guid_slurp import metrics, timing
+from guid_slurp.memory_index import MemoryIndex
+from guid_slurp.mmap_index import MmapIndex
 from guid_slurp.mongo import check_connection
+from guid_slurp.schema import (
+    FULL,
+    PROJECTIONS,
+    SCHEMA_VERSION,
+    lookup_filter,
+    public_document,
+    url_filter,
+)
+from guid_slurp.singleflight import SingleFlight
+from guid_slurp.urls import canonical_url, exact_first, url_keys
 
 logging.basicConfig(
     level=logging.INFO,
@@ -28,11 +59,140 @@ logging.basicConfig(
 logging.getLogger("uvicorn.error").setLevel(logging.CRITICAL)
 
 EXTERNAL_API_DOMAIN = os.getenv("EXTERNAL_API_DOMAIN", "")
+# Size of the shared connection pool each worker keeps open to MongoDB
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "200"))
+# Largest number of identifiers of one type accepted by the batch resolver
+BATCH_MAX_ITEMS = 1000
+# Largest page of duplicate groups and the cursor batch used when streaming
+DUPLICATES_MAX_PAGE = 1000
+DUPLICATES_BATCH_SIZE = 500
+# Where lookups are answered from: "mongo", "memory" (process memory loaded
+# from the snapshot database_sync publishes for each generation) or "mmap"
+# (the lookup file database_sync publishes, shared by all workers)
+LOOKUP_BACKEND = os.getenv("LOOKUP_BACKEND", "mongo")
+# How often to check whether database_sync has published a new generation
+GENERATION_POLL_SECONDS = int(os.getenv("GENERATION_POLL_SECONDS", "60"))
+# A MongoDB lookup that finds nothing re-reads the generation, at most this
+# often, in case a swap changed the storage schema since the last poll
+SCHEMA_RECHECK_SECONDS = float(os.getenv("SCHEMA_RECHECK_SECONDS", "1"))
+# Resolver response cache: size and how long found / not found results live
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "50000"))
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", "3600"))
+CACHE_NEGATIVE_TTL_SECONDS = int(os.getenv("CACHE_NEGATIVE_TTL_SECONDS", "300"))
+# Every SLOW_LOG_SECONDS each worker logs its SLOW_LOG_TOP slowest requests
+# of that interval with their Server-Timing spans. 0 turns the log off
+SLOW_LOG_SECONDS = float(os.getenv("SLOW_LOG_SECONDS", "0"))
+SLOW_LOG_TOP = int(os.getenv("SLOW_LOG_TOP", "5"))
 
 __version__ = get_version(__name__, "", default_return="0.0.1")
 if __version__ is None:
     __version__ = "0.0.1"  # or some other default version
 
+mongo_client: AsyncIOMotorClient | None = None
+lookup_index: MemoryIndex | MmapIndex | None = None
+dataset_generation: str | None = None
+dataset_last_modified: datetime | None = None
+dataset_generation_checked: float | None = None
+# Storage schema and schema version of the guidUrl collection being
+# served, from its fileInfo
+dataset_schema: str = FULL
+dataset_schema_version: int = SCHEMA_VERSION
+published_generation: dict | None = None
+published_generation_checked: float | None = None
+# Bloom filters of the published generation, and the generation whose
+# filters failed to load so they are not retried on every request
+bloom_filters: BloomFilters | None = None
+bloom_filters_failed: str | None = None
+# MongoDB lookups checked against the Bloom filters by result, this worker
+bloom_lookups = {"absent": 0, "present": 0, "false_positive": 0}
+response_cache = ResponseCache(
+    CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS, CACHE_NEGATIVE_TTL_SECONDS
+)
+in_flight = SingleFlight()
+# Re-reads of the generation after a MongoDB miss, see `schema_changed`
+schema_checks = SingleFlight()
+slow_request_log = (
+    timing.SlowRequestLog(SLOW_LOG_TOP, SLOW_LOG_SECONDS) if SLOW_LOG_SECONDS else None
+)
+
+
+def get_mongo_client() -> AsyncIOMotorClient:
+    """
+    Returns the async MongoDB client shared by every route in this worker.
+    The client owns a connection pool so lookups reuse open sockets instead
+    of connecting on every request.
+    """
+    global mongo_client
+    if mongo_client is None:
+        mongo_client = AsyncIOMotorClient(
+            MONGODB_CONNECTION, maxPoolSize=MONGODB_MAX_POOL_SIZE
+        )
+    return mongo_client
+
+
+async def watch_lookup_index() -> None:
+    """
+    Load the latest published generation and keep swapping in new ones as
+    database_sync publishes them. The new index is loaded in a thread and
+    replaces the old one with a single assignment, so requests always see
+    one complete generation. Lookups never await, so a replaced mmap index
+    can be closed straight away.
+    """
+    global lookup_index
+    loader = MmapIndex if LOOKUP_BACKEND == "mmap" else MemoryIndex
+    while True:
+        current = read_current_generation(DIRECTORY)
+        if current and (
+            lookup_index is None or current["generation"] != lookup_index.generation
+        ):
+            try:
+                start = timer()
+                new_index = await asyncio.to_thread(
+                    loader.from_generation, DIRECTORY, current
+                )
+                old_index, lookup_index = lookup_index, new_index
+                if isinstance(old_index, MmapIndex):
+                    old_index.close()
+                logging.info(
+                    f"Loaded generation {new_index.generation} ({LOOKUP_BACKEND}): "
+                    f"{len(new_index)} rows in {timer() - start:.1f}s"
+                )
+            except Exception as ex:
+                logging.error(f"Failed to load generation {current}: {ex}")
+        await asyncio.sleep(GENERATION_POLL_SECONDS)
+
+
+def is_running_in_docker() -> bool:
+    return os.path.exists("/.dockerenv")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Startup and shutdown code"""
+    global MONGODB_CONNECTION, DIRECTORY, mongo_client
+    logging.info(f"Logger Starting Guid Slurp API {__name__}")
+    logging.info(f"MongoDB connection: {MONGODB_CONNECTION}")
+    if is_running_in_docker():
+        logging.info("Running in Docker")
+        MONGODB_CONNECTION = os.getenv(
+            "MONGODB_CONNECTION", "mongodb://mongodb-gs:27017/"
+        )
+        DIRECTORY = os.path.join("data/", "podcastindex")
+    logging.info(f"MongoDB connection check: {check_connection(MONGODB_CONNECTION)}")
+    logging.info(f"MongoDB connection: {MONGODB_CONNECTION}")
+    logging.info(f"Lookup backend: {LOOKUP_BACKEND}")
+    get_mongo_client()
+    watcher = None
+    if LOOKUP_BACKEND in ("memory", "mmap"):
+        watcher = asyncio.create_task(watch_lookup_index())
+    yield
+    if watcher is not None:
+        watcher.cancel()
+    if mongo_client is not None:
+        mongo_client.close()
+        mongo_client = None
+
+
 app = FastAPI(
     title="Guid Slurp API",
     description=f"""API for resolving Podcasting 2.0 GUIDs and RSS feed URLs.\n
@@ -40,6 +200,7 @@ app = FastAPI(
     """,
     version=__version__,
     debug=False,
+    lifespan=lifespan,
     # terms_of_service="http://example.com/terms/",
     # contact={
     #     "name": "Brian of London",
@@ -58,9 +219,15 @@ app.add_middleware(
 )
 
 
-def get_cache_headers(max_age: int = 3600, reason: str = "") -> dict:
+def get_cache_headers(
+    max_age: int = 3600,
+    reason: str = "",
+    last_modified: datetime | None = None,
+    etag: str | None = None,
+) -> dict:
     """
-    Returns the cache headers for Cloudflare
+    Returns the cache headers for Cloudflare. `last_modified` should be when
+    the data being served was imported.
     """
     headers = {}
     headers[
@@ -71,79 +238,440 @@ def get_cache_headers(max_age: int = 3600, reason: str = "") -> dict:
     )
     headers["Pragma"] = "cache"
     headers["X-Reason"] = reason if reason else ""
-    headers["Last-Modified"] = datetime.now(tz=UTC).strftime(
-        "%a, %d %b %Y %H:%M:%S GMT"
-    )
+    if last_modified is not None:
+        if last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=UTC)
+        headers["Last-Modified"] = last_modified.astimezone(UTC).strftime(
+            "%a, %d %b %Y %H:%M:%S GMT"
+        )
+    if etag:
+        headers["ETag"] = etag
     return headers
 
 
+def make_etag(generation: str, field: str, value: Any) -> str:
+    """
+    Strong ETag for one lookup, it only changes when a new generation of
+    the dataset is imported.
+    """
+    digest = blake2b(f"{generation}|{field}|{value}".encode(), digest_size=16)
+    return f'"{digest.hexdigest()}"'
+
+
+def is_not_modified(
+    request: Request, etag: str, last_modified: datetime | None
+) -> bool:
+    """
+    Check the request's conditional headers against a representation that
+    exists, `If-None-Match: *` matches any. If-None-Match wins over
+    If-Modified-Since when both are sent.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=UTC)
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=UTC)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
 @app.middleware("http")
 async def add_process_time_header(request: Request, call_next):
     start_time = timer()
+    request_timing = timing.start_request()
     headers = request.headers
-    response = await call_next(request)
-    process_time = timer() - start_time
+    route = metrics.route_template(request.scope)
+    in_flight_requests = metrics.IN_FLIGHT.labels(route)
+    in_flight_requests.inc()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        process_time = timer() - start_time
+        in_flight_requests.dec()
+        metrics.REQUEST_SECONDS.labels(request.method, route).observe(process_time)
+        metrics.RESPONSES.labels(request.method, route, str(status)).inc()
     response.headers["X-Process-Time"] = str(process_time)
-    if not request.url.path == "/info/":
+    server_timing = request_timing.header(process_time * 1000)
+    response.headers["Server-Timing"] = server_timing
+    response.headers["Timing-Allow-Origin"] = "*"
+    if slow_request_log is not None:
+        slow_request_log.record(
+            process_time * 1000,
+            f"{request.method} {request.url.path} query: {request.url.query} "
+            f"status: {status} Server-Timing: {server_timing}",
+        )
+    if request.url.path not in ("/info/", "/metrics"):
         logging.info(
             f"{headers.get('cf-ipcountry')} IP: {headers.get('cf-connecting-ip')} "
             f"Referer: {headers.get('referer')} "
             f"Request: {request.url.path} query: {request.url.query} "
             f"time: {process_time*1000:.3f}ms"
         )
-    # new_headers = get_cache_headers(max_age=3600, reason="API")
-    # # combine response.headers with the new_headers
-    # response.headers.update(new_headers)
-
     logging.debug(f"Process time: {process_time}")
     return response
 
 
-def is_running_in_docker() -> bool:
-    return os.path.exists("/.dockerenv")
-
-
-@app.on_event("startup")
-async def startup_event() -> None:
-    """Startup code"""
-    global MONGODB_CONNECTION
-    logging.info(f"Logger Starting Guid Slurp API {__name__}")
-    logging.info(f"MongoDB connection: {MONGODB_CONNECTION}")
-    if is_running_in_docker():
-        logging.info("Running in Docker")
-        MONGODB_CONNECTION = "mongodb://mongodb-gs:27017/"
-    logging.info(f"MongoDB connection check: {check_connection(MONGODB_CONNECTION)}")
-    logging.info(f"MongoDB connection: {MONGODB_CONNECTION}")
-
-
 @app.get("/", tags=["resolver"])
-async def root(guid: UUID5 | str = "", url: HttpUrl | str = ""):
+async def root(request: Request, guid: UUID5 | str = "", url: HttpUrl | str = ""):
     """
     Resolve a GUID or URL to a RSS feed URL. Will always
     resolve a GUID first if both are passed.
     """
     if guid:
-        return await resolve_guid(guid)
+        return await resolve_guid(request, guid)
     if url:
-        return await resolve_url(url)
+        return await resolve_url(request, url)
 
     raise HTTPException(status_code=404, detail="Item not found")
 
 
-def check_database_fileinfo() -> dict | None:
-    with MongoClient(MONGODB_CONNECTION) as client:  # type: MongoClientType
-        db = client[MONGODB_DATABASE]
-        latest_record = db["fileInfo"].find_one(sort=[("timestamp", DESCENDING)])
+async def check_database_fileinfo() -> dict | None:
+    db = get_mongo_client()[MONGODB_DATABASE]
+    latest_record = await db["fileInfo"].find_one(sort=[("timestamp", DESCENDING)])
     return latest_record
 
 
+async def check_imported_fileinfo() -> dict | None:
+    """
+    The fileInfo record of the generation being served: the latest one
+    marked `importedAt` when its staging collections were swapped in,
+    falling back to the latest record for data imported before staging.
+    """
+    db = get_mongo_client()[MONGODB_DATABASE]
+    latest_record = await db["fileInfo"].find_one(
+        {"importedAt": {"$exists": True}}, sort=[("importedAt", DESCENDING)]
+    )
+    if latest_record is None:
+        latest_record = await check_database_fileinfo()
+    return latest_record
+
+
+async def get_dataset_generation() -> str | None:
+    """
+    Returns the generation of the data being served: the loaded lookup
+    index's generation, or for MongoDB the etag of the latest imported
+    fileInfo record, re-read every GENERATION_POLL_SECONDS and when a
+    lookup finds nothing.
+    """
+    global dataset_last_modified
+    if lookup_index is not None:
+        dataset_last_modified = lookup_index.timestamp
+        return lookup_index.generation
+    if (
+        dataset_generation_checked is None
+        or timer() - dataset_generation_checked > GENERATION_POLL_SECONDS
+    ):
+        await read_dataset_generation()
+    return dataset_generation
+
+
+async def read_dataset_generation() -> None:
+    """
+    Read the generation, timestamp and storage schema of the data MongoDB
+    serves, all from the one fileInfo record the staging swap marks, so the
+    schema always belongs to the generation
+    """
+    global dataset_generation, dataset_last_modified, dataset_generation_checked
+    global dataset_schema, dataset_schema_version
+    dataset_generation_checked = timer()
+    try:
+        file_info = await check_imported_fileinfo() or {}
+        dataset_generation = file_info.get("etag")
+        dataset_last_modified = file_info.get("importedAt") or file_info.get(
+            "timestamp"
+        )
+        dataset_schema = file_info.get("schema", FULL)
+        dataset_schema_version = file_info.get("schemaVersion", 1)
+    except Exception as ex:
+        logging.error(f"Could not read the dataset generation: {ex}")
+
+
+async def schema_changed() -> bool:
+    """
+    Re-read the generation after a MongoDB lookup found nothing. A swap can
+    change the storage schema between two polls of the generation, and
+    until it is re-read every lookup asks for the old schema's fields and
+    misses. The read happens at most every SCHEMA_RECHECK_SECONDS, so
+    misses cost no extra round trip in between. Returns True when the
+    lookup must be retried with the new schema.
+    """
+    if (
+        dataset_generation_checked is not None
+        and timer() - dataset_generation_checked < SCHEMA_RECHECK_SECONDS
+    ):
+        return False
+    schema = (dataset_schema, dataset_schema_version)
+    await schema_checks.do("fileInfo", read_dataset_generation)
+    return (dataset_schema, dataset_schema_version) != schema
+
+
+async def query_podcasts(field: str, value: Any) -> List[dict]:
+    """
+    Find the podcasts whose `field` equals `value`, answered from memory or
+    the lookup file when one of those backends is enabled and loaded,
+    otherwise from MongoDB.
+
+    URLs match any podcast whose `url` or `originalUrl` has the same
+    canonical form, with exact `url` matches first. Queries and projections
+    come from guid_slurp.schema so the resolver indexes cover them.
+    """
+    if lookup_index is not None:
+        return lookup_index.lookup(field, value)
+    schema = dataset_schema
+    collection = get_mongo_client()[MONGODB_DATABASE][MONGODB_COLLECTION]
+    if field == "url":
+        query = url_filter(schema, [value], dataset_schema_version)
+    else:
+        query = lookup_filter(schema, field, [value])
+    cursor = collection.find(query, PROJECTIONS[schema])
+    docs = [public(schema, doc) for doc in await cursor.to_list(length=None)]
+    if not docs and await schema_changed():
+        return await query_podcasts(field, value)
+    return exact_first(docs, value) if field == "url" else docs
+
+
+def backend_name() -> str:
+    """
+    The backend lookups are answered from: the loaded lookup index, or
+    MongoDB while none is loaded
+    """
+    return LOOKUP_BACKEND if lookup_index is not None else "mongo"
+
+
+def public(schema: str, doc: dict) -> dict:
+    """
+    The API's shape of a stored guidUrl document, see guid_slurp.schema
+    """
+    return public_document(schema, doc, dataset_last_modified)
+
+
+async def query_many(field: str, values: List[Any]) -> dict[Any, List[dict]]:
+    """
+    Resolve many values of one field with a single `$in` query.
+    Returns the matching documents grouped by value.
+    """
+    if lookup_index is not None:
+        return lookup_index.lookup_many(field, values)
+    found: dict[Any, List[dict]] = {value: [] for value in values}
+    if not values:
+        return found
+    schema = dataset_schema
+    collection = get_mongo_client()[MONGODB_DATABASE][MONGODB_COLLECTION]
+    if field == "url":
+        found = await query_many_urls(collection, schema, values)
+    else:
+        query = lookup_filter(schema, field, values)
+        async for doc in collection.find(query, PROJECTIONS[schema]):
+            doc = public(schema, doc)
+            if doc.get(field) in found:
+                found[doc[field]].append(doc)
+    if not all(found.values()) and await schema_changed():
+        return await query_many(field, values)
+    return found
+
+
+async def query_many_urls(
+    collection, schema: str, urls: List[str]
+) -> dict[str, List[dict]]:
+    """
+    The batch form of the URL lookup in `query_podcasts`, one query for
+    all the URLs.
+    """
+    by_key: dict[str, List[str]] = {}
+    for url in urls:
+        by_key.setdefault(canonical_url(url), []).append(url)
+    found: dict[str, List[dict]] = {url: [] for url in urls}
+    query = url_filter(schema, urls, dataset_schema_version)
+    async for doc in collection.find(query, PROJECTIONS[schema]):
+        doc = public(schema, doc)
+        doc_keys = url_keys(doc.get("url"), doc.get("originalUrl"))
+        matches = {url for key in doc_keys for url in by_key.get(key, [])}
+        if doc.get("url") in found:
+            matches.add(doc["url"])
+        for url in matches:
+            found[url].append(doc)
+    return {url: exact_first(docs, url) for url, docs in found.items()}
+
+
+def get_bloom_filters() -> BloomFilters | None:
+    """
+    The Bloom filters of the generation MongoDB is serving, mapped from the
+    published generation when it changes. None while lookups are answered
+    from a lookup index, which finds misses without MongoDB anyway, when
+    the generation has no filters, or when MongoDB serves another
+    generation than the one published, as it does between the import
+    swapping its collections in and publishing the generation.
+    """
+    global bloom_filters, bloom_filters_failed
+    if lookup_index is not None:
+        return None
+    current = get_published_generation()
+    if not current or not current.get("bloom"):
+        return None
+    generation = current["generation"]
+    if (
+        bloom_filters is None or bloom_filters.generation != generation
+    ) and bloom_filters_failed != generation:
+        try:
+            new_filters = BloomFilters.from_generation(DIRECTORY, current)
+        except Exception as ex:
+            bloom_filters_failed = generation
+            logging.error(f"Failed to load the Bloom filters of {generation}: {ex}")
+            return None
+        old_filters, bloom_filters = bloom_filters, new_filters
+        if old_filters is not None:
+            old_filters.close()
+        for field, bloom in new_filters.filters.items():
+            metrics.BLOOM_FILTER_BYTES.labels(field).set(bloom.bits // 8)
+            metrics.BLOOM_FALSE_POSITIVE_RATE.labels(field).set(
+                bloom.false_positive_rate
+            )
+        logging.info(f"Loaded the Bloom filters of generation {generation}")
+    if bloom_filters is None or bloom_filters.generation != generation:
+        return None
+    if current.get("etag") is None or current["etag"] != dataset_generation:
+        return None
+    return bloom_filters
+
+
+def record_bloom_lookups(field: str, result: str, count: int = 1) -> None:
+    if count:
+        bloom_lookups[result] += count
+        metrics.BLOOM_LOOKUPS.labels(field, result).inc(count)
+
+
+def bloom_stats() -> dict | None:
+    """
+    The loaded Bloom filters' sizes and estimated false positive rates,
+    with the share of this worker's lookups of missing keys they let
+    through to MongoDB
+    """
+    if bloom_filters is None:
+        return None
+    misses = bloom_lookups["absent"] + bloom_lookups["false_positive"]
+    return {
+        **bloom_filters.stats(),
+        "lookups": dict(bloom_lookups),
+        "observed_false_positive_rate": (
+            round(bloom_lookups["false_positive"] / misses, 6) if misses else None
+        ),
+    }
+
+
+async def find_podcasts(field: str, value: Any) -> List[dict]:
+    """
+    Cached `query_podcasts`. Not found results are cached too. Concurrent
+    cache misses for the same key share a single backend query. Values the
+    Bloom filters rule out are not found without asking MongoDB.
+    """
+    generation = await get_dataset_generation()
+    filters = get_bloom_filters()
+    if filters is not None and not filters.might_contain(field, value):
+        timing.note("bloom", "absent")
+        record_bloom_lookups(field, "absent")
+        return []
+    cache_key = (field, value, generation)
+    results = response_cache.get(cache_key)
+    if results is MISSING:
+        timing.note("cache", "miss")
+        backend = backend_name()
+        with timing.span("db", backend):
+            results = await in_flight.do(
+                cache_key,
+                lambda: metrics.timed_query(
+                    query_podcasts(field, value), backend, "single", field
+                ),
+            )
+        response_cache.set(cache_key, results)
+        if filters is not None:
+            record_bloom_lookups(field, "present" if results else "false_positive")
+    else:
+        timing.note("cache", "hit")
+    return results
+
+
+async def resolve(request: Request, field: str, value: Any) -> Response:
+    """
+    Shared body of the single item resolver routes. Conditional requests
+    are only checked once the (cached) lookup has found the item, so a
+    key that is not found is a 404 whatever validators are sent.
+    """
+    timing.end_validation()
+    generation = await get_dataset_generation()
+    last_modified = dataset_last_modified
+    results = await find_podcasts(field, value)
+    if not results:
+        raise HTTPException(status_code=404, detail="Item not found")
+    etag = make_etag(generation, field, value) if generation else None
+    headers = get_cache_headers(
+        reason="resolver", last_modified=last_modified, etag=etag
+    )
+    if etag and is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    with timing.span("serialize"):
+        return JSONResponse(jsonable_encoder(results), headers=headers)
+
+
+async def find_many(field: str, values: List[Any]) -> dict[Any, List[dict]]:
+    """
+    Cached `query_many`, only the values not already cached and not ruled
+    out by the Bloom filters are queried.
+    """
+    generation = await get_dataset_generation()
+    filters = get_bloom_filters()
+    found: dict[Any, List[dict]] = {}
+    missing = []
+    absent = 0
+    for value in values:
+        if filters is not None and not filters.might_contain(field, value):
+            found[value] = []
+            absent += 1
+            continue
+        results = response_cache.get((field, value, generation))
+        if results is MISSING:
+            missing.append(value)
+        else:
+            found[value] = results
+    if filters is not None:
+        timing.note(f"bloom-{field}", f"{absent} absent")
+        record_bloom_lookups(field, "absent", absent)
+    timing.note(f"cache-{field}", f"{len(found) - absent} hit {len(missing)} miss")
+    if missing:
+        backend = backend_name()
+        with timing.span(f"db-{field}", backend):
+            results_by_value = await metrics.timed_query(
+                query_many(field, missing), backend, "batch", field
+            )
+        for value, results in results_by_value.items():
+            response_cache.set((field, value, generation), results)
+            found[value] = results
+        if filters is not None:
+            present = sum(1 for results in results_by_value.values() if results)
+            record_bloom_lookups(field, "present", present)
+            record_bloom_lookups(field, "false_positive", len(missing) - present)
+    return found
+
+
 @app.get("/info/", tags=["info"])
 async def info():
     """
     Returns information about the API and checks that it is working
     """
     try:
-        file_info = check_database_fileinfo()
+        file_info = await check_database_fileinfo()
         # delete the _id field
         del file_info["_id"]
     except Exception as e:
@@ -154,104 +682,315 @@ async def info():
         "status": "OK",
         "time": datetime.now(tz=UTC).isoformat(),
         "file_info": file_info,
+        "lookup_backend": LOOKUP_BACKEND,
+        "generation": (
+            lookup_index.generation if lookup_index else file_info.get("etag")
+        ),
+        "cache": response_cache.stats(),
+        "bloom": bloom_stats(),
+        "coalescing": in_flight.stats(),
         "server": EXTERNAL_API_DOMAIN,
     }
 
 
 @app.get("/guid/{guid}", tags=["resolver"])
-async def resolve_guid(guid: UUID5 | str):
+async def resolve_guid(request: Request, guid: UUID5 | str):
     """
     Resolve a GUID to a RSS feed URL.
     """
-    with MongoClient(MONGODB_CONNECTION) as client:  # type: MongoClientType
-        collection = client[MONGODB_DATABASE][MONGODB_COLLECTION]
-        cursor = collection.find({"podcastGuid": str(guid)}, {"_id": 0})
-        results = [doc for doc in cursor]
-    if results:
-        return results
-    raise HTTPException(status_code=404, detail="Item not found")
+    return await resolve(request, "podcastGuid", str(guid))
 
 
 @app.get("/url/", tags=["resolver"])
-async def resolve_url(url: HttpUrl):
+async def resolve_url(request: Request, url: HttpUrl):
     """
     Resolve a RSS feed URL to a GUID.
     """
-    with MongoClient(MONGODB_CONNECTION) as client:  # type: MongoClientType
-        collection = client[MONGODB_DATABASE][MONGODB_COLLECTION]
-        cursor = collection.find({"url": str(url)}, {"_id": 0})
-        results = [doc for doc in cursor]
-    if results:
-        return results
-    raise HTTPException(status_code=404, detail="Item not found")
+    return await resolve(request, "url", str(url))
 
 
 @app.get("/itunesId/{itunesId}", tags=["resolver"])
 async def resolve_itunesId(
-    itunesId: int = Path(gt=0, le=100000000000, description="iTunes ID")
+    request: Request,
+    itunesId: int = Path(gt=0, le=100000000000, description="iTunes ID"),
 ):
     """
     Resolve an iTunes ID to a RSS feed URL.
     """
-    with MongoClient(MONGODB_CONNECTION) as client:  # type: MongoClientType
-        collection = client[MONGODB_DATABASE][MONGODB_COLLECTION]
-        cursor = collection.find({"itunesId": itunesId}, {"_id": 0})
-        results = [doc for doc in cursor]
-    if results:
-        return results
-    raise HTTPException(status_code=404, detail="Item not found")
+    return await resolve(request, "itunesId", itunesId)
 
 
 @app.get("/podcastIndexId/{podcastIndexId}", tags=["resolver"])
-async def resolve_podcastIndexId(podcastIndexId: int = Path(gt=0, le=100000000000)):
+async def resolve_podcastIndexId(
+    request: Request, podcastIndexId: int = Path(gt=0, le=100000000000)
+):
     """
     Resolve a PodcastIndex ID to a RSS feed URL.
     """
-    with MongoClient(MONGODB_CONNECTION) as client:  # type: MongoClientType
-        collection = client[MONGODB_DATABASE][MONGODB_COLLECTION]
-        cursor = collection.find({"podcastIndexId": podcastIndexId}, {"_id": 0})
-        results = [doc for doc in cursor]
-    if results:
-        return results
-    raise HTTPException(status_code=404, detail="Item not found")
+    return await resolve(request, "podcastIndexId", podcastIndexId)
+
+
+class BatchResolveRequest(BaseModel):
+    """
+    Identifiers to resolve in one request, any mix of the four key types.
+    """
+
+    guid: List[str] = Field([], max_length=BATCH_MAX_ITEMS)
+    url: List[str] = Field([], max_length=BATCH_MAX_ITEMS)
+    itunesId: List[int] = Field([], max_length=BATCH_MAX_ITEMS)
+    podcastIndexId: List[int] = Field([], max_length=BATCH_MAX_ITEMS)
+
+
+# Batch request key -> field in the guidUrl collection
+BATCH_FIELDS = {
+    "guid": "podcastGuid",
+    "url": "url",
+    "itunesId": "itunesId",
+    "podcastIndexId": "podcastIndexId",
+}
+NOT_FOUND = {"detail": "Item not found"}
+http_url_adapter = TypeAdapter(HttpUrl)
+
+
+def normalize_batch_url(url: str) -> str:
+    """
+    Normalise a URL the same way the `/url/` route does so batch and single
+    lookups match the same documents. Invalid URLs are left untouched and
+    simply won't be found.
+    """
+    try:
+        return str(http_url_adapter.validate_python(url))
+    except ValidationError:
+        return url
+
+
+@app.post("/batch/", tags=["resolver"])
+async def resolve_batch(batch: BatchResolveRequest):
+    """
+    Resolve many GUIDs, URLs, iTunes IDs and PodcastIndex IDs at once.
+    Results are keyed by identifier type and then by the value sent, each
+    holding the same list the single item route returns or a not found
+    marker. Missing items never turn the whole batch into a 404.
+    """
+    timing.end_validation()
+    response: dict[str, dict[str, Any]] = {}
+    for key, field in BATCH_FIELDS.items():
+        values: List[Any] = getattr(batch, key)
+        if not values:
+            continue
+        if key == "url":
+            lookup = {value: normalize_batch_url(value) for value in values}
+        else:
+            lookup = {value: value for value in values}
+        found = await find_many(field, list(set(lookup.values())))
+        response[key] = {
+            str(value): found[query] or NOT_FOUND for value, query in lookup.items()
+        }
+    with timing.span("serialize"):
+        return JSONResponse(jsonable_encoder(response))
 
 
 @app.get("/admin", tags=["admin"], include_in_schema=True)
 async def admin(request: Request, background_tasks: BackgroundTasks):
     """
-    Admin page lists when the raw data was imported
+    Admin page lists when the raw data was imported, with the per phase
+    timings of each import under `importTelemetry`
     """
     if request.headers.get("X-secret") == os.getenv("ADMIN_HEADER_SECRET"):
-        with MongoClient(MONGODB_CONNECTION) as client:  # type: MongoClientType
-            collection = client[MONGODB_DATABASE]["fileInfo"]
-            cursor = collection.find({}, {"_id": 0}).sort("timestamp", -1)
-            results = [doc for doc in cursor]
-            return results
+        collection = get_mongo_client()[MONGODB_DATABASE]["fileInfo"]
+        cursor = collection.find({}, {"_id": 0}).sort("timestamp", -1)
+        results = await cursor.to_list(length=None)
+        return results
 
     return {"message": "not authorized"}
 
 
+@app.get("/metrics", tags=["admin"], include_in_schema=False)
+async def scrape_metrics():
+    """
+    Request latency histograms, response counts, requests in flight and
+    backend query timings of all the API workers, for Prometheus
+    """
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
+
+
+# Duplicate groups are paged and streamed biggest first, then by GUID
+DUPLICATES_SORT = [("count", DESCENDING), ("_id", 1)]
+# Precompressed copies of the duplicates report, in order of preference
+REPORT_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def get_published_generation() -> dict | None:
+    """
+    Returns the generation database_sync last published (its current.json),
+    re-read at most every GENERATION_POLL_SECONDS.
+    """
+    global published_generation, published_generation_checked
+    if (
+        published_generation_checked is None
+        or timer() - published_generation_checked > GENERATION_POLL_SECONDS
+    ):
+        published_generation_checked = timer()
+        published_generation = read_current_generation(DIRECTORY)
+    return published_generation
+
+
+def accepted_encodings(accept_encoding: str) -> set[str]:
+    """
+    The content codings a client accepts, ignoring any with q=0
+    """
+    encodings = set()
+    for item in accept_encoding.split(","):
+        name, *params = item.split(";")
+        quality = 1.0
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name.strip() and quality > 0:
+            encodings.add(name.strip().lower())
+    return encodings
+
+
+def duplicates_report_response(request: Request) -> Response | None:
+    """
+    Serve the precomputed duplicates report of the published generation
+    from disk, picking the best precompressed copy the client accepts.
+    FileResponse handles Range requests. Returns None when there is no
+    report so the caller can fall back to MongoDB.
+    """
+    current = get_published_generation()
+    if not current or not current.get("duplicates"):
+        return None
+    path = os.path.join(DIRECTORY, current["duplicates"])
+    encoding = None
+    accepted = accepted_encodings(request.headers.get("accept-encoding", ""))
+    for name, suffix in REPORT_ENCODINGS:
+        if name in accepted and os.path.exists(path + suffix):
+            path, encoding = path + suffix, name
+            break
+    if not os.path.exists(path):
+        return None
+    last_modified = datetime.fromisoformat(current["timestamp"])
+    etag = f'"{current["generation"]}-{encoding or "identity"}"'
+    headers = get_cache_headers(
+        reason="duplicates report", last_modified=last_modified, etag=etag
+    )
+    headers["Vary"] = "Accept-Encoding"
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return FileResponse(path, media_type="application/json", headers=headers)
+
+
+def duplicate_document(doc: dict) -> dict:
+    doc["podcastGuid"] = doc["_id"]
+    # delete the doc["_id"] key
+    del doc["_id"]
+    return doc
+
+
+def encode_duplicates_cursor(doc: dict) -> str:
+    """
+    Opaque keyset pagination token: the sort key of the last group sent
+    """
+    token = json.dumps([doc["count"], doc["podcastGuid"]]).encode()
+    return base64.urlsafe_b64encode(token).decode()
+
+
+def decode_duplicates_cursor(cursor: str) -> dict:
+    """
+    Turn a pagination token into the query for the groups after it
+    """
+    try:
+        count, guid = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+    return {"$or": [{"count": {"$lt": count}}, {"count": count, "_id": {"$gt": guid}}]}
+
+
+async def stream_duplicates(first: dict, cursor, ndjson: bool) -> AsyncIterator[str]:
+    """
+    Write duplicate groups out as the cursor yields them, as a JSON array
+    or as newline delimited JSON, so memory use does not grow with the
+    number of groups.
+    """
+    if ndjson:
+        yield json.dumps(duplicate_document(first), default=str) + "\n"
+        async for doc in cursor:
+            yield json.dumps(duplicate_document(doc), default=str) + "\n"
+        return
+    yield "[" + json.dumps(duplicate_document(first), default=str)
+    async for doc in cursor:
+        yield "," + json.dumps(duplicate_document(doc), default=str)
+    yield "]"
+
+
 @app.get("/duplicates/", tags=["problems"], include_in_schema=True)
-async def duplicates(guid: str = Query("", description="GUID")):
+async def duplicates(
+    request: Request,
+    guid: str = Query("", description="GUID"),
+    limit: int = Query(
+        0,
+        ge=0,
+        le=DUPLICATES_MAX_PAGE,
+        description="Page size, returns a page with a cursor for the next one",
+    ),
+    cursor: str = Query("", description="Cursor from the previous page"),
+    format: Literal["json", "ndjson"] = Query(
+        "json", description="ndjson streams one group per line"
+    ),
+):
     """
     Find duplicate GUIDs. Returns a static dump of all duplicated IDs.
-    If no GUID is passed, it will return all duplicates.
+    If no GUID is passed, it will return all duplicates, biggest group
+    first, from the precompressed report written after each import. Pass
+    `limit` (and then `cursor`) to page through them instead, or
+    `format=ndjson` for newline delimited JSON.
     """
     if guid:
-        query = {"_id": str(guid)}
-    else:
-        query = {}
-    with MongoClient(MONGODB_CONNECTION) as client:  # type: MongoClientType
-        collection = client[MONGODB_DATABASE][MONGODB_DUPLICATES]
-        cursor = collection.find(query)
-        results = []
-        for doc in cursor:
-            doc["podcastGuid"] = doc["_id"]
-            # delete the doc["_id"] key
-            del doc["_id"]
-            results.append(doc)
-        # results = [doc for doc in cursor]
-
-    if results:
-        return results
-    raise HTTPException(status_code=404, detail="Item not found")
+        collection = get_mongo_client()[MONGODB_DATABASE][MONGODB_DUPLICATES]
+        results = [
+            duplicate_document(doc) async for doc in collection.find({"_id": str(guid)})
+        ]
+        if results:
+            return results
+        raise HTTPException(status_code=404, detail="Item not found")
+
+    query = decode_duplicates_cursor(cursor) if cursor else {}
+    ndjson = format == "ndjson" or "application/x-ndjson" in request.headers.get(
+        "accept", ""
+    )
+    if not (query or limit or ndjson):
+        report = duplicates_report_response(request)
+        if report is not None:
+            return report
+    collection = get_mongo_client()[MONGODB_DATABASE][MONGODB_DUPLICATES]
+    if limit and not ndjson:
+        page = (
+            await collection.find(query)
+            .sort(DUPLICATES_SORT)
+            .limit(limit)
+            .to_list(length=limit)
+        )
+        page = [duplicate_document(doc) for doc in page]
+        next_cursor = encode_duplicates_cursor(page[-1]) if len(page) == limit else None
+        return {"duplicates": page, "next_cursor": next_cursor}
+
+    db_cursor = (
+        collection.find(query).sort(DUPLICATES_SORT).batch_size(DUPLICATES_BATCH_SIZE)
+    )
+    if limit:
+        db_cursor = db_cursor.limit(limit)
+    first = await anext(db_cursor, None)
+    if first is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+    return StreamingResponse(
+        stream_duplicates(first, db_cursor, ndjson),
+        media_type="application/x-ndjson" if ndjson else "application/json",
+    )
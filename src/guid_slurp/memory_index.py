@@ -0,0 +1,135 @@
+import os
+import sqlite3
+from array import array
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+from guid_slurp.urls import canonical_url, exact_first, url_keys
+
+# Stored in the id columns when the dump has no value (e.g. no iTunes ID)
+MISSING_ID = -1
+# The fields the resolver routes look up, matching the guidUrl collection
+LOOKUP_FIELDS = ("podcastGuid", "url", "podcastIndexId", "itunesId")
+
+
+class MemoryIndex:
+    """
+    Read only lookup tables for one generation of the PodcastIndex data,
+    held entirely in process memory.
+
+    Each column is stored once, strings in lists and ids in typed arrays.
+    Every lookup field has a dict mapping the key to its row number, or to
+    a tuple of row numbers when several podcasts share the key. The url
+    dict is keyed by the canonical form of both `url` and `originalUrl`.
+    """
+
+    def __init__(self, generation: str, timestamp: datetime):
+        self.generation = generation
+        self.timestamp = timestamp
+        self.podcastGuid: List[str | None] = []
+        self.url: List[str | None] = []
+        self.originalUrl: List[str | None] = []
+        self.podcastIndexId = array("q")
+        self.itunesId = array("q")
+        self.indexes: Dict[str, Dict[Any, int | Tuple[int, ...]]] = {
+            field: {} for field in LOOKUP_FIELDS
+        }
+
+    @classmethod
+    def from_sqlite(
+        cls, path: str, generation: str, timestamp: datetime
+    ) -> "MemoryIndex":
+        """
+        Load the five lookup columns from a PodcastIndex dump or from the
+        slimmed down snapshot database_sync writes for each generation.
+        """
+        index = cls(generation, timestamp)
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            cursor = conn.execute(
+                "SELECT podcastGuid, url, originalUrl, id, itunesId FROM podcasts"
+            )
+            while rows := cursor.fetchmany(10000):
+                for row in rows:
+                    index.append(*row)
+        finally:
+            conn.close()
+        return index
+
+    @classmethod
+    def from_generation(cls, directory: str, current: Dict[str, Any]) -> "MemoryIndex":
+        """
+        Load the generation described by a `current.json` pointer.
+        """
+        return cls.from_sqlite(
+            os.path.join(directory, current["sqlite"]),
+            current["generation"],
+            datetime.fromisoformat(current["timestamp"]),
+        )
+
+    def __len__(self) -> int:
+        return len(self.podcastIndexId)
+
+    def append(
+        self,
+        podcast_guid: str | None,
+        url: str | None,
+        original_url: str | None,
+        podcast_index_id: int,
+        itunes_id: int | None,
+    ) -> None:
+        row = len(self)
+        self.podcastGuid.append(podcast_guid)
+        self.url.append(url)
+        self.originalUrl.append(original_url)
+        self.podcastIndexId.append(podcast_index_id)
+        self.itunesId.append(itunes_id if isinstance(itunes_id, int) else MISSING_ID)
+        self._add_key("podcastGuid", podcast_guid, row)
+        for key in url_keys(url, original_url):
+            self._add_key("url", key, row)
+        self._add_key("podcastIndexId", podcast_index_id, row)
+        if isinstance(itunes_id, int):
+            self._add_key("itunesId", itunes_id, row)
+
+    def _add_key(self, field: str, key: Any, row: int) -> None:
+        if key is None or key == "":
+            return
+        index = self.indexes[field]
+        existing = index.get(key)
+        if existing is None:
+            index[key] = row
+        elif isinstance(existing, int):
+            index[key] = (existing, row)
+        else:
+            index[key] = existing + (row,)
+
+    def document(self, row: int) -> Dict[str, Any]:
+        """
+        Build the same document shape the guidUrl collection returns.
+        """
+        itunes_id = self.itunesId[row]
+        return {
+            "podcastGuid": self.podcastGuid[row],
+            "url": self.url[row],
+            "originalUrl": self.originalUrl[row],
+            "podcastIndexId": self.podcastIndexId[row],
+            "itunesId": None if itunes_id == MISSING_ID else itunes_id,
+            "timestamp": self.timestamp,
+        }
+
+    def lookup(self, field: str, value: Any) -> List[Dict[str, Any]]:
+        if field == "url":
+            documents = self._documents(field, canonical_url(value))
+            return exact_first(documents, value)
+        return self._documents(field, value)
+
+    def _documents(self, field: str, key: Any) -> List[Dict[str, Any]]:
+        rows = self.indexes[field].get(key)
+        if rows is None:
+            return []
+        if isinstance(rows, int):
+            return [self.document(rows)]
+        return [self.document(row) for row in rows]
+
+    def lookup_many(self, field: str, values: List[Any]) -> Dict[Any, List[dict]]:
+        return {value: self.lookup(field, value) for value in values}
@@ -0,0 +1,138 @@
+"""
+Prometheus metrics of the API, served on /metrics.
+
+Under gunicorn every worker is its own process, so the metrics use
+prometheus_client's multiprocess mode when PROMETHEUS_MULTIPROC_DIR is set:
+each worker writes its samples to files in that directory and a scrape of
+any worker aggregates all of them. gunicorn.conf.py empties the directory
+when gunicorn starts and marks workers that exit as dead. Without the
+variable, for example under a single uvicorn, the process registry is used.
+"""
+
+import os
+from timeit import default_timer as timer
+from typing import Any, Awaitable, Tuple, TypeVar
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from starlette.routing import Match
+from starlette.types import Scope
+
+T = TypeVar("T")
+
+# Read by prometheus_client when it is imported, it must be set in the
+# environment of the gunicorn master, see the Dockerfile
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+# Label of requests that match no route, so unknown paths cannot blow up
+# the number of series
+UNMATCHED_ROUTE = "<unmatched>"
+
+# Resolver lookups take well under a millisecond from a lookup index or
+# the cache and tens of milliseconds from MongoDB under load
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+REQUEST_SECONDS = Histogram(
+    "guid_slurp_http_request_duration_seconds",
+    "Time to answer an HTTP request, by route template",
+    ["method", "route"],
+    buckets=LATENCY_BUCKETS,
+)
+RESPONSES = Counter(
+    "guid_slurp_http_responses",
+    "HTTP responses by route template and status code",
+    ["method", "route", "status"],
+)
+IN_FLIGHT = Gauge(
+    "guid_slurp_http_requests_in_flight",
+    "HTTP requests being answered, summed over live workers",
+    ["route"],
+    multiprocess_mode="livesum",
+)
+BACKEND_QUERY_SECONDS = Histogram(
+    "guid_slurp_backend_query_duration_seconds",
+    "Time of resolver queries that missed the response cache, by backend "
+    "(mongo, memory or mmap), single or batch lookup and key type",
+    ["backend", "operation", "field"],
+    buckets=LATENCY_BUCKETS,
+)
+BLOOM_LOOKUPS = Counter(
+    "guid_slurp_bloom_lookups",
+    "MongoDB lookups checked against the generation's Bloom filters, by key "
+    "type and result: absent (answered without MongoDB), present, or "
+    "false_positive (passed the filter but not found)",
+    ["field", "result"],
+)
+BLOOM_FILTER_BYTES = Gauge(
+    "guid_slurp_bloom_filter_bytes",
+    "Size of the loaded Bloom filter of each key type",
+    ["field"],
+    multiprocess_mode="livemax",
+)
+BLOOM_FALSE_POSITIVE_RATE = Gauge(
+    "guid_slurp_bloom_false_positive_rate",
+    "False positive rate of the loaded Bloom filter of each key type, "
+    "estimated from the share of its bits set",
+    ["field"],
+    multiprocess_mode="livemax",
+)
+
+
+def route_template(scope: Scope) -> str:
+    """
+    The path template of the route a request matches, `/guid/{guid}`
+    rather than the GUID asked for
+    """
+    app = scope.get("app")
+    for route in getattr(getattr(app, "router", None), "routes", []):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", UNMATCHED_ROUTE)
+    return UNMATCHED_ROUTE
+
+
+async def timed_query(
+    query: Awaitable[T], backend: str, operation: str, field: str
+) -> T:
+    """
+    Await a resolver `query`, recording how long it took
+    """
+    start = timer()
+    try:
+        return await query
+    finally:
+        BACKEND_QUERY_SECONDS.labels(backend, operation, field).observe(timer() - start)
+
+
+def render(multiproc_dir: str | None = MULTIPROC_DIR) -> Tuple[bytes, str]:
+    """
+    The metrics in the Prometheus text format and its content type,
+    aggregated over all workers in multiprocess mode
+    """
+    registry: Any = REGISTRY
+    if multiproc_dir:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=multiproc_dir)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
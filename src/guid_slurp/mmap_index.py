@@ -0,0 +1,302 @@
+import mmap
+import os
+import shutil
+import sqlite3
+import struct
+import tempfile
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timezone
+from hashlib import blake2b
+from typing import Any, Dict, List
+
+from guid_slurp.memory_index import LOOKUP_FIELDS, MISSING_ID
+from guid_slurp.urls import canonical_url, exact_first, url_keys
+
+# On disk lookup file shared by every API worker through the page cache.
+#
+# Layout (little endian):
+#   header       HEADER, then the generation id as UTF-8
+#   strings      every podcastGuid, url and originalUrl concatenated
+#   records      one RECORD per podcast, ordered by podcastIndexId
+#   per field    sorted int64 keys followed by the uint32 record numbers
+#
+# String fields are keyed by a 64 bit hash of the value and the candidate
+# records are checked against the real string, ints are keyed directly.
+# The url field is keyed by the canonical form of `url` and `originalUrl`.
+#
+# Version 2: url keys are canonical URLs instead of the exact url.
+MAGIC = b"GSLPIDX\x00"
+FORMAT_VERSION = 2
+HEADER = struct.Struct("<8sIIQqQQ" + "QQQ" * len(LOOKUP_FIELDS))
+RECORD = struct.Struct("<qqQIQIQI")
+NULL_LENGTH = 0xFFFFFFFF
+STRING_FIELDS = ("podcastGuid",)
+INT64_MIN = -(2**63)
+INT64_MAX = 2**63 - 1
+
+ROW_NUMBERS = (
+    "SELECT *, ROW_NUMBER() OVER (ORDER BY id) - 1 AS row_number FROM podcasts"
+)
+INDEX_QUERIES = {
+    "podcastGuid": (
+        f"SELECT key_hash(podcastGuid), row_number FROM ({ROW_NUMBERS}) "
+        "WHERE podcastGuid IS NOT NULL AND podcastGuid != '' ORDER BY 1, 2"
+    ),
+    "url": (
+        f"SELECT key_hash(url_key(url)), row_number FROM ({ROW_NUMBERS}) "
+        "WHERE url IS NOT NULL AND url != '' "
+        "UNION "
+        f"SELECT key_hash(url_key(originalUrl)), row_number FROM ({ROW_NUMBERS}) "
+        "WHERE originalUrl IS NOT NULL AND originalUrl != '' ORDER BY 1, 2"
+    ),
+    "podcastIndexId": f"SELECT id, row_number FROM ({ROW_NUMBERS}) ORDER BY 1, 2",
+    "itunesId": (
+        f"SELECT itunesId, row_number FROM ({ROW_NUMBERS}) "
+        "WHERE typeof(itunesId) = 'integer' ORDER BY 1, 2"
+    ),
+}
+
+
+def key_hash(key: str) -> int:
+    """
+    Stable 64 bit hash of a string key, the same in every process.
+    """
+    digest = blake2b(key.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+def _pad(f, position: int) -> int:
+    """
+    Pad the file to an 8 byte boundary so the key arrays stay aligned
+    """
+    padding = -position % 8
+    f.write(b"\x00" * padding)
+    return position + padding
+
+
+def write_index(
+    sqlite_path: str, index_path: str, generation: str, timestamp: datetime
+) -> None:
+    """
+    Build the lookup file for one generation from a SQLite file holding the
+    podcasts table. SQLite does the sorting so memory use stays small. The
+    file is written next to its final name and renamed into place.
+    """
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    generation_bytes = generation.encode()
+    tmp_path = f"{index_path}.tmp"
+    conn = sqlite3.connect(f"file:{sqlite_path}?mode=ro", uri=True)
+    conn.create_function("key_hash", 1, key_hash, deterministic=True)
+    conn.create_function("url_key", 1, canonical_url, deterministic=True)
+    try:
+        with open(tmp_path, "wb", buffering=1024 * 1024) as f, tempfile.TemporaryFile(
+            dir=os.path.dirname(os.path.abspath(index_path))
+        ) as records:
+            position = HEADER.size + len(generation_bytes)
+            f.write(b"\x00" * position)
+
+            # Strings, spooling the record for each row to copy in afterwards
+            strings_offset = position
+            row_count = 0
+            cursor = conn.execute(
+                "SELECT podcastGuid, url, originalUrl, id, itunesId "
+                "FROM podcasts ORDER BY id"
+            )
+            while rows := cursor.fetchmany(10000):
+                for guid, url, original_url, podcast_index_id, itunes_id in rows:
+                    refs: List[int] = []
+                    for value in (guid, url, original_url):
+                        if value is None:
+                            refs += (0, NULL_LENGTH)
+                            continue
+                        data = str(value).encode()
+                        refs += (position - strings_offset, len(data))
+                        f.write(data)
+                        position += len(data)
+                    if not isinstance(itunes_id, int):
+                        itunes_id = MISSING_ID
+                    records.write(RECORD.pack(podcast_index_id, itunes_id, *refs))
+                    row_count += 1
+
+            position = _pad(f, position)
+            records_offset = position
+            records.seek(0)
+            shutil.copyfileobj(records, f, 1024 * 1024)
+            position += row_count * RECORD.size
+
+            sections: List[int] = []
+            for field in LOOKUP_FIELDS:
+                keys = array("q")
+                row_numbers = array("I")
+                for key, row_number in conn.execute(INDEX_QUERIES[field]):
+                    keys.append(key)
+                    row_numbers.append(row_number)
+                position = _pad(f, position)
+                keys.tofile(f)
+                rows_offset = position + len(keys) * keys.itemsize
+                row_numbers.tofile(f)
+                sections += (position, rows_offset, len(keys))
+                position = rows_offset + len(row_numbers) * row_numbers.itemsize
+
+            f.seek(0)
+            f.write(
+                HEADER.pack(
+                    MAGIC,
+                    FORMAT_VERSION,
+                    len(generation_bytes),
+                    row_count,
+                    int(timestamp.timestamp() * 1_000_000),
+                    strings_offset,
+                    records_offset,
+                    *sections,
+                )
+            )
+            f.write(generation_bytes)
+    finally:
+        conn.close()
+    os.replace(tmp_path, index_path)
+
+
+class MmapIndex:
+    """
+    Read only view of a lookup file written by `write_index`. The file is
+    memory mapped so all workers on a machine share one copy in the page
+    cache, and lookups binary search the mapped key arrays in place.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (
+                magic,
+                version,
+                generation_length,
+                self._rows,
+                timestamp_us,
+                self._strings_offset,
+                self._records_offset,
+                *sections,
+            ) = HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a guid-slurp lookup file")
+            if version != FORMAT_VERSION:
+                raise ValueError(
+                    f"{path} has format version {version}, expected {FORMAT_VERSION}"
+                )
+        except Exception:
+            self._map.close()
+            raise
+        self.version = version
+        self.generation = bytes(
+            self._map[HEADER.size : HEADER.size + generation_length]
+        ).decode()
+        self.timestamp = datetime.fromtimestamp(
+            timestamp_us / 1_000_000, tz=timezone.utc
+        )
+        view = memoryview(self._map)
+        self._views = [view]
+        self._keys: Dict[str, memoryview] = {}
+        self._row_numbers: Dict[str, memoryview] = {}
+        for i, field in enumerate(LOOKUP_FIELDS):
+            keys_offset, rows_offset, count = sections[i * 3 : i * 3 + 3]
+            keys = view[keys_offset : keys_offset + count * 8].cast("q")
+            row_numbers = view[rows_offset : rows_offset + count * 4].cast("I")
+            self._keys[field] = keys
+            self._row_numbers[field] = row_numbers
+            self._views += [keys, row_numbers]
+
+    @classmethod
+    def from_generation(cls, directory: str, current: Dict[str, Any]) -> "MmapIndex":
+        """
+        Map the lookup file of the generation described by `current.json`,
+        checking the file really is the generation the pointer names.
+        """
+        index = cls(os.path.join(directory, current["index"]))
+        if index.generation != current["generation"]:
+            generation = index.generation
+            index.close()
+            raise ValueError(
+                f"Lookup file holds generation {generation}, "
+                f"expected {current['generation']}"
+            )
+        return index
+
+    def close(self) -> None:
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._map.close()
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def _string(self, offset: int, length: int) -> str | None:
+        if length == NULL_LENGTH:
+            return None
+        start = self._strings_offset + offset
+        return self._map[start : start + length].decode()
+
+    def document(self, row: int) -> Dict[str, Any]:
+        """
+        Build the same document shape the guidUrl collection returns.
+        """
+        (
+            podcast_index_id,
+            itunes_id,
+            guid_offset,
+            guid_length,
+            url_offset,
+            url_length,
+            original_offset,
+            original_length,
+        ) = RECORD.unpack_from(self._map, self._records_offset + row * RECORD.size)
+        return {
+            "podcastGuid": self._string(guid_offset, guid_length),
+            "url": self._string(url_offset, url_length),
+            "originalUrl": self._string(original_offset, original_length),
+            "podcastIndexId": podcast_index_id,
+            "itunesId": None if itunes_id == MISSING_ID else itunes_id,
+            "timestamp": self.timestamp,
+        }
+
+    def _rows_for_key(self, field: str, key: int) -> List[int]:
+        keys = self._keys[field]
+        row_numbers = self._row_numbers[field]
+        rows = []
+        position = bisect_left(keys, key)
+        while position < len(keys) and keys[position] == key:
+            rows.append(row_numbers[position])
+            position += 1
+        return rows
+
+    def lookup(self, field: str, value: Any) -> List[Dict[str, Any]]:
+        if field == "url":
+            if not isinstance(value, str) or not value:
+                return []
+            key = canonical_url(value)
+            documents = [
+                doc
+                for doc in (
+                    self.document(row)
+                    for row in self._rows_for_key(field, key_hash(key))
+                )
+                if key in url_keys(doc["url"], doc["originalUrl"])
+            ]
+            return exact_first(documents, value)
+        if field in STRING_FIELDS:
+            if not isinstance(value, str) or not value:
+                return []
+            documents = [
+                self.document(row) for row in self._rows_for_key(field, key_hash(value))
+            ]
+            return [doc for doc in documents if doc[field] == value]
+        if not isinstance(value, int) or not INT64_MIN <= value <= INT64_MAX:
+            return []
+        return [self.document(row) for row in self._rows_for_key(field, value)]
+
+    def lookup_many(self, field: str, values: List[Any]) -> Dict[Any, List[dict]]:
+        return {value: self.lookup(field, value) for value in values}
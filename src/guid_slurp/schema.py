@@ -0,0 +1,233 @@
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Sequence, Tuple
+
+from bson.binary import Binary, UuidRepresentation
+
+from guid_slurp.urls import canonical_url
+
+# Storage schemas of the guidUrl collection. "full" stores the public field
+# names and a timestamp in every document. "compact" stores GUIDs as 16 byte
+# BinData UUIDs under short field names, leaves out an originalUrl equal to
+# url and a missing itunesId, and keeps the timestamp only in fileInfo.
+FULL = "full"
+COMPACT = "compact"
+SCHEMAS = (FULL, COMPACT)
+
+# Version of the document shape, recorded on fileInfo when a generation is
+# swapped in. Version 1 kept the canonical URL keys in a `urlKeys` array.
+# Version 2 keeps them in the scalar `urlKey` and `originalUrlKey`, the
+# latter only when it differs, because an index on an array field cannot
+# cover a query. Version 3 stores a NULL originalUrl of a compact document
+# as NULL_ORIGINAL_URL.
+SCHEMA_VERSION = 3
+
+COMPACT_FIELDS = {
+    "podcastGuid": "g",
+    "url": "u",
+    "originalUrl": "o",
+    "podcastIndexId": "i",
+    "itunesId": "t",
+    "urlKey": "k",
+    "originalUrlKey": "ok",
+    # Version 1, a `urlKeys` array
+    "urlKeys": "k",
+}
+
+# Stored as `o` for a NULL originalUrl. A covered query returns a missing
+# `o`, which means "same as url", as null, so NULL needs a value of its own.
+NULL_ORIGINAL_URL = False
+
+# The fields the resolvers return, each resolver index carries all of them
+# so lookups are answered from the index alone, never the documents
+RESOLVER_FIELDS = ("podcastGuid", "url", "originalUrl", "podcastIndexId", "itunesId")
+# The fields resolvers look documents up by, URLs by their canonical keys
+LOOKUP_FIELDS = (
+    "podcastGuid",
+    "podcastIndexId",
+    "itunesId",
+    "urlKey",
+    "originalUrlKey",
+)
+
+
+def field_name(schema: str, field: str) -> str:
+    """
+    The name `field` is stored under in `schema`
+    """
+    return COMPACT_FIELDS[field] if schema == COMPACT else field
+
+
+def returned_fields(schema: str) -> List[str]:
+    """
+    The stored names of the fields a resolver returns in `schema`
+    """
+    fields = [field_name(schema, field) for field in RESOLVER_FIELDS]
+    if schema != COMPACT:
+        fields.append("timestamp")
+    return fields
+
+
+# Inclusion projections, an exclusion projection can never be covered
+PROJECTIONS = {
+    schema: {"_id": 0, **{field: 1 for field in returned_fields(schema)}}
+    for schema in SCHEMAS
+}
+
+
+def index_layout(schema: str) -> List[Tuple[str, List[Tuple[str, int]], Dict]]:
+    """
+    The `(name, keys, options)` of the guidUrl indexes in `schema`: one
+    compound index per lookup field, named after its public name, leading
+    with the lookup field and followed by every returned field.
+    `originalUrlKey` is only stored for moved feeds and only indexed where
+    it exists.
+    """
+    layout = []
+    for lookup in LOOKUP_FIELDS:
+        key = field_name(schema, lookup)
+        keys = [(key, 1)] + [
+            (field, 1) for field in returned_fields(schema) if field != key
+        ]
+        options: Dict[str, Any] = {}
+        if lookup == "originalUrlKey":
+            options["partialFilterExpression"] = {key: {"$exists": True}}
+        layout.append((lookup, keys, options))
+    return layout
+
+
+def encode_guid(guid: str | None) -> Binary | str | None:
+    """
+    A GUID in canonical UUID form as BinData subtype 4, anything else (empty
+    or malformed GUIDs) unchanged so it still round trips exactly.
+    """
+    if not guid:
+        return guid
+    try:
+        value = uuid.UUID(guid)
+    except ValueError:
+        return guid
+    if str(value) != guid:
+        return guid
+    return Binary.from_uuid(value, UuidRepresentation.STANDARD)
+
+
+def decode_guid(value: Any) -> Any:
+    if isinstance(value, Binary) and value.subtype == 4:
+        return str(value.as_uuid(UuidRepresentation.STANDARD))
+    return value
+
+
+def query_value(schema: str, field: str, value: Any) -> Any:
+    """
+    A value from the API as it is stored in `schema`
+    """
+    if schema == COMPACT and field == "podcastGuid":
+        return encode_guid(value)
+    return value
+
+
+def lookup_filter(schema: str, field: str, values: List[Any]) -> Dict[str, Any]:
+    """
+    The query for the podcasts whose `field` is any of `values`
+    """
+    stored = [query_value(schema, field, value) for value in values]
+    if len(stored) == 1:
+        return {field_name(schema, field): stored[0]}
+    return {field_name(schema, field): {"$in": stored}}
+
+
+def url_filter(
+    schema: str, urls: List[str], version: int = SCHEMA_VERSION
+) -> Dict[str, Any]:
+    """
+    The query for the podcasts whose `url` or `originalUrl` has the
+    canonical form of any of `urls`. Version 1 documents are matched on
+    their `urlKeys`, and on `url` itself for data imported before
+    `urlKeys` existed.
+    """
+    keys = list(dict.fromkeys(canonical_url(url) for url in urls))
+    if version < 2:
+        return {
+            "$or": [
+                {field_name(schema, "url"): {"$in": urls}},
+                {field_name(schema, "urlKeys"): {"$in": keys}},
+            ]
+        }
+    return {
+        "$or": [
+            {field_name(schema, "urlKey"): {"$in": keys}},
+            {field_name(schema, "originalUrlKey"): {"$in": keys}},
+        ]
+    }
+
+
+def stored_document(
+    schema: str, row: Sequence[Any], timestamp: datetime
+) -> Dict[str, Any]:
+    """
+    The guidUrl document for a row of
+    `podcastGuid, url, originalUrl, id, itunesId` in `schema`
+    """
+    guid, url, original_url, podcast_index_id, itunes_id = row
+    if schema != COMPACT:
+        return {
+            "podcastGuid": guid,
+            "url": url,
+            "originalUrl": original_url,
+            "podcastIndexId": podcast_index_id,
+            "itunesId": itunes_id,
+            "timestamp": timestamp,
+            **url_key_fields(schema, url, original_url),
+        }
+    doc = {"g": encode_guid(guid), "u": url, "i": podcast_index_id}
+    if original_url != url:
+        doc["o"] = NULL_ORIGINAL_URL if original_url is None else original_url
+    if itunes_id is not None:
+        doc["t"] = itunes_id
+    doc.update(url_key_fields(schema, url, original_url))
+    return doc
+
+
+def url_key_fields(
+    schema: str, url: str | None, original_url: str | None
+) -> Dict[str, str]:
+    """
+    The canonical keys of `url` and, when it has a different one,
+    `originalUrl`, see guid_slurp.urls
+    """
+    fields = {}
+    url_key = canonical_url(url) if url else None
+    if url_key:
+        fields[field_name(schema, "urlKey")] = url_key
+    if original_url:
+        original_key = canonical_url(original_url)
+        if original_key != url_key:
+            fields[field_name(schema, "originalUrlKey")] = original_key
+    return fields
+
+
+def public_document(
+    schema: str, doc: Dict[str, Any], timestamp: datetime | None
+) -> Dict[str, Any]:
+    """
+    The document the API returns for a stored guidUrl document. Compact
+    documents get the generation `timestamp` from fileInfo.
+    """
+    if schema != COMPACT:
+        return doc
+    url = doc.get("u")
+    # A covered query returns fields missing from the document as null
+    original_url = doc.get("o")
+    if original_url is None:
+        original_url = url
+    elif original_url is NULL_ORIGINAL_URL:
+        original_url = None
+    return {
+        "podcastGuid": decode_guid(doc.get("g")),
+        "url": url,
+        "originalUrl": original_url,
+        "podcastIndexId": doc.get("i"),
+        "itunesId": doc.get("t"),
+        "timestamp": timestamp,
+    }
@@ -0,0 +1,153 @@
+"""
+Compare the full and compact guidUrl storage schemas on synthetic podcasts.
+
+    python -m guid_slurp.schema_compare --rows 100000
+    python -m guid_slurp.schema_compare --rows 1000000 \\
+        --mongodb mongodb://localhost:27017 --lookups 20000
+
+Without --mongodb the encoded BSON sizes and the cost of converting compact
+documents back to the public shape are compared. With it both
+schemas are loaded into scratch collections, which are dropped afterwards,
+and the collection and index sizes from collStats are reported along with
+the latency of podcastGuid lookups.
+"""
+
+import argparse
+import json
+import random
+from datetime import datetime, timezone
+from statistics import quantiles
+from timeit import default_timer as timer
+from typing import Any, Dict, List, Tuple
+
+import bson
+from pymongo import MongoClient
+
+from guid_slurp.schema import (
+    COMPACT,
+    FULL,
+    PROJECTIONS,
+    SCHEMAS,
+    field_name,
+    index_layout,
+    public_document,
+    query_value,
+    stored_document,
+)
+from guid_slurp.synthetic import synthetic_rows
+
+SCRATCH_DATABASE = "guidSlurpSchemaCompare"
+
+
+def bson_sizes(rows: List[Tuple], timestamp: datetime) -> Dict[str, Any]:
+    sizes = {}
+    for schema in SCHEMAS:
+        total = sum(
+            len(bson.encode(stored_document(schema, row, timestamp))) for row in rows
+        )
+        sizes[schema] = {"total_bytes": total, "avg_bytes": round(total / len(rows), 1)}
+    sizes["compact_ratio"] = round(
+        sizes[COMPACT]["total_bytes"] / sizes[FULL]["total_bytes"], 3
+    )
+    return sizes
+
+
+def edge_conversion(rows: List[Tuple], timestamp: datetime) -> Dict[str, Any]:
+    """
+    Microseconds the API spends turning a stored document into its public
+    shape, the cost the compact schema adds to every lookup
+    """
+    timings = {}
+    for schema in SCHEMAS:
+        projection = PROJECTIONS[schema]
+        docs = [
+            {
+                field: value
+                for field, value in stored_document(schema, row, timestamp).items()
+                if projection.get(field)
+            }
+            for row in rows
+        ]
+        start = timer()
+        for doc in docs:
+            public_document(schema, doc, timestamp)
+        timings[schema] = round((timer() - start) / len(docs) * 1e6, 3)
+    return {"us_per_document": timings}
+
+
+def mongo_comparison(
+    connection: str, rows: List[Tuple], timestamp: datetime, lookups: int
+) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    guids = [row[0] for row in random.Random(2).choices(rows, k=lookups)]
+    with MongoClient(connection) as client:
+        db = client[SCRATCH_DATABASE]
+        try:
+            for schema in SCHEMAS:
+                collection = db[schema]
+                collection.drop()
+                for start in range(0, len(rows), 10000):
+                    collection.insert_many(
+                        [
+                            stored_document(schema, row, timestamp)
+                            for row in rows[start : start + 10000]
+                        ],
+                        ordered=False,
+                    )
+                for name, keys, options in index_layout(schema):
+                    collection.create_index(keys, name=name, **options)
+                stats = db.command("collStats", schema)
+                guid_field = field_name(schema, "podcastGuid")
+                timings = []
+                for guid in guids:
+                    start = timer()
+                    list(
+                        collection.find(
+                            {guid_field: query_value(schema, "podcastGuid", guid)},
+                            PROJECTIONS[schema],
+                        )
+                    )
+                    timings.append((timer() - start) * 1000)
+                cuts = quantiles(timings, n=100)
+                results[schema] = {
+                    "size": stats["size"],
+                    "avgObjSize": stats.get("avgObjSize"),
+                    "storageSize": stats["storageSize"],
+                    "totalIndexSize": stats["totalIndexSize"],
+                    "indexSizes": stats["indexSizes"],
+                    "guid_lookup_ms": {
+                        "p50": round(cuts[49], 3),
+                        "p95": round(cuts[94], 3),
+                        "p99": round(cuts[98], 3),
+                    },
+                }
+        finally:
+            client.drop_database(SCRATCH_DATABASE)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--mongodb", help="MongoDB connection string")
+    parser.add_argument("--lookups", type=int, default=10000)
+    args = parser.parse_args()
+
+    timestamp = datetime.now(timezone.utc)
+    rows = list(synthetic_rows(args.rows))
+    report: Dict[str, Any] = {
+        "rows": args.rows,
+        "bson": bson_sizes(rows, timestamp),
+        "edge_conversion": edge_conversion(rows, timestamp),
+    }
+    if args.mongodb:
+        report["mongodb"] = mongo_comparison(
+            args.mongodb, rows, timestamp, args.lookups
+        )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import json
+import sqlite3
+from hashlib import blake2b
+from typing import Any, Iterator, List, Tuple
+
+# The columns copied into each generation's lookup snapshot, in the order
+# the guidUrl documents are built from
+SNAPSHOT_COLUMNS = "podcastGuid, url, originalUrl, id, itunesId"
+
+
+def row_hash(*values: Any) -> int:
+    """
+    Stable 64 bit hash of a snapshot row, stored in the snapshot's `hash`
+    column so the next import can tell which podcasts changed.
+    """
+    digest = blake2b(json.dumps(values).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+def register_functions(conn: sqlite3.Connection) -> None:
+    conn.create_function("row_hash", 5, row_hash, deterministic=True)
+
+
+def has_hashes(conn: sqlite3.Connection, schema: str = "main") -> bool:
+    """
+    Whether the snapshot attached as `schema` was written with row hashes
+    """
+    columns = conn.execute(f"PRAGMA {schema}.table_info(podcasts)").fetchall()
+    return any(column[1] == "hash" for column in columns)
+
+
+class SnapshotDiff:
+    """
+    The podcasts added, changed and removed between two generations'
+    lookup snapshots, matched by PodcastIndex id and compared by row hash.
+    Use as a context manager, rows are read lazily from SQLite.
+    """
+
+    def __init__(self, snapshot_path: str, previous_path: str):
+        self.conn = sqlite3.connect(f"file:{snapshot_path}?mode=ro", uri=True)
+        self.conn.execute(
+            "ATTACH DATABASE ? AS previous", (f"file:{previous_path}?mode=ro",)
+        )
+
+    def __enter__(self) -> "SnapshotDiff":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.conn.close()
+
+    def usable(self) -> bool:
+        return has_hashes(self.conn) and has_hashes(self.conn, "previous")
+
+    def changed(self, batch_size: int = 1000) -> Iterator[Tuple[bool, Tuple]]:
+        """
+        Yields `(inserted, row)` for every podcast that is new or whose
+        row hash differs, `row` holding SNAPSHOT_COLUMNS.
+        """
+        cursor = self.conn.execute(
+            "SELECT o.id IS NULL, n.podcastGuid, n.url, n.originalUrl, n.id, "
+            "n.itunesId FROM podcasts n "
+            "LEFT JOIN previous.podcasts o ON o.id = n.id "
+            "WHERE o.id IS NULL OR o.hash IS NOT n.hash"
+        )
+        while rows := cursor.fetchmany(batch_size):
+            for row in rows:
+                yield bool(row[0]), row[1:]
+
+    def deleted(self, batch_size: int = 1000) -> Iterator[List[int]]:
+        """
+        Yields batches of the ids of podcasts that are no longer present
+        """
+        cursor = self.conn.execute(
+            "SELECT o.id FROM previous.podcasts o "
+            "LEFT JOIN podcasts n ON n.id = o.id WHERE n.id IS NULL"
+        )
+        while rows := cursor.fetchmany(batch_size):
+            yield [row[0] for row in rows]
@@ -0,0 +1,133 @@
+import multiprocessing
+import sqlite3
+from queue import Empty
+from typing import Any, Iterator, List, Sequence, Tuple
+
+# Map up to this much of the database file instead of reading it through
+# SQLite's page cache
+MMAP_SIZE = 1024 * 1024 * 1024
+# Batches buffered per reader process
+QUEUE_BATCHES = 4
+# How often the consumer checks that the reader processes are still alive
+POLL_SECONDS = 1.0
+
+
+def connect_readonly(path: str) -> sqlite3.Connection:
+    """
+    Open a database that nothing writes to while it is read. `immutable`
+    skips locking and change detection, and the file is memory mapped.
+    """
+    conn = sqlite3.connect(f"file:{path}?mode=ro&immutable=1", uri=True)
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute("PRAGMA query_only = 1")
+    return conn
+
+
+def rowid_ranges(path: str, table: str, partitions: int) -> List[Tuple[int, int]]:
+    """
+    Split the rowids of `table` into up to `partitions` contiguous ranges.
+    MIN and MAX of the rowid are read from the b-tree, not by a scan.
+    """
+    conn = connect_readonly(path)
+    try:
+        low, high = conn.execute(
+            f"SELECT MIN(rowid), MAX(rowid) FROM {table}"
+        ).fetchone()
+    finally:
+        conn.close()
+    if low is None:
+        return []
+    size = max(1, -(-(high - low + 1) // max(1, partitions)))
+    return [
+        (start, min(start + size - 1, high)) for start in range(low, high + 1, size)
+    ]
+
+
+def _read_partition(
+    path: str,
+    query: str,
+    rowids: Tuple[int, int],
+    batch_size: int,
+    queue: multiprocessing.Queue,
+) -> None:
+    count = 0
+    try:
+        conn = connect_readonly(path)
+        try:
+            cursor = conn.execute(query, rowids)
+            while rows := cursor.fetchmany(batch_size):
+                count += len(rows)
+                queue.put(("rows", rows))
+        finally:
+            conn.close()
+    except Exception as ex:
+        queue.put(("error", repr(ex)))
+        return
+    queue.put(("done", count))
+
+
+class PartitionedReader:
+    """
+    Stream the rows of one table of a SQLite file in batches, read in
+    parallel by worker processes that each take a contiguous rowid range.
+    Batches arrive in no particular order.
+
+    `estimated_rows` is known before reading, from the rowid range, and
+    `rows` is the exact count once the reader has been consumed, so the
+    table never needs a separate `COUNT(*)` scan.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        columns: str,
+        table: str = "podcasts",
+        partitions: int = 4,
+        batch_size: int = 1000,
+    ):
+        self.path = path
+        self.query = f"SELECT {columns} FROM {table} WHERE rowid BETWEEN ? AND ?"
+        self.batch_size = batch_size
+        self.ranges = rowid_ranges(path, table, partitions)
+        self.estimated_rows = sum(high - low + 1 for low, high in self.ranges)
+        self.rows = 0
+
+    def __iter__(self) -> Iterator[Sequence[Sequence[Any]]]:
+        if not self.ranges:
+            return
+        # Spawned, not forked: the importer runs threads
+        context = multiprocessing.get_context("spawn")
+        queue = context.Queue(maxsize=QUEUE_BATCHES * len(self.ranges))
+        processes = [
+            context.Process(
+                target=_read_partition,
+                args=(self.path, self.query, rowids, self.batch_size, queue),
+                name=f"sqlite-reader-{number}",
+                daemon=True,
+            )
+            for number, rowids in enumerate(self.ranges)
+        ]
+        for process in processes:
+            process.start()
+        try:
+            running = len(processes)
+            while running:
+                try:
+                    kind, value = queue.get(timeout=POLL_SECONDS)
+                except Empty:
+                    if not any(process.is_alive() for process in processes):
+                        raise RuntimeError("SQLite reader processes exited early")
+                    continue
+                if kind == "rows":
+                    yield value
+                elif kind == "done":
+                    self.rows += value
+                    running -= 1
+                else:
+                    raise RuntimeError(f"SQLite reader failed: {value}")
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                process.join()
+            queue.close()
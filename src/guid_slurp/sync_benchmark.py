@@ -0,0 +1,273 @@
+"""
+Benchmark the import of the PodcastIndex dump end to end, offline.
+
+    python -m guid_slurp.sync_benchmark --rows 1000000 \\
+        --mongodb mongodb://127.0.0.1:27017 --output sync.json
+
+A synthetic dump (see guid_slurp.synthetic) is packed like the real one and
+served by a local HTTP stand-in for public.podcastindex.org with the same
+etag, Last-Modified and Range handling. database_sync then imports it the
+way the importer service does: download, untar_file, create_database and
+finish_database_import, into a scratch database of the given MongoDB that
+is dropped afterwards. With `--update-share` a second dump, with that share
+of the podcasts changed, is imported next to measure an update the way the
+importer sees every few hours. The report printed (and written to --output)
+holds the import telemetry of every run; the same arguments import the
+same dumps, so reports can be compared across commits.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import uuid
+from datetime import datetime, timezone
+from email.utils import formatdate
+from hashlib import md5
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from timeit import default_timer as timer
+from typing import Any, Dict, Tuple
+
+from pymongo import MongoClient
+
+from guid_slurp import database_sync
+from guid_slurp.benchmark import configured, git_commit
+from guid_slurp.synthetic import (
+    synthetic_rows,
+    updated_rows,
+    write_archive,
+    write_dump,
+)
+
+COPY_CHUNK = 1024 * 1024
+
+
+class ArchiveServer:
+    """
+    Serves one file at `/podcastindex_feeds.db.tgz` the way
+    public.podcastindex.org does: an MD5 etag, `If-None-Match` for the
+    importer's check, and `Range` with `If-Range` to resume a download.
+    `publish` swaps in a new file, as a new dump would.
+    """
+
+    def __init__(self):
+        self.path: str | None = None
+        self.etag = ""
+        self.last_modified = ""
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self.handler())
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.url = (
+            f"http://127.0.0.1:{self.httpd.server_address[1]}/"
+            f"{database_sync.DOWNLOAD_FILENAME}"
+        )
+
+    def publish(self, path: str) -> None:
+        digest = md5()
+        with open(path, "rb") as f:
+            while chunk := f.read(COPY_CHUNK):
+                digest.update(chunk)
+        self.path = path
+        self.etag = f'"{digest.hexdigest()}"'
+        self.last_modified = formatdate(os.path.getmtime(path), usegmt=True)
+
+    def handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_HEAD(self):
+                self.respond(send_body=False)
+
+            def do_GET(self):
+                self.respond(send_body=True)
+
+            def respond(self, send_body: bool):
+                if (
+                    server.path is None
+                    or self.path != f"/{os.path.basename(server.url)}"
+                ):
+                    self.send_error(404)
+                    return
+                if self.headers.get("If-None-Match") == server.etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                size = os.path.getsize(server.path)
+                start = 0
+                range_header = self.headers.get("Range")
+                if_range = self.headers.get("If-Range")
+                if range_header and if_range in (None, server.etag):
+                    start = int(range_header.removeprefix("bytes=").rstrip("-"))
+                    if start >= size:
+                        self.send_response(416)
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header(
+                        "Content-Range", f"bytes {start}-{size - 1}/{size}"
+                    )
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Length", str(size - start))
+                self.send_header("etag", server.etag)
+                self.send_header("Last-Modified", server.last_modified)
+                self.end_headers()
+                if send_body:
+                    with open(server.path, "rb") as f:
+                        f.seek(start)
+                        shutil.copyfileobj(f, self.wfile, COPY_CHUNK)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self) -> "ArchiveServer":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def build_archive(directory: str, rows, seed: int) -> Tuple[str, Dict[str, Any]]:
+    """
+    Write `rows` as a dump and its archive in `directory`. Returns the
+    archive's path and the dump's size.
+    """
+    os.makedirs(directory, exist_ok=True)
+    start = timer()
+    db_path = os.path.join(directory, os.path.basename(database_sync.DB_MEMBER))
+    podcasts = write_dump(db_path, rows, seed)
+    archive_path = os.path.join(directory, database_sync.DOWNLOAD_FILENAME)
+    write_archive(db_path, archive_path, database_sync.DB_MEMBER)
+    dump = {
+        "rows": podcasts,
+        "db_bytes": os.path.getsize(db_path),
+        "archive_bytes": os.path.getsize(archive_path),
+        "build_seconds": round(timer() - start, 3),
+    }
+    os.remove(db_path)
+    return archive_path, dump
+
+
+def import_dump() -> Dict[str, Any]:
+    """
+    Run the importer once and return the telemetry it stored with the
+    generation's fileInfo record
+    """
+    start = timer()
+    asyncio.run(database_sync.startup_import())
+    seconds = timer() - start
+    file_info = database_sync.check_database_fileinfo() or {}
+    telemetry = file_info.get("importTelemetry")
+    if telemetry is None:
+        raise RuntimeError("The import did not complete, see the importer's log")
+    phases = {phase["name"]: phase for phase in telemetry["phases"]}
+    rows = phases["read"]["rows"]
+    return {
+        "etag": file_info.get("etag"),
+        "mode": phases["insert"].get("mode"),
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(rows / seconds, 1) if seconds else None,
+        "phases": telemetry["phases"],
+    }
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    report: Dict[str, Any] = {
+        "commit": git_commit(),
+        "started": datetime.now(timezone.utc).isoformat(),
+        "host": {"cpus": os.cpu_count(), "python": sys.version.split()[0]},
+        # The connection string may hold credentials
+        "config": {**vars(args), "mongodb": None},
+        "runs": [],
+    }
+    database = f"syncBenchmark_{uuid.uuid4().hex[:8]}"
+    with tempfile.TemporaryDirectory() as scratch, ArchiveServer() as server:
+        directory = os.path.join(scratch, "podcastindex")
+        os.makedirs(directory)
+        dumps = [synthetic_rows(args.rows, args.seed, args.duplicate_rate)]
+        if args.update_share:
+            dumps.append(
+                updated_rows(
+                    synthetic_rows(args.rows, args.seed, args.duplicate_rate),
+                    args.update_share,
+                    args.seed,
+                )
+            )
+        with configured(
+            MONGODB_CONNECTION=args.mongodb,
+            MONGODB_DATABASE=database,
+            DIRECTORY=directory,
+            DOWNLOAD_URL=server.url,
+            DOWNLOAD_PATH=os.path.join(directory, database_sync.DOWNLOAD_FILENAME),
+            UNTAR_PATH=os.path.join(directory, "podcastindex_feeds.db"),
+            CSV_PATH=os.path.join(directory, "podcasts.csv"),
+            DOWNLOAD_MODE=args.download_mode,
+        ):
+            try:
+                for number, rows in enumerate(dumps):
+                    archive, dump = build_archive(
+                        os.path.join(scratch, f"dump{number}"), rows, args.seed
+                    )
+                    server.publish(archive)
+                    report["runs"].append({"dump": dump, **import_dump()})
+                    os.remove(archive)
+            finally:
+                with MongoClient(args.mongodb) as client:
+                    client.drop_database(database)
+    return report
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument(
+        "--duplicate-rate",
+        type=float,
+        default=0.02,
+        help="Share of podcasts reusing an earlier podcast's GUID",
+    )
+    parser.add_argument(
+        "--mongodb",
+        default=os.getenv("MONGODB_CONNECTION", "mongodb://127.0.0.1:27017"),
+        help="MongoDB to import into, a scratch database is created and dropped",
+    )
+    parser.add_argument(
+        "--download-mode",
+        choices=("stream", "file"),
+        default=database_sync.DOWNLOAD_MODE,
+        help="Extract the database while downloading, or afterwards",
+    )
+    parser.add_argument(
+        "--update-share",
+        type=float,
+        default=0.01,
+        help="Share of podcasts changed in a second dump, 0 imports only one",
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+
+    report = run(args)
+    text = json.dumps(report, indent=2, default=str)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
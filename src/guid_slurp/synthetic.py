@@ -0,0 +1,309 @@
+"""
+Synthetic podcasts shaped like the PodcastIndex dump, for benchmarks.
+
+    python -m guid_slurp.synthetic --rows 4000000 --output /tmp/dump
+
+writes `podcastindex_feeds.db` and `podcastindex_feeds.db.tgz` of any size
+without downloading the real dump. Feed hosts follow a Zipfian popularity,
+a few big hosting platforms and a long tail of self hosted feeds, some
+feeds moved since they were first listed, and GUIDs shared by several
+feeds form groups of heavy tailed sizes, the shapes the importer and the
+duplicates report see in the real dump.
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import tarfile
+import uuid
+from array import array
+from itertools import accumulate
+from typing import Iterable, Iterator, Tuple
+
+# Hosting platforms serving a large share of all feeds, most popular first
+PLATFORMS = (
+    "anchor.fm/s",
+    "feeds.buzzsprout.com",
+    "feeds.megaphone.fm",
+    "feeds.simplecast.com",
+    "feed.podbean.com",
+    "rss.art19.com",
+    "feeds.libsyn.com",
+    "feeds.soundcloud.com/users/soundcloud:users",
+    "feeds.transistor.fm",
+    "feeds.captivate.fm",
+)
+SELF_HOSTED = 20000
+HOST_SKEW = 1.2
+LANGUAGES = ("en", "en-us", "es", "de", "fr", "pt-br", "it", "nl", "ja", "sv")
+CATEGORIES = (
+    "Society",
+    "Culture",
+    "Education",
+    "Business",
+    "Comedy",
+    "Religion",
+    "Spirituality",
+    "News",
+    "Arts",
+    "Music",
+    "Technology",
+    "Sports",
+    "Health",
+    "Fitness",
+    "History",
+)
+GENERATORS = (
+    "Anchor Podcasts",
+    "Buzzsprout (https://www.buzzsprout.com)",
+    "Libsyn WebEngine 2.0",
+    "PodBean.com",
+    "Transistor (https://transistor.fm)",
+    "WordPress",
+)
+WORDS = (
+    "the show about life business stories conversations with friends weekly "
+    "interviews news music faith history true crime comedy sports episode "
+    "podcast hosted every new talk people culture tech ideas and of in for"
+).split()
+
+PODCASTS_TABLE = (
+    "CREATE TABLE podcasts (id INTEGER PRIMARY KEY, url TEXT NOT NULL UNIQUE, "
+    "title TEXT NOT NULL, lastUpdate INTEGER, link TEXT NOT NULL, "
+    "lastHttpStatus INTEGER, dead INTEGER, contentType TEXT, itunesId INTEGER, "
+    "originalUrl TEXT, itunesAuthor TEXT, itunesOwnerName TEXT, explicit INTEGER, "
+    "imageUrl TEXT, itunesType TEXT, generator TEXT, newestItemPubdate INTEGER, "
+    "language TEXT, oldestItemPubdate INTEGER, episodeCount INTEGER, "
+    "popularityScore INTEGER, priority INTEGER, createdOn INTEGER, "
+    "updateFrequency INTEGER, chash TEXT, host TEXT, newestEnclosureUrl TEXT, "
+    "podcastGuid TEXT, description TEXT, category1 TEXT, category2 TEXT, "
+    "category3 TEXT, category4 TEXT, category5 TEXT, category6 TEXT, "
+    "category7 TEXT, category8 TEXT, category9 TEXT, category10 TEXT, "
+    "newestEnclosureDuration INTEGER)"
+)
+PODCASTS_COLUMNS = (
+    "podcastGuid, url, originalUrl, id, itunesId, title, lastUpdate, link, "
+    "lastHttpStatus, dead, contentType, itunesAuthor, itunesOwnerName, explicit, "
+    "imageUrl, itunesType, generator, newestItemPubdate, language, "
+    "oldestItemPubdate, episodeCount, popularityScore, priority, createdOn, "
+    "updateFrequency, chash, host, newestEnclosureUrl, description, category1, "
+    "category2, newestEnclosureDuration"
+)
+# 2024-03-01, the dump's timestamps are a few years before it
+DUMP_TIME = 1709251200
+
+
+def host_weights() -> list:
+    """
+    Cumulative weights of the hosts: the platforms, then the self hosted
+    feeds, by the Zipfian rank of their popularity
+    """
+    return list(
+        accumulate(
+            1 / rank**HOST_SKEW for rank in range(1, len(PLATFORMS) + SELF_HOSTED + 1)
+        )
+    )
+
+
+def feed_url(rng: random.Random, rank: int, podcast_index_id: int) -> str:
+    """
+    The feed of podcast `podcast_index_id` on the host of popularity `rank`
+    """
+    scheme = "https" if rng.random() < 0.85 else "http"
+    if rank < len(PLATFORMS):
+        return f"{scheme}://{PLATFORMS[rank]}/{podcast_index_id:x}/rss"
+    host = f"podcast{rank - len(PLATFORMS)}.example.com"
+    path = rng.choice(("feed", "rss", "feed.xml", "podcast.rss", "?format=rss"))
+    return f"{scheme}://{host}/{podcast_index_id}/{path}"
+
+
+def synthetic_rows(
+    count: int, seed: int = 1, duplicate_rate: float = 0.0
+) -> Iterator[Tuple]:
+    """
+    Rows of `podcastGuid, url, originalUrl, id, itunesId` with UUIDv5 GUIDs.
+    About 12% of the feeds moved since they were listed: most to https or
+    another path on the same host, some to another host altogether, the
+    originalUrl keeping where they were. About half have an iTunes id.
+
+    A `duplicate_rate` share of the podcasts reuse the GUID of an earlier
+    one, the same show listed again under another feed. Half of them join
+    a group of duplicates picked in proportion to its size, so the groups
+    already large keep growing, which gives many pairs and a few groups of
+    dozens like the real dump. Only the id of each group's first podcast is
+    kept, four bytes per podcast.
+    """
+    rng = random.Random(seed)
+    weights = host_weights()
+    ranks = range(len(weights))
+    first_ids = array("I")
+    shared = array("I")
+    for podcast_index_id in range(1, count + 1):
+        (rank,) = rng.choices(ranks, cum_weights=weights)
+        url = feed_url(rng, rank, podcast_index_id)
+        moved = rng.random()
+        if moved < 0.08:
+            original_url = url.replace("https://", "http://", 1)
+            if original_url == url:
+                original_url = f"{url}/"
+        elif moved < 0.12:
+            original_url = f"http://old-feeds.example.net/{podcast_index_id}.xml"
+        else:
+            original_url = url
+        itunes_id = rng.randrange(10**8, 2 * 10**9) if rng.random() < 0.5 else None
+        if duplicate_rate and first_ids and rng.random() < duplicate_rate:
+            if shared and rng.random() < 0.5:
+                first_id = shared[rng.randrange(len(shared))]
+            else:
+                first_id = first_ids[rng.randrange(len(first_ids))]
+            shared.append(first_id)
+        else:
+            first_id = podcast_index_id
+        if duplicate_rate:
+            first_ids.append(first_id)
+        guid = str(uuid.uuid5(uuid.NAMESPACE_URL, f"podcast/{seed}/{first_id}"))
+        yield guid, url, original_url, podcast_index_id, itunes_id
+
+
+def updated_rows(rows: Iterable[Tuple], share: float, seed: int = 1) -> Iterator[Tuple]:
+    """
+    `rows` as a later dump lists them: a `share` of the podcasts changed,
+    moved to a new feed URL or matched to another iTunes id, a tenth of
+    that share removed, and as many new podcasts added after the last id
+    """
+    rng = random.Random(seed)
+    last_id = 0
+    added = 0
+    for guid, url, original_url, podcast_index_id, itunes_id in rows:
+        last_id = max(last_id, podcast_index_id)
+        change = rng.random()
+        if change < share * 0.1:
+            added += 1
+            continue
+        if change < share * 0.6:
+            original_url, url = url, f"https://moved.example.org/{podcast_index_id}"
+        elif change < share:
+            itunes_id = rng.randrange(10**8, 2 * 10**9)
+        yield guid, url, original_url, podcast_index_id, itunes_id
+    for podcast_index_id in range(last_id + 1, last_id + added + 1):
+        url = f"https://feeds.buzzsprout.com/{podcast_index_id:x}/rss"
+        guid = str(uuid.uuid5(uuid.NAMESPACE_URL, f"podcast/{seed}/{podcast_index_id}"))
+        yield guid, url, url, podcast_index_id, None
+
+
+def dump_rows(rows: Iterable[Tuple], seed: int) -> Iterator[Tuple]:
+    """
+    `rows` with the other columns of the podcasts table filled in, so the
+    file has the size and compressibility of the real dump
+    """
+    rng = random.Random(seed)
+    for guid, url, original_url, podcast_index_id, itunes_id in rows:
+        host = url.split("/", 3)[2]
+        title = " ".join(rng.choices(WORDS, k=rng.randint(2, 6))).title()
+        description = " ".join(rng.choices(WORDS, k=rng.randint(0, 90)))
+        created = DUMP_TIME - rng.randrange(10 * 365 * 86400)
+        newest = rng.randrange(created, DUMP_TIME)
+        yield (
+            guid,
+            url,
+            original_url,
+            podcast_index_id,
+            itunes_id,
+            title,
+            newest,
+            f"https://{host}",
+            rng.choice((200, 200, 200, 200, 301, 404, 500)),
+            int(rng.random() < 0.05),
+            "application/rss+xml",
+            title,
+            title,
+            int(rng.random() < 0.1),
+            f"https://{host}/{podcast_index_id}/cover.jpg",
+            rng.choice(("episodic", "episodic", "serial")),
+            rng.choice(GENERATORS),
+            newest,
+            rng.choice(LANGUAGES),
+            rng.randrange(created - 86400, newest + 1),
+            int(rng.paretovariate(1.2)),
+            rng.randrange(10),
+            rng.randrange(-1, 6),
+            created,
+            rng.randrange(10),
+            uuid.UUID(int=rng.getrandbits(128)).hex,
+            host,
+            f"https://{host}/{podcast_index_id}/episode.mp3",
+            description,
+            rng.choice(CATEGORIES),
+            rng.choice(CATEGORIES),
+            rng.randrange(60, 7200),
+        )
+
+
+def write_dump(path: str, rows: Iterable[Tuple], seed: int = 1) -> int:
+    """
+    Write `rows` as the podcasts table of a SQLite file laid out like the
+    PodcastIndex dump. Returns the number of podcasts written.
+    """
+    placeholders = ", ".join("?" * len(PODCASTS_COLUMNS.split(", ")))
+    written = 0
+
+    def counted(rows: Iterable[Tuple]) -> Iterator[Tuple]:
+        nonlocal written
+        for row in rows:
+            written += 1
+            yield row
+
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute(PODCASTS_TABLE)
+        conn.executemany(
+            f"INSERT INTO podcasts ({PODCASTS_COLUMNS}) VALUES ({placeholders})",
+            counted(dump_rows(rows, seed)),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return written
+
+
+def write_archive(db_path: str, archive_path: str, member: str) -> None:
+    """
+    Pack `db_path` as `member` of a gzipped tar file like the one
+    public.podcastindex.org serves
+    """
+    with tarfile.open(archive_path, "w:gz", compresslevel=6) as tar:
+        tar.add(db_path, arcname=member)
+
+
+def main() -> None:
+    from guid_slurp.database_sync import DB_MEMBER, DOWNLOAD_FILENAME
+
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument(
+        "--duplicate-rate",
+        type=float,
+        default=0.02,
+        help="Share of podcasts reusing an earlier podcast's GUID",
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default=".", help="Directory written to")
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    db_path = os.path.join(args.output, os.path.basename(DB_MEMBER))
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    rows = synthetic_rows(args.rows, args.seed, args.duplicate_rate)
+    write_dump(db_path, rows, args.seed)
+    archive_path = os.path.join(args.output, DOWNLOAD_FILENAME)
+    write_archive(db_path, archive_path, DB_MEMBER)
+    for path in (db_path, archive_path):
+        print(f"{path}: {os.path.getsize(path):,} bytes")
+
+
+if __name__ == "__main__":
+    main()
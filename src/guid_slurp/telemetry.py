@@ -0,0 +1,82 @@
+import resource
+import sys
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from time import perf_counter
+from typing import Any, Dict, Iterator, List
+
+
+def peak_rss_bytes() -> int:
+    """
+    Peak resident set size of this process and of its finished children,
+    such as the SQLite reader processes
+    """
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return scale * max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+
+
+class ImportTelemetry:
+    """
+    Structured timings for the phases of one import, stored with the
+    generation's fileInfo record so imports can be compared across dumps
+    and machines.
+
+    Each phase records its duration, the bytes and rows it handled when
+    set by the caller, rows per second and the peak RSS so far. With
+    `trace_memory` the peak Python allocation within the phase is also
+    recorded through tracemalloc, which slows the import down noticeably.
+    """
+
+    def __init__(self, trace_memory: bool = False):
+        self.started = datetime.now(timezone.utc)
+        self.trace_memory = trace_memory
+        self.phases: List[Dict[str, Any]] = []
+        self._start = perf_counter()
+        self._started_tracing = trace_memory and not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[Dict[str, Any]]:
+        """
+        Time the block as phase `name`. The caller can set "bytes", "rows"
+        or any other detail on the yielded record.
+        """
+        record: Dict[str, Any] = {"name": name, "bytes": None, "rows": None}
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start = perf_counter()
+        try:
+            yield record
+        finally:
+            seconds = perf_counter() - start
+            record["seconds"] = round(seconds, 3)
+            record["rows_per_second"] = (
+                round(record["rows"] / seconds, 1)
+                if record["rows"] is not None and seconds
+                else None
+            )
+            record["peak_rss_bytes"] = peak_rss_bytes()
+            if self.trace_memory:
+                record["peak_traced_bytes"] = tracemalloc.get_traced_memory()[1]
+            self.phases.append(record)
+
+    def finish(self) -> None:
+        """
+        Stop tracemalloc if this import started it
+        """
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "started": self.started,
+            "seconds": round(perf_counter() - self._start, 3),
+            "phases": self.phases,
+        }
@@ -0,0 +1,148 @@
+"""
+Per request timing spans, sent to clients as a `Server-Timing` header.
+
+The middleware starts a `RequestTiming` for every request and code on the
+resolver path wraps its steps in `span()`. The spans end up in the header,
+for example
+
+    Server-Timing: validate;dur=0.412, cache;desc="miss",
+        db;desc="mongo";dur=3.127, serialize;dur=0.088, total;dur=3.801
+
+which browser developer tools and `curl -i` show without any extra
+tooling. Outside a request `span()` does nothing.
+"""
+
+import heapq
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from timeit import default_timer as timer
+from typing import Iterator, List, Tuple
+
+# name, description, milliseconds or None for a span without a duration
+Span = Tuple[str, str | None, float | None]
+
+
+class RequestTiming:
+    """
+    The spans recorded while answering one request
+    """
+
+    def __init__(self):
+        self.start = timer()
+        self.spans: List[Span] = []
+        self.validated = False
+
+    def add(self, name: str, desc: str | None = None, ms: float | None = None):
+        self.spans.append((name, desc, ms))
+
+    def end_validation(self) -> None:
+        """
+        Mark the moment the route function starts: everything before it,
+        routing and FastAPI's parsing and validation of the parameters, is
+        the `validate` span
+        """
+        if not self.validated:
+            self.validated = True
+            self.spans.insert(0, ("validate", None, (timer() - self.start) * 1000))
+
+    def total_ms(self) -> float:
+        return (timer() - self.start) * 1000
+
+    def header(self, total_ms: float) -> str:
+        """
+        The `Server-Timing` header value, spans in the order they were
+        recorded followed by the total
+        """
+        metrics = []
+        for name, desc, ms in self.spans + [("total", None, total_ms)]:
+            metric = name
+            if desc is not None:
+                metric += f';desc="{desc}"'
+            if ms is not None:
+                metric += f";dur={ms:.3f}"
+            metrics.append(metric)
+        return ", ".join(metrics)
+
+
+current_timing: ContextVar[RequestTiming | None] = ContextVar(
+    "current_timing", default=None
+)
+
+
+def start_request() -> RequestTiming:
+    """
+    Start timing a request, visible to `span()` in the tasks it spawns
+    """
+    timing = RequestTiming()
+    current_timing.set(timing)
+    return timing
+
+
+def end_validation() -> None:
+    timing = current_timing.get()
+    if timing is not None:
+        timing.end_validation()
+
+
+def note(name: str, desc: str) -> None:
+    """
+    Record a span without a duration, such as whether the cache was hit
+    """
+    timing = current_timing.get()
+    if timing is not None:
+        timing.add(name, desc)
+
+
+@contextmanager
+def span(name: str, desc: str | None = None) -> Iterator[None]:
+    """
+    Record the time spent in the block as span `name`
+    """
+    timing = current_timing.get()
+    if timing is None:
+        yield
+        return
+    start = timer()
+    try:
+        yield
+    finally:
+        timing.add(name, desc, (timer() - start) * 1000)
+
+
+class SlowRequestLog:
+    """
+    Keeps the `top` slowest requests of every `interval` seconds and logs
+    them, with their spans, when the interval is over. One per worker.
+    """
+
+    def __init__(self, top: int, interval: float):
+        self.top = top
+        self.interval = interval
+        self.window_start = timer()
+        self.slowest: List[Tuple[float, int, str]] = []
+        self.count = 0
+
+    def record(self, total_ms: float, description: str) -> None:
+        now = timer()
+        if now - self.window_start >= self.interval:
+            self.flush()
+            self.window_start = now
+        self.count += 1
+        entry = (total_ms, self.count, description)
+        if len(self.slowest) < self.top:
+            heapq.heappush(self.slowest, entry)
+        elif total_ms > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def flush(self) -> None:
+        if not self.slowest:
+            return
+        logging.info(
+            f"Slowest {len(self.slowest)} of {self.count} requests "
+            f"in the last {self.interval:.0f}s"
+        )
+        for total_ms, _, description in sorted(self.slowest, reverse=True):
+            logging.info(f"Slow request {total_ms:.3f}ms {description}")
+        self.slowest = []
+        self.count = 0
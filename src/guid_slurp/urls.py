@@ -0,0 +1,49 @@
+from typing import Any, Dict, List
+from urllib.parse import urlsplit
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def canonical_url(url: str) -> str:
+    """
+    Normalised form of a feed URL used to match variants of the same feed.
+    The scheme is dropped, the host lowercased and default ports, fragments
+    and trailing slashes removed. Path and query keep their case.
+
+    `http://Feed.Example.com:80/rss/` and `https://feed.example.com/rss`
+    both become `feed.example.com/rss`.
+    """
+    url = url.strip()
+    try:
+        parts = urlsplit(url if "://" in url else f"//{url}")
+        port = parts.port
+    except ValueError:
+        return url.lower()
+    netloc = (parts.hostname or "").rstrip(".")
+    if port and port != DEFAULT_PORTS.get(parts.scheme.lower()):
+        netloc = f"{netloc}:{port}"
+    key = netloc + parts.path.rstrip("/")
+    if parts.query:
+        key = f"{key}?{parts.query}"
+    return key
+
+
+def url_keys(*urls: str | None) -> List[str]:
+    """
+    The distinct canonical keys of a podcast's `url` and `originalUrl`
+    """
+    keys: List[str] = []
+    for url in urls:
+        if url:
+            key = canonical_url(url)
+            if key not in keys:
+                keys.append(key)
+    return keys
+
+
+def exact_first(documents: List[Dict[str, Any]], url: str) -> List[Dict[str, Any]]:
+    """
+    Order URL lookup results so documents whose `url` is exactly the URL
+    asked for come first, keeping the existing order otherwise.
+    """
+    return sorted(documents, key=lambda doc: doc.get("url") != url)
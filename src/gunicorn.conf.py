@@ -0,0 +1,30 @@
+"""
+Gunicorn settings for the API, read from the working directory (/app in
+the image). They keep the Prometheus metrics of all workers in
+PROMETHEUS_MULTIPROC_DIR, see guid_slurp.metrics.
+"""
+
+import os
+import shutil
+
+from prometheus_client import multiprocess
+
+
+def on_starting(server):
+    """
+    Start from an empty metrics directory, files left by a previous run
+    would be added to this one's counts
+    """
+    path = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+
+
+def child_exit(server, worker):
+    """
+    Drop the in flight gauges of a worker that exited, its counters and
+    histograms stay in the totals
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(worker.pid)
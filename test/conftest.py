@@ -0,0 +1,72 @@
+import sqlite3
+
+import pytest
+
+from guid_slurp import main
+
+PODCASTS = [
+    (
+        "856cd618-7f34-57ea-9b84-3600f1f65e7f",
+        "http://feed.nashownotes.com/rss.xml",
+        "http://feed.nashownotes.com/rss.xml",
+        41504,
+        269169796,
+    ),
+    (
+        "856cd618-7f34-57ea-9b84-3600f1f65e7f",
+        "https://noagendalite.glump.net/noagendalite.rss",
+        "https://noagendalite.glump.net/noagendalite.rss",
+        3756449,
+        None,
+    ),
+    (
+        "917393e3-1b1e-5cef-ace4-edaa54e1f810",
+        "https://podnews.net/rss",
+        "https://podnews.net/rss",
+        920666,
+        1244054180,
+    ),
+]
+
+
+@pytest.fixture
+def podcast_dump(tmp_path):
+    """
+    A tiny SQLite file with the same podcasts table as the PodcastIndex dump
+    """
+    path = tmp_path / "podcastindex_feeds.db"
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE podcasts (id INTEGER PRIMARY KEY, url TEXT, title TEXT, "
+        "originalUrl TEXT, itunesId INTEGER, podcastGuid TEXT)"
+    )
+    conn.executemany(
+        "INSERT INTO podcasts (podcastGuid, url, originalUrl, id, itunesId, title) "
+        "VALUES (?, ?, ?, ?, ?, 'title')",
+        PODCASTS,
+    )
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture(autouse=True)
+def reset_response_cache(monkeypatch, tmp_path):
+    """
+    Every test starts with an empty resolver cache, an unknown generation
+    and an empty data directory
+    """
+    monkeypatch.setattr(main, "DIRECTORY", str(tmp_path))
+    main.response_cache.clear()
+    monkeypatch.setattr(main, "dataset_generation", None)
+    monkeypatch.setattr(main, "dataset_last_modified", None)
+    monkeypatch.setattr(main, "dataset_generation_checked", None)
+    monkeypatch.setattr(main, "dataset_schema", "full")
+    monkeypatch.setattr(main, "dataset_schema_version", main.SCHEMA_VERSION)
+    monkeypatch.setattr(main, "published_generation", None)
+    monkeypatch.setattr(main, "published_generation_checked", None)
+    monkeypatch.setattr(main, "bloom_filters", None)
+    monkeypatch.setattr(main, "bloom_filters_failed", None)
+    monkeypatch.setattr(
+        main, "bloom_lookups", {"absent": 0, "present": 0, "false_positive": 0}
+    )
@@ -1,11 +1,18 @@
 import json
+from datetime import datetime
 from unittest.mock import patch
 
 from fastapi.testclient import TestClient
 from mongomock import MongoClient
+from mongomock_motor import AsyncMongoMockClient
 
-from guid_slurp.main import app  # Replace with your actual imports
-from guid_slurp.database_sync import MONGODB_COLLECTION, MONGODB_DATABASE
+from guid_slurp.main import app, response_cache  # Replace with your actual imports
+from guid_slurp.database_sync import (
+    MONGODB_COLLECTION,
+    MONGODB_DATABASE,
+    MONGODB_DUPLICATES,
+)
+from guid_slurp.urls import url_keys
 
 client = TestClient(app)
 
@@ -22,13 +29,13 @@ def setup_mongo_mock():
 
     mock_collection.insert_many(mock_collection_data)
 
-    return mock_mongo_client, mock_collection
+    return AsyncMongoMockClient(mock_mongo_client=mock_mongo_client), mock_collection
 
 
 def test_resolve_root():
     mock_mongo_client, mock_collection = setup_mongo_mock()
 
-    with patch("guid_slurp.main.MongoClient") as mock:
+    with patch("guid_slurp.main.get_mongo_client") as mock:
         mock.return_value = mock_mongo_client
         # Valid URL test
         response = client.get("/?guid=856cd618-7f34-57ea-9b84-3600f1f65e7f")
@@ -66,7 +73,7 @@ def test_resolve_guid():
 
     # Patch MongoClient
     with patch(
-        "guid_slurp.main.MongoClient"
+        "guid_slurp.main.get_mongo_client"
     ) as mock:  # Replace 'your_app' with the module where MongoClient is imported
         mock.return_value = mock_mongo_client
         # Valid URL test
@@ -94,7 +101,7 @@ def test_resolve_url():
 
     # Patch MongoClient
     with patch(
-        "guid_slurp.main.MongoClient"
+        "guid_slurp.main.get_mongo_client"
     ) as mock:  # Replace 'your_app' with the module where MongoClient is imported
         mock.return_value = mock_mongo_client
         # Valid URL test
@@ -122,7 +129,7 @@ def test_resolve_itunesId():
 
     # Patch MongoClient
     with patch(
-        "guid_slurp.main.MongoClient"
+        "guid_slurp.main.get_mongo_client"
     ) as mock:  # Replace 'your_app' with the module where MongoClient is imported
         mock.return_value = mock_mongo_client
         # Valid URL test
@@ -142,3 +149,225 @@ def test_resolve_itunesId():
         response = client.get("/itunesId/9999999")
         assert response.status_code == 404
         assert response.json() == {"detail": "Item not found"}
+
+
+def test_resolve_batch():
+    mock_mongo_client, mock_collection = setup_mongo_mock()
+
+    with patch("guid_slurp.main.get_mongo_client") as mock:
+        mock.return_value = mock_mongo_client
+        response = client.post(
+            "/batch/",
+            json={
+                "guid": [
+                    "856cd618-7f34-57ea-9b84-3600f1f65e7f",
+                    "1a4e9748-4296-5a32-b017-bd36bb47e17d",
+                ],
+                "url": ["http://feed.nashownotes.com/rss.xml", "not-a-valid-url"],
+                "itunesId": [269169796],
+                "podcastIndexId": [3756449, 9999999],
+            },
+        )
+        assert response.status_code == 200
+        json_resp = response.json()
+        guids = json_resp["guid"]
+        assert len(guids["856cd618-7f34-57ea-9b84-3600f1f65e7f"]) == 2
+        assert guids["1a4e9748-4296-5a32-b017-bd36bb47e17d"] == {
+            "detail": "Item not found"
+        }
+        urls = json_resp["url"]
+        assert (
+            urls["http://feed.nashownotes.com/rss.xml"][0].get("podcastGuid")
+            == "856cd618-7f34-57ea-9b84-3600f1f65e7f"
+        )
+        assert urls["not-a-valid-url"] == {"detail": "Item not found"}
+        assert json_resp["itunesId"]["269169796"][0].get("podcastIndexId") == 41504
+        podcast_ids = json_resp["podcastIndexId"]
+        assert (
+            podcast_ids["3756449"][0].get("url")
+            == "https://noagendalite.glump.net/noagendalite.rss"
+        )
+        assert podcast_ids["9999999"] == {"detail": "Item not found"}
+
+        # Nothing found anywhere is still a 200
+        mock_collection.delete_many({})
+        response = client.post("/batch/", json={"itunesId": [12345]})
+        assert response.status_code == 200
+        assert response.json() == {"itunesId": {"12345": {"detail": "Item not found"}}}
+
+        # Oversized batches are rejected
+        response = client.post("/batch/", json={"itunesId": list(range(1, 1002))})
+        assert response.status_code == 422
+
+
+def test_conditional_get():
+    mock_mongo_client, mock_collection = setup_mongo_mock()
+    mock_collection.database["fileInfo"].insert_one(
+        {"etag": '"65e3f0a1-59b1c3a0"', "timestamp": datetime(2024, 3, 3, 7, 16, 1)}
+    )
+
+    with patch("guid_slurp.main.get_mongo_client") as mock:
+        mock.return_value = mock_mongo_client
+        response = client.get("/podcastIndexId/41504")
+        assert response.status_code == 200
+        etag = response.headers["ETag"]
+        assert etag.startswith('"') and etag.endswith('"')
+        assert response.headers["Last-Modified"] == "Sun, 03 Mar 2024 07:16:01 GMT"
+        assert response.headers["Cache-Control"].startswith("public, max-age=")
+
+        # Each lookup key has its own ETag
+        other = client.get("/itunesId/269169796")
+        assert other.headers["ETag"] != etag
+
+        # Revalidation is answered from the cached lookup
+        mock_collection.delete_many({})
+        response = client.get("/podcastIndexId/41504", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.headers["ETag"] == etag
+        response = client.get(
+            "/podcastIndexId/41504", headers={"If-None-Match": f'"other", W/{etag}'}
+        )
+        assert response.status_code == 304
+        response = client.get(
+            "/podcastIndexId/41504",
+            headers={"If-Modified-Since": "Sun, 03 Mar 2024 08:00:00 GMT"},
+        )
+        assert response.status_code == 304
+        response = client.get("/podcastIndexId/41504", headers={"If-None-Match": "*"})
+        assert response.status_code == 304
+
+        # Stale validators get the full response
+        response = client.get(
+            "/podcastIndexId/41504", headers={"If-None-Match": '"stale"'}
+        )
+        assert response.status_code == 200
+        assert response.headers["ETag"] == etag
+        response = client.get(
+            "/podcastIndexId/41504",
+            headers={"If-Modified-Since": "Sat, 02 Mar 2024 08:00:00 GMT"},
+        )
+        assert response.status_code == 200
+
+        # A key that is not found is a 404 whatever validators are sent
+        for headers in (
+            {"If-Modified-Since": "Sun, 03 Mar 2024 08:00:00 GMT"},
+            {"If-None-Match": "*"},
+        ):
+            response = client.get("/podcastIndexId/1", headers=headers)
+            assert response.status_code == 404
+            response_cache.clear()
+            response = client.get("/podcastIndexId/41504", headers=headers)
+            assert response.status_code == 404
+
+
+def test_resolve_url_variants():
+    mock_mongo_client, mock_collection = setup_mongo_mock()
+    mock_collection.delete_many({})
+    mock_collection.insert_many(
+        [
+            {
+                "podcastGuid": "917393e3-1b1e-5cef-ace4-edaa54e1f810",
+                "url": "https://podnews.net/rss",
+                "originalUrl": "http://www.podnews.net/rss",
+                "podcastIndexId": 920666,
+                "itunesId": 1244054180,
+                "urlKeys": url_keys(
+                    "https://podnews.net/rss", "http://www.podnews.net/rss"
+                ),
+            },
+            {
+                "podcastGuid": "9b024349-ccf0-5f69-a609-6b82873eab3c",
+                "url": "http://podnews.net/rss/",
+                "originalUrl": "http://podnews.net/rss/",
+                "podcastIndexId": 1,
+                "itunesId": None,
+                "urlKeys": url_keys("http://podnews.net/rss/"),
+            },
+        ]
+    )
+
+    with patch("guid_slurp.main.get_mongo_client") as mock:
+        mock.return_value = mock_mongo_client
+        response = client.get("/url/?url=http://podnews.net/rss/")
+        assert response.status_code == 200
+        json_resp = response.json()
+        # The exact match ranks first and internal fields are not returned
+        assert [doc["podcastIndexId"] for doc in json_resp] == [1, 920666]
+        assert "urlKeys" not in json_resp[0]
+
+        # Matches on originalUrl too
+        response = client.get("/url/?url=https://WWW.podnews.net/rss")
+        assert [doc["podcastIndexId"] for doc in response.json()] == [920666]
+
+        response = client.post(
+            "/batch/", json={"url": ["https://PODNEWS.net/rss", "https://podnews.net"]}
+        )
+        urls = response.json()["url"]
+        assert [doc["podcastIndexId"] for doc in urls["https://PODNEWS.net/rss"]] == [
+            920666,
+            1,
+        ]
+        assert "urlKeys" not in urls["https://PODNEWS.net/rss"][0]
+        assert urls["https://podnews.net"] == {"detail": "Item not found"}
+
+
+def setup_duplicates(mock_collection):
+    duplicates = mock_collection.database[MONGODB_DUPLICATES]
+    duplicates.insert_many(
+        [
+            {
+                "_id": f"guid-{i}",
+                "count": count,
+                "duplicates": [
+                    {"url": f"https://example.com/{i}/{n}", "podcastIndexId": n}
+                    for n in range(count)
+                ],
+            }
+            for i, count in enumerate([2, 5, 3, 5, 2])
+        ]
+    )
+    return duplicates
+
+
+def test_duplicates():
+    mock_mongo_client, mock_collection = setup_mongo_mock()
+    duplicates = setup_duplicates(mock_collection)
+    expected_order = ["guid-1", "guid-3", "guid-2", "guid-0", "guid-4"]
+
+    with patch("guid_slurp.main.get_mongo_client") as mock:
+        mock.return_value = mock_mongo_client
+        response = client.get("/duplicates/?guid=guid-2")
+        assert response.status_code == 200
+        assert response.json()[0]["podcastGuid"] == "guid-2"
+        assert response.json()[0]["count"] == 3
+
+        # Full dump, streamed as a JSON array
+        response = client.get("/duplicates/")
+        assert response.status_code == 200
+        assert [doc["podcastGuid"] for doc in response.json()] == expected_order
+        assert "_id" not in response.json()[0]
+
+        # Newline delimited JSON
+        response = client.get("/duplicates/?format=ndjson")
+        assert response.headers["content-type"] == "application/x-ndjson"
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert [doc["podcastGuid"] for doc in lines] == expected_order
+
+        # Keyset pages
+        seen = []
+        next_cursor = ""
+        while True:
+            response = client.get(f"/duplicates/?limit=2&cursor={next_cursor}")
+            assert response.status_code == 200
+            page = response.json()
+            seen += [doc["podcastGuid"] for doc in page["duplicates"]]
+            next_cursor = page["next_cursor"]
+            if not next_cursor:
+                break
+        assert seen == expected_order
+
+        response = client.get("/duplicates/?limit=2&cursor=not-a-cursor")
+        assert response.status_code == 422
+
+        duplicates.delete_many({})
+        assert client.get("/duplicates/").status_code == 404
@@ -0,0 +1,59 @@
+import io
+import os
+import tarfile
+
+import pytest
+
+from guid_slurp import database_sync
+from guid_slurp.archive import StreamingExtractor, extract_member
+
+
+def make_archive(data: bytes) -> bytes:
+    """
+    A .tgz laid out like the PodcastIndex dump, with another file first
+    """
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for name, content in (("./README", b"readme"), (database_sync.DB_MEMBER, data)):
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+def test_streaming_extractor(tmp_path):
+    data = os.urandom(300_000)
+    archive = make_archive(data)
+    destination = tmp_path / "podcastindex_feeds.db"
+    with StreamingExtractor(database_sync.DB_MEMBER, str(destination)) as extractor:
+        for start in range(0, len(archive), 4096):
+            extractor.write(archive[start : start + 4096])
+    assert destination.read_bytes() == data
+
+
+def test_streaming_extractor_truncated(tmp_path):
+    archive = make_archive(os.urandom(300_000))
+    destination = tmp_path / "podcastindex_feeds.db"
+    with pytest.raises(Exception):
+        with StreamingExtractor(database_sync.DB_MEMBER, str(destination)) as extractor:
+            extractor.write(archive[: len(archive) // 2])
+    assert not destination.exists()
+    assert not (tmp_path / "podcastindex_feeds.db.tmp").exists()
+
+
+def test_missing_member(tmp_path):
+    archive = make_archive(b"data")
+    assert not extract_member(io.BytesIO(archive), "./other.db", str(tmp_path / "x"))
+    with pytest.raises(FileNotFoundError):
+        with StreamingExtractor("./other.db", str(tmp_path / "x")) as extractor:
+            extractor.write(archive)
+
+
+def test_untar_file(tmp_path, monkeypatch):
+    data = b"sqlite" * 1000
+    download = tmp_path / "podcastindex_feeds.db.tgz"
+    download.write_bytes(make_archive(data))
+    monkeypatch.setattr(database_sync, "DOWNLOAD_PATH", str(download))
+    monkeypatch.setattr(database_sync, "UNTAR_PATH", str(tmp_path / "feeds.db"))
+    database_sync.untar_file()
+    assert (tmp_path / "feeds.db").read_bytes() == data
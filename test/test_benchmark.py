@@ -0,0 +1,74 @@
+import random
+from collections import Counter
+
+from guid_slurp import benchmark, database_sync
+from guid_slurp.synthetic import synthetic_rows
+
+
+def test_synthetic_rows():
+    rows = list(synthetic_rows(2000, duplicate_rate=0.1))
+    assert [row[3] for row in rows] == list(range(1, 2001))
+    shared = Counter(row[0] for row in rows)
+    assert 100 < sum(count - 1 for count in shared.values()) < 300
+    assert rows == list(synthetic_rows(2000, duplicate_rate=0.1))
+
+
+def test_request_stream():
+    rows = list(synthetic_rows(1000))
+    mix = benchmark.parse_mix("guid=1,podcastIndexId=1")
+    stream = benchmark.request_stream(rows, mix, skew=1.1, miss_rate=0.1, seed=3)
+    requests = [next(stream) for _ in range(5000)]
+    # The same seed sends the same requests
+    again = benchmark.request_stream(rows, mix, skew=1.1, miss_rate=0.1, seed=3)
+    assert requests == [next(again) for _ in range(5000)]
+
+    assert {route for route, _ in requests} == {"guid", "podcastIndexId"}
+    ids = Counter(path for route, path in requests if route == "podcastIndexId")
+    (top_path, top_count), *_ = ids.most_common()
+    # Zipf with s=1.1 over 1000 keys gives the top key about 17% of lookups
+    assert top_count > 0.1 * sum(ids.values())
+    misses = sum(
+        count for path, count in ids.items() if int(path.rsplit("/", 1)[1]) > 1000
+    )
+    assert 0.05 < misses / sum(ids.values()) < 0.15
+
+
+def test_latency_summary():
+    latencies = list(range(1, 101))
+    random.Random(1).shuffle(latencies)
+    summary = benchmark.latency_summary(latencies, seconds=10)
+    assert summary == {
+        "requests": 100,
+        "requests_per_second": 10.0,
+        "p50_ms": 50,
+        "p95_ms": 95,
+        "p99_ms": 99,
+        "max_ms": 100,
+    }
+    assert benchmark.latency_summary([], 1)["p99_ms"] is None
+    assert benchmark.split(10, 3) == [4, 3, 3]
+    assert benchmark.split(1, 4) == [1]
+
+
+def test_benchmark_run():
+    args = benchmark.build_parser().parse_args(
+        [
+            "--rows=500",
+            "--workers=1",
+            "--concurrency=2",
+            "--client-processes=1",
+            "--duration=1",
+            "--warmup=0.2",
+        ]
+    )
+    directory = database_sync.DIRECTORY
+    report = benchmark.run(args)
+    # The scratch directory is gone, database_sync must not point there
+    assert database_sync.DIRECTORY == directory
+    assert report["dataset"]["rows"] == 500
+    assert report["overall"]["requests"] > 0
+    assert report["overall"]["errors"] == 0
+    assert set(report["overall"]["statuses"]) <= {"200", "404"}
+    assert set(report["routes"]) == set(benchmark.ROUTES)
+    (worker,) = report["workers"]
+    assert worker["rss_bytes"] > 0
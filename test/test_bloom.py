@@ -0,0 +1,165 @@
+import struct
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from guid_slurp import database_sync, main
+from guid_slurp.bloom import (
+    HEADER,
+    BloomFilter,
+    BloomFilters,
+    filter_size,
+    write_filters,
+)
+from guid_slurp.generations import write_current_generation
+from guid_slurp.main import app
+from test.test_api import setup_mongo_mock
+from test.test_timing import server_timing
+
+client = TestClient(app)
+UNKNOWN_GUID = "00000000-0000-5000-8000-000000000000"
+
+
+def test_false_positive_rate():
+    bits, hashes = filter_size(10000, 0.01)
+    assert (bits, hashes) == (95872, 7)
+    bloom = BloomFilter(bits, hashes)
+    for number in range(10000):
+        bloom.add(f"present-{number}".encode())
+    bloom.count_bits_set()
+    assert all(f"present-{number}".encode() in bloom for number in range(10000))
+    false_positives = sum(f"absent-{n}".encode() in bloom for n in range(100000))
+    assert 0.005 < false_positives / 100000 < 0.015
+    assert 0.005 < bloom.false_positive_rate < 0.015
+
+
+@pytest.fixture
+def bloom_file(podcast_dump, tmp_path):
+    path = tmp_path / "gen1.bloom"
+    stats = write_filters(str(podcast_dump), str(path), "gen1", 0.01)
+    assert stats["url"]["keys"] == 3
+    assert stats["itunesId"]["keys"] == 2
+    return path
+
+
+def test_bloom_filters(bloom_file):
+    filters = BloomFilters(str(bloom_file))
+    try:
+        assert filters.generation == "gen1"
+        guid = "856cd618-7f34-57ea-9b84-3600f1f65e7f"
+        assert filters.might_contain("podcastGuid", guid)
+        assert not filters.might_contain("podcastGuid", UNKNOWN_GUID)
+        # URLs are looked up by their canonical form
+        assert filters.might_contain("url", "https://feed.nashownotes.com/rss.xml/")
+        assert not filters.might_contain("url", "https://example.com/rss")
+        assert filters.might_contain("podcastIndexId", 920666)
+        assert not filters.might_contain("podcastIndexId", 1)
+        assert filters.might_contain("itunesId", 1244054180)
+        assert not filters.might_contain("itunesId", 1)
+        # Values the filters cannot rule out
+        assert filters.might_contain("podcastGuid", "")
+        assert filters.might_contain("duplicates", "anything")
+        stats = filters.stats()
+        assert stats["target_false_positive_rate"] == 0.01
+        assert stats["filters"]["podcastIndexId"]["bytes"] == 8
+    finally:
+        filters.close()
+
+
+def test_bloom_filters_reject_other_files(bloom_file):
+    with pytest.raises(ValueError, match="expected gen2"):
+        BloomFilters.from_generation(
+            str(bloom_file.parent),
+            {"generation": "gen2", "bloom": bloom_file.name},
+        )
+    data = bytearray(bloom_file.read_bytes())
+    struct.pack_into("<I", data, 8, 99)
+    bloom_file.write_bytes(bytes(data))
+    with pytest.raises(ValueError, match="format version 99"):
+        BloomFilters(str(bloom_file))
+    bloom_file.write_bytes(b"\x00" * HEADER.size)
+    with pytest.raises(ValueError, match="not a guid-slurp Bloom filter file"):
+        BloomFilters(str(bloom_file))
+
+
+def publish_bloom_generation(podcast_dump, directory, etag: str, monkeypatch):
+    """
+    Publish a generation with Bloom filters of the test podcasts the way
+    database_sync does, and return a MongoDB mock serving the import `etag`
+    """
+    monkeypatch.setattr(database_sync, "DIRECTORY", str(directory))
+    monkeypatch.setattr(database_sync, "UNTAR_PATH", str(podcast_dump))
+    snapshot = database_sync.write_lookup_snapshot("gen1")
+    bloom = database_sync.write_bloom_filters("gen1", snapshot)
+    timestamp = datetime(2024, 3, 3, tzinfo=timezone.utc)
+    write_current_generation(
+        str(directory),
+        {
+            "generation": "gen1",
+            "etag": '"gen1"',
+            "timestamp": timestamp.isoformat(),
+            "sqlite": snapshot,
+            "bloom": bloom,
+        },
+    )
+    mock_mongo_client, collection = setup_mongo_mock()
+    collection.database["fileInfo"].insert_one(
+        {"etag": etag, "timestamp": timestamp, "importedAt": timestamp}
+    )
+    return mock_mongo_client
+
+
+def test_api_short_circuits_misses(podcast_dump, tmp_path, monkeypatch):
+    mock_mongo_client = publish_bloom_generation(
+        podcast_dump, tmp_path, '"gen1"', monkeypatch
+    )
+    with patch("guid_slurp.main.get_mongo_client") as mock:
+        mock.return_value = mock_mongo_client
+        response = client.get(f"/guid/{UNKNOWN_GUID}")
+        assert response.status_code == 404
+        metrics = server_timing(response)
+        assert metrics["bloom"] == {"desc": '"absent"'}
+        assert "db" not in metrics and "cache" not in metrics
+
+        response = client.get("/guid/856cd618-7f34-57ea-9b84-3600f1f65e7f")
+        assert response.status_code == 200
+        assert "db" in server_timing(response)
+
+        # In the dump but not in this MongoDB: passes the filter, not found
+        response = client.get("/podcastIndexId/920666")
+        assert response.status_code == 404
+        assert "db" in server_timing(response)
+
+        response = client.post(
+            "/batch/", json={"podcastIndexId": [41504, 920666, 1, 2]}
+        )
+        assert response.status_code == 200
+        found = response.json()["podcastIndexId"]
+        assert found["1"] == found["2"] == found["920666"] == main.NOT_FOUND
+        metrics = server_timing(response)
+        assert metrics["bloom-podcastIndexId"] == {"desc": '"2 absent"'}
+        assert metrics["cache-podcastIndexId"] == {"desc": '"1 hit 1 miss"'}
+
+        bloom = client.get("/info/").json()["bloom"]
+    assert bloom["generation"] == "gen1"
+    assert bloom["lookups"] == {"absent": 3, "present": 2, "false_positive": 1}
+    assert bloom["observed_false_positive_rate"] == 0.25
+    assert set(bloom["filters"]) == {"podcastGuid", "url", "podcastIndexId", "itunesId"}
+    assert bloom["filters"]["podcastGuid"]["false_positive_rate"] < 0.01
+
+
+def test_api_ignores_filters_of_another_generation(podcast_dump, tmp_path, monkeypatch):
+    """
+    MongoDB already serves a newer import than the published generation
+    """
+    mock_mongo_client = publish_bloom_generation(
+        podcast_dump, tmp_path, '"gen2"', monkeypatch
+    )
+    with patch("guid_slurp.main.get_mongo_client") as mock:
+        mock.return_value = mock_mongo_client
+        response = client.get(f"/guid/{UNKNOWN_GUID}")
+        assert response.status_code == 404
+        assert "bloom" not in server_timing(response)
+        assert "db" in server_timing(response)
@@ -0,0 +1,88 @@
+from datetime import datetime
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from guid_slurp.cache import MISSING, ResponseCache
+from guid_slurp import main
+from guid_slurp.main import app, response_cache
+from test.test_api import setup_mongo_mock
+
+client = TestClient(app)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_eviction():
+    cache = ResponseCache(max_entries=2, ttl=60, negative_ttl=10)
+    cache.set("a", [1])
+    cache.set("b", [2])
+    assert cache.get("a") == [1]  # a is now the most recently used
+    cache.set("c", [3])
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == [1]
+    assert cache.get("c") == [3]
+    assert cache.stats() == {
+        "entries": 2,
+        "max_entries": 2,
+        "hits": 3,
+        "misses": 1,
+        "evictions": 1,
+        "hit_ratio": 0.75,
+    }
+
+
+def test_positive_and_negative_ttl():
+    clock = FakeClock()
+    cache = ResponseCache(max_entries=10, ttl=60, negative_ttl=10, clock=clock)
+    cache.set("found", [1])
+    cache.set("not found", [])
+    assert cache.get("not found") == []
+    clock.now = 11
+    assert cache.get("not found") is MISSING
+    assert cache.get("found") == [1]
+    clock.now = 61
+    assert cache.get("found") is MISSING
+    assert len(cache) == 0
+
+
+def test_disabled_cache():
+    cache = ResponseCache(max_entries=0, ttl=60, negative_ttl=10)
+    cache.set("a", [1])
+    assert cache.get("a") is MISSING
+
+
+def test_resolver_uses_cache_per_generation():
+    mock_mongo_client, mock_collection = setup_mongo_mock()
+    mock_collection.database["fileInfo"].insert_one(
+        {"etag": "generation-1", "timestamp": datetime(2024, 3, 3)}
+    )
+
+    before = response_cache.stats()
+    with patch("guid_slurp.main.get_mongo_client") as mock:
+        mock.return_value = mock_mongo_client
+        response = client.get("/itunesId/269169796")
+        assert response.status_code == 200
+        response = client.get("/itunesId/9999999")
+        assert response.status_code == 404
+
+        # Served from the cache even though the data has gone
+        mock_collection.delete_many({})
+        assert client.get("/itunesId/269169796").status_code == 200
+        assert client.get("/itunesId/9999999").status_code == 404
+        assert main.dataset_generation == "generation-1"
+        stats = response_cache.stats()
+        assert stats["hits"] - before["hits"] == 2
+        assert stats["misses"] - before["misses"] == 2
+
+        # A new generation invalidates everything
+        with patch("guid_slurp.main.dataset_generation", "generation-2"), patch(
+            "guid_slurp.main.GENERATION_POLL_SECONDS", 10**9
+        ):
+            assert client.get("/itunesId/269169796").status_code == 404
@@ -0,0 +1,160 @@
+import os
+from datetime import datetime, timezone
+
+import pytest
+from pymongo import MongoClient
+
+from guid_slurp.coverage import check_coverage, resolver_queries, uncovered_stages
+from guid_slurp.schema import (
+    PROJECTIONS,
+    SCHEMAS,
+    field_name,
+    index_layout,
+    public_document,
+    stored_document,
+)
+from test.conftest import PODCASTS
+
+# A MongoDB server to explain the resolver queries on, for example
+# mongodb://localhost:27017. A scratch database is created and dropped.
+MONGODB_TEST_URI = os.getenv("MONGODB_TEST_URI")
+TIMESTAMP = datetime(2024, 3, 3, tzinfo=timezone.utc)
+
+
+def ixscan(index_name):
+    return {"stage": "IXSCAN", "indexName": index_name}
+
+
+def test_uncovered_stages():
+    covered = {
+        "queryPlanner": {
+            "winningPlan": {
+                "stage": "PROJECTION_COVERED",
+                "inputStage": {
+                    "stage": "OR",
+                    "inputStages": [ixscan("urlKey"), ixscan("originalUrlKey")],
+                },
+            }
+        },
+        "executionStats": {"totalDocsExamined": 0},
+    }
+    assert uncovered_stages(covered) == []
+
+    fetched = {
+        "queryPlanner": {
+            "winningPlan": {
+                "queryPlan": {
+                    "stage": "PROJECTION_SIMPLE",
+                    "inputStage": {"stage": "FETCH", "inputStage": ixscan("url")},
+                }
+            }
+        }
+    }
+    assert uncovered_stages(fetched) == ["FETCH"]
+
+    scanned = {"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}}
+    assert uncovered_stages(scanned) == ["COLLSCAN"]
+
+    examined = {
+        "queryPlanner": {"winningPlan": ixscan("podcastGuid")},
+        "executionStats": {"totalDocsExamined": 2},
+    }
+    assert uncovered_stages(examined) == ["2 documents examined"]
+
+
+def predicate_values(predicate):
+    """
+    The values an equality or `$in` predicate matches, None for any other
+    operator, which index bounds alone may not answer
+    """
+    if isinstance(predicate, dict):
+        if set(predicate) != {"$in"}:
+            return None
+        return predicate["$in"]
+    return [predicate]
+
+
+def implies(predicate, partial_filter):
+    """
+    Whether a query on one field only matches documents a partial index
+    with `partial_filter` holds, the condition for MongoDB to use it
+    """
+    if partial_filter != {"$exists": True}:
+        return False
+    values = predicate_values(predicate)
+    return bool(values) and None not in values
+
+
+@pytest.mark.parametrize("schema", SCHEMAS)
+def test_resolver_queries_match_index_layout(schema):
+    """
+    Offline stand-in for explain(): every resolver query, and every branch
+    of the `$or` URL lookup, filters with equality or `$in` on the leading
+    field of an index that holds every projected field, and satisfies the
+    partial filter of the index it needs. The projection leaves out `_id`,
+    which no resolver index holds.
+    """
+    indexes = {keys[0][0]: (keys, options) for _, keys, options in index_layout(schema)}
+    projection = PROJECTIONS[schema]
+    assert projection["_id"] == 0
+    projected = {field for field, include in projection.items() if include}
+    podcast = public_document(
+        schema, stored_document(schema, PODCASTS[0], TIMESTAMP), TIMESTAMP
+    )
+    queries = resolver_queries(schema, podcast)
+    assert len(queries) == 8
+    used = set()
+    for name, query in queries.items():
+        clauses = query["$or"] if set(query) == {"$or"} else [query]
+        for clause in clauses:
+            ((field, predicate),) = clause.items()
+            assert field in indexes, name
+            keys, options = indexes[field]
+            assert projected <= {key for key, _ in keys}, name
+            assert predicate_values(predicate), name
+            partial_filter = options.get("partialFilterExpression")
+            if partial_filter is not None:
+                assert implies(predicate, partial_filter[field]), name
+            used.add(field)
+    # The URL lookups reach both URL key indexes, the partial one included
+    url_keys = {field_name(schema, "urlKey"), field_name(schema, "originalUrlKey")}
+    for name in ("url", "url batch"):
+        assert {field for clause in queries[name]["$or"] for field in clause} == (
+            url_keys
+        )
+    assert used == set(indexes)
+    partial = [
+        keys[0][0]
+        for keys, options in indexes.values()
+        if "partialFilterExpression" in options
+    ]
+    assert partial == [field_name(schema, "originalUrlKey")]
+
+
+def test_partial_index_needs_a_matching_query():
+    assert implies("https://podnews.net/rss", {"$exists": True})
+    assert implies({"$in": ["a", "b"]}, {"$exists": True})
+    # A null can match documents without the field, outside the index
+    assert not implies({"$in": ["a", None]}, {"$exists": True})
+    assert not implies(None, {"$exists": True})
+    assert not implies({"$ne": "a"}, {"$exists": True})
+    assert not implies("a", {"$type": "string"})
+
+
+@pytest.mark.skipif(not MONGODB_TEST_URI, reason="MONGODB_TEST_URI is not set")
+@pytest.mark.parametrize("schema", SCHEMAS)
+def test_resolver_queries_covered(schema):
+    with MongoClient(MONGODB_TEST_URI) as client:
+        db = client["guidSlurpCoverageTest"]
+        try:
+            collection = db["guidUrl"]
+            collection.insert_many(
+                [stored_document(schema, row, TIMESTAMP) for row in PODCASTS]
+            )
+            for name, keys, options in index_layout(schema):
+                collection.create_index(keys, name=name, **options)
+            report = check_coverage(collection, schema)
+        finally:
+            client.drop_database("guidSlurpCoverageTest")
+    assert report == {name: [] for name in report}
+    assert len(report) == 8
@@ -0,0 +1,155 @@
+import asyncio
+import os
+import threading
+from hashlib import md5
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import httpx
+import mongomock
+import pytest
+
+from guid_slurp import database_sync
+from guid_slurp.download import DownloadError, download
+from test.test_archive import make_archive
+
+
+class Archive:
+    """
+    What the stand-in server serves, and the requests it has seen
+    """
+
+    def __init__(self, body: bytes, etag: str):
+        self.body = body
+        self.etag = etag
+        # Close the connection after this many bytes of the next response
+        self.cut_after: int | None = None
+        self.requests: list[dict] = []
+
+
+def make_handler(archive: Archive):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            archive.requests.append(dict(self.headers))
+            body = archive.body
+            start = 0
+            range_header = self.headers.get("Range")
+            if_range = self.headers.get("If-Range")
+            if range_header and (if_range is None or if_range == archive.etag):
+                start = int(range_header.removeprefix("bytes=").rstrip("-"))
+                if start >= len(body):
+                    self.send_response(416)
+                    self.end_headers()
+                    return
+                self.send_response(206)
+                self.send_header(
+                    "Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}"
+                )
+            else:
+                self.send_response(200)
+            self.send_header("Content-Length", str(len(body) - start))
+            self.send_header("etag", archive.etag)
+            self.send_header("Last-Modified", "Sun, 03 Mar 2024 07:00:00 GMT")
+            self.end_headers()
+            payload = body[start:]
+            if archive.cut_after is not None:
+                payload = payload[: archive.cut_after]
+                archive.cut_after = None
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+@pytest.fixture
+def server():
+    body = os.urandom(3 * 1024 * 1024 + 123)
+    archive = Archive(body, f'"{md5(body).hexdigest()}"')
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(archive))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    archive.url = f"http://127.0.0.1:{httpd.server_address[1]}/feeds.db.tgz"
+    yield archive
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def client():
+    with httpx.Client(trust_env=False) as client:
+        yield client
+
+
+def test_download(server, client, tmp_path):
+    path = tmp_path / "feeds.db.tgz"
+    headers = download(server.url, str(path), client=client)
+    assert path.read_bytes() == server.body
+    assert headers["etag"] == server.etag
+    assert headers["Content-Length"] == str(len(server.body))
+    assert os.listdir(tmp_path) == ["feeds.db.tgz"]
+
+
+def test_resume_download(server, client, tmp_path):
+    path = tmp_path / "feeds.db.tgz"
+    server.cut_after = 1024 * 1024
+    with pytest.raises(httpx.HTTPError):
+        download(server.url, str(path), client=client)
+    assert not path.exists()
+    assert (tmp_path / "feeds.db.tgz.part").stat().st_size == 1024 * 1024
+
+    received = []
+    download(server.url, str(path), consumer=received.append, client=client)
+    assert path.read_bytes() == server.body
+    # The consumer sees the whole file, including the bytes already on disk
+    assert b"".join(received) == server.body
+    assert server.requests[-1]["Range"] == f"bytes={1024 * 1024}-"
+    assert server.requests[-1]["If-Range"] == server.etag
+    assert not (tmp_path / "feeds.db.tgz.part").exists()
+
+
+def test_changed_file_restarts(server, client, tmp_path):
+    path = tmp_path / "feeds.db.tgz"
+    server.cut_after = 1000
+    with pytest.raises(httpx.HTTPError):
+        download(server.url, str(path), client=client)
+
+    server.body = os.urandom(2048)
+    server.etag = f'"{md5(server.body).hexdigest()}"'
+    download(server.url, str(path), client=client)
+    assert path.read_bytes() == server.body
+
+
+def test_corrupt_download(server, client, tmp_path):
+    path = tmp_path / "feeds.db.tgz"
+    server.etag = f'"{md5(b"something else").hexdigest()}"'
+    with pytest.raises(DownloadError):
+        download(server.url, str(path), client=client)
+    assert os.listdir(tmp_path) == []
+
+
+def test_unverified_stream_is_not_imported(server, tmp_path, monkeypatch):
+    """
+    In stream mode the database is extracted before the download is
+    verified, a download failing its MD5 check must leave nothing behind
+    for the import to pick up
+    """
+    server.body = make_archive(b"sqlite" * 1000)
+    server.etag = f'"{md5(b"something else").hexdigest()}"'
+    monkeypatch.setattr(database_sync, "DOWNLOAD_MODE", "stream")
+    monkeypatch.setattr(database_sync, "DOWNLOAD_URL", server.url)
+    monkeypatch.setattr(database_sync, "DIRECTORY", str(tmp_path))
+    monkeypatch.setattr(
+        database_sync, "DOWNLOAD_PATH", str(tmp_path / "podcastindex_feeds.db.tgz")
+    )
+    monkeypatch.setattr(database_sync, "UNTAR_PATH", str(tmp_path / "feeds.db"))
+    mongo = mongomock.MongoClient()
+    with patch("guid_slurp.database_sync.MongoClient") as mock:
+        mock.return_value.__enter__.return_value = mongo
+        assert database_sync.fetch_new_podcastindex_database() is None
+        assert os.listdir(tmp_path) == []
+
+        asyncio.run(database_sync.startup_import())
+    assert os.listdir(tmp_path) == []
+    assert mongo.list_database_names() == []
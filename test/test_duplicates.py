@@ -0,0 +1,52 @@
+from unittest.mock import patch
+
+import mongomock
+
+from guid_slurp import database_sync
+from guid_slurp.duplicates import duplicate_groups
+
+
+def test_duplicate_groups(podcast_dump, tmp_path, monkeypatch):
+    monkeypatch.setattr(database_sync, "DIRECTORY", str(tmp_path))
+    monkeypatch.setattr(database_sync, "UNTAR_PATH", str(podcast_dump))
+    snapshot = database_sync.write_lookup_snapshot("gen1")
+
+    assert list(duplicate_groups(str(tmp_path / snapshot))) == [
+        {
+            "_id": "856cd618-7f34-57ea-9b84-3600f1f65e7f",
+            "count": 2,
+            "duplicates": [
+                {"url": "http://feed.nashownotes.com/rss.xml", "podcastIndexId": 41504},
+                {
+                    "url": "https://noagendalite.glump.net/noagendalite.rss",
+                    "podcastIndexId": 3756449,
+                },
+            ],
+            "uniqueDomainCount": 2,
+            "uniqueDomains": ["feed.nashownotes.com", "noagendalite.glump.net"],
+            "podcastIndexId": [41504, 3756449],
+        }
+    ]
+
+
+def test_finish_import_writes_duplicates(podcast_dump, tmp_path, monkeypatch):
+    monkeypatch.setattr(database_sync, "DIRECTORY", str(tmp_path))
+    monkeypatch.setattr(database_sync, "UNTAR_PATH", str(podcast_dump))
+    mongo = mongomock.MongoClient()
+    db = mongo[database_sync.MONGODB_DATABASE]
+    # An older generation's duplicates are replaced, not kept
+    db[database_sync.MONGODB_DUPLICATES].insert_one({"_id": "old", "count": 9})
+
+    with patch("guid_slurp.database_sync.MongoClient") as mock:
+        mock.return_value.__enter__.return_value = mongo
+        snapshot = database_sync.write_lookup_snapshot("gen1")
+        assert database_sync.create_database(snapshot, None) is True
+        with patch.object(database_sync, "create_duplicate_collection") as aggregation:
+            database_sync.finish_database_import(True, snapshot)
+            aggregation.assert_not_called()
+
+    duplicates = list(db[database_sync.MONGODB_DUPLICATES].find())
+    assert [doc["_id"] for doc in duplicates] == [
+        "856cd618-7f34-57ea-9b84-3600f1f65e7f"
+    ]
+    assert duplicates[0]["uniqueDomainCount"] == 2
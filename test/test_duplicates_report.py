@@ -0,0 +1,94 @@
+import gzip
+import json
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import brotli
+from fastapi.testclient import TestClient
+
+from guid_slurp import database_sync
+from guid_slurp.generations import write_current_generation
+from guid_slurp.main import app
+from test.test_api import setup_duplicates, setup_mongo_mock
+
+client = TestClient(app)
+
+
+def write_report(tmp_path, monkeypatch):
+    mock_mongo_client, mock_collection = setup_mongo_mock()
+    setup_duplicates(mock_collection)
+    monkeypatch.setattr(database_sync, "DIRECTORY", str(tmp_path))
+    with patch("guid_slurp.database_sync.MongoClient") as mock:
+        mock.return_value.__enter__.return_value = mock_collection.database.client
+        report = database_sync.write_duplicates_report("gen1")
+    write_current_generation(
+        str(tmp_path),
+        {
+            "generation": "gen1",
+            "timestamp": datetime(2024, 3, 3, tzinfo=timezone.utc).isoformat(),
+            "duplicates": report,
+        },
+    )
+    return mock_mongo_client, tmp_path / report
+
+
+def test_write_duplicates_report(tmp_path, monkeypatch):
+    _, report = write_report(tmp_path, monkeypatch)
+    plain = report.read_bytes()
+    assert gzip.decompress(report.with_suffix(".json.gz").read_bytes()) == plain
+    assert brotli.decompress(report.with_suffix(".json.br").read_bytes()) == plain
+    groups = json.loads(plain)
+    assert [group["podcastGuid"] for group in groups] == [
+        "guid-1",
+        "guid-3",
+        "guid-2",
+        "guid-0",
+        "guid-4",
+    ]
+
+
+def test_serve_duplicates_report(tmp_path, monkeypatch):
+    mock_mongo_client, report = write_report(tmp_path, monkeypatch)
+    plain = report.read_bytes()
+
+    with patch("guid_slurp.main.get_mongo_client") as mock:
+        mock.return_value = mock_mongo_client
+        # The report matches what streaming from MongoDB returns
+        streamed = client.get("/duplicates/?format=ndjson")
+        from_mongo = [json.loads(line) for line in streamed.text.splitlines()]
+        mock.reset_mock()
+
+        response = client.get("/duplicates/", headers={"Accept-Encoding": "identity"})
+        assert response.status_code == 200
+        assert "content-encoding" not in response.headers
+        assert response.content == plain
+        assert response.json() == from_mongo
+
+        response = client.get(
+            "/duplicates/", headers={"Accept-Encoding": "gzip, deflate, br"}
+        )
+        assert response.headers["content-encoding"] == "br"
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert response.json() == from_mongo
+
+        response = client.get(
+            "/duplicates/", headers={"Accept-Encoding": "gzip, br;q=0"}
+        )
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.json() == from_mongo
+
+        response = client.get(
+            "/duplicates/",
+            headers={"Accept-Encoding": "identity", "Range": "bytes=0-9"},
+        )
+        assert response.status_code == 206
+        assert response.content == plain[:10]
+        assert response.headers["content-range"] == f"bytes 0-9/{len(plain)}"
+
+        etag = response.headers["etag"]
+        response = client.get(
+            "/duplicates/",
+            headers={"Accept-Encoding": "identity", "If-None-Match": etag},
+        )
+        assert response.status_code == 304
+        mock.assert_not_called()
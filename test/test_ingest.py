@@ -0,0 +1,53 @@
+from unittest.mock import MagicMock
+
+import mongomock
+import pytest
+
+from guid_slurp.ingest import bulk_load
+from guid_slurp.sqlite_reader import PartitionedReader, rowid_ranges
+
+COLUMNS = "podcastGuid, url, originalUrl, id, itunesId"
+
+
+def build_document(row):
+    return {"podcastGuid": row[0], "url": row[1], "podcastIndexId": row[3]}
+
+
+def test_bulk_load(podcast_dump):
+    collection = mongomock.MongoClient()["test"]["guidUrl"]
+    progress = []
+    reader = PartitionedReader(str(podcast_dump), COLUMNS, partitions=2, batch_size=1)
+    stages = bulk_load(
+        reader, collection, build_document, writers=3, progress=progress.append
+    )
+    assert reader.rows == 3
+    assert collection.count_documents({}) == 3
+    assert sorted(doc["podcastIndexId"] for doc in collection.find()) == [
+        41504,
+        920666,
+        3756449,
+    ]
+    assert sum(progress) == 3
+    assert [stage.name for stage in stages] == ["read", "build", "write"]
+    assert all(stage.rows == 3 for stage in stages)
+    assert stages[2].workers == 3
+
+
+def test_bulk_load_error_stops_pipeline(podcast_dump):
+    collection = MagicMock()
+    collection.insert_many.side_effect = RuntimeError("write failed")
+    with pytest.raises(RuntimeError, match="write failed"):
+        bulk_load(
+            PartitionedReader(str(podcast_dump), COLUMNS, batch_size=1),
+            collection,
+            build_document,
+        )
+
+
+def test_rowid_ranges(podcast_dump):
+    # The fixture's rowids are its PodcastIndex ids
+    assert rowid_ranges(str(podcast_dump), "podcasts", 2) == [
+        (41504, 1898976),
+        (1898977, 3756449),
+    ]
+    assert rowid_ranges(str(podcast_dump), "podcasts", 1) == [(41504, 3756449)]
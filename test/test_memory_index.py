@@ -0,0 +1,82 @@
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from guid_slurp import database_sync
+from guid_slurp.generations import read_current_generation
+from guid_slurp.main import app
+from guid_slurp.memory_index import MemoryIndex
+
+client = TestClient(app)
+
+
+def test_memory_index_lookup(podcast_dump):
+    timestamp = datetime(2024, 3, 3, tzinfo=timezone.utc)
+    index = MemoryIndex.from_sqlite(str(podcast_dump), "gen1", timestamp)
+    assert len(index) == 3
+
+    results = index.lookup("podcastGuid", "856cd618-7f34-57ea-9b84-3600f1f65e7f")
+    assert [doc["podcastIndexId"] for doc in results] == [41504, 3756449]
+    assert results[0] == {
+        "podcastGuid": "856cd618-7f34-57ea-9b84-3600f1f65e7f",
+        "url": "http://feed.nashownotes.com/rss.xml",
+        "originalUrl": "http://feed.nashownotes.com/rss.xml",
+        "podcastIndexId": 41504,
+        "itunesId": 269169796,
+        "timestamp": timestamp,
+    }
+    assert results[1]["itunesId"] is None
+
+    assert index.lookup("url", "https://podnews.net/rss")[0]["podcastIndexId"] == 920666
+    assert index.lookup("url", "http://podnews.net/rss/")[0]["podcastIndexId"] == 920666
+    assert index.lookup("itunesId", 1244054180)[0]["url"] == "https://podnews.net/rss"
+    assert index.lookup("podcastIndexId", 3756449)[0]["itunesId"] is None
+    assert index.lookup("podcastIndexId", 1) == []
+
+    found = index.lookup_many("itunesId", [269169796, 5])
+    assert len(found[269169796]) == 1
+    assert found[5] == []
+
+
+def test_snapshot_generation_roundtrip(podcast_dump, tmp_path, monkeypatch):
+    monkeypatch.setattr(database_sync, "DIRECTORY", str(tmp_path))
+    monkeypatch.setattr(database_sync, "UNTAR_PATH", str(podcast_dump))
+    snapshot = database_sync.write_lookup_snapshot("abc123")
+    database_sync.publish_generation(
+        "abc123",
+        {"etag": '"abc123"', "timestamp": datetime(2024, 3, 3, tzinfo=timezone.utc)},
+        {"sqlite": snapshot, "index": "indexes/abc123.idx"},
+    )
+
+    current = read_current_generation(str(tmp_path))
+    assert current["generation"] == "abc123"
+    index = MemoryIndex.from_generation(str(tmp_path), current)
+    assert index.generation == "abc123"
+    assert len(index) == 3
+    assert index.lookup("url", "https://podnews.net/rss")[0]["podcastIndexId"] == 920666
+
+
+def test_resolve_from_memory(podcast_dump):
+    index = MemoryIndex.from_sqlite(
+        str(podcast_dump), "gen1", datetime(2024, 3, 3, tzinfo=timezone.utc)
+    )
+    with patch("guid_slurp.main.lookup_index", index), patch(
+        "guid_slurp.main.get_mongo_client"
+    ) as mock:
+        response = client.get("/guid/856cd618-7f34-57ea-9b84-3600f1f65e7f")
+        assert response.status_code == 200
+        assert len(response.json()) == 2
+
+        response = client.get("/url/?url=https://podnews.net/rss")
+        assert response.status_code == 200
+        assert response.json()[0]["podcastIndexId"] == 920666
+
+        response = client.get("/itunesId/9999999")
+        assert response.status_code == 404
+
+        response = client.post("/batch/", json={"podcastIndexId": [41504, 2]})
+        assert response.status_code == 200
+        assert response.json()["podcastIndexId"]["2"] == {"detail": "Item not found"}
+
+        mock.assert_not_called()
@@ -0,0 +1,95 @@
+import subprocess
+import sys
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+from prometheus_client.parser import text_string_to_metric_families
+
+from guid_slurp import metrics
+from guid_slurp.main import app
+from test.test_api import setup_mongo_mock
+
+client = TestClient(app)
+
+
+def samples(text: str) -> dict:
+    return {
+        (sample.name, tuple(sorted(sample.labels.items()))): sample.value
+        for family in text_string_to_metric_families(text)
+        for sample in family.samples
+    }
+
+
+def sample(found: dict, name: str, **labels) -> float:
+    return found.get((name, tuple(sorted(labels.items()))), 0.0)
+
+
+def test_metrics_endpoint():
+    before = samples(client.get("/metrics").text)
+    mock_mongo_client, _ = setup_mongo_mock()
+    with patch("guid_slurp.main.get_mongo_client") as mock:
+        mock.return_value = mock_mongo_client
+        assert client.get("/podcastIndexId/41504").status_code == 200
+        assert client.get("/podcastIndexId/1").status_code == 404
+        assert client.post("/batch/", json={"itunesId": [1, 2]}).status_code == 200
+    assert client.get("/no/such/path").status_code == 404
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    after = samples(response.text)
+
+    def delta(name, **labels):
+        return sample(after, name, **labels) - sample(before, name, **labels)
+
+    route = {"method": "GET", "route": "/podcastIndexId/{podcastIndexId}"}
+    assert delta("guid_slurp_http_request_duration_seconds_count", **route) == 2
+    assert (
+        delta("guid_slurp_http_request_duration_seconds_bucket", le="+Inf", **route)
+        == 2
+    )
+    assert delta("guid_slurp_http_responses_total", status="200", **route) == 1
+    assert delta("guid_slurp_http_responses_total", status="404", **route) == 1
+    unmatched = {"method": "GET", "route": metrics.UNMATCHED_ROUTE, "status": "404"}
+    assert delta("guid_slurp_http_responses_total", **unmatched) == 1
+    assert (
+        sample(after, "guid_slurp_http_requests_in_flight", route=route["route"]) == 0
+    )
+
+    single = {"backend": "mongo", "operation": "single", "field": "podcastIndexId"}
+    assert delta("guid_slurp_backend_query_duration_seconds_count", **single) == 2
+    batch = {"backend": "mongo", "operation": "batch", "field": "itunesId"}
+    assert delta("guid_slurp_backend_query_duration_seconds_count", **batch) == 1
+
+
+def test_multiprocess_aggregation(tmp_path):
+    """
+    Samples written by separate worker processes add up in one scrape
+    """
+    record = (
+        "from guid_slurp import metrics\n"
+        "metrics.RESPONSES.labels('GET', '/guid/{guid}', '200').inc(3)\n"
+        "metrics.REQUEST_SECONDS.labels('GET', '/guid/{guid}').observe(0.002)\n"
+    )
+    for _ in range(2):
+        subprocess.run(
+            [sys.executable, "-c", record],
+            env={"PROMETHEUS_MULTIPROC_DIR": str(tmp_path), "PYTHONPATH": "src"},
+            check=True,
+        )
+    body, _ = metrics.render(str(tmp_path))
+    found = samples(body.decode())
+    labels = {"method": "GET", "route": "/guid/{guid}"}
+    assert sample(found, "guid_slurp_http_responses_total", status="200", **labels) == 6
+    assert (
+        sample(found, "guid_slurp_http_request_duration_seconds_count", **labels) == 2
+    )
+    assert (
+        sample(
+            found,
+            "guid_slurp_http_request_duration_seconds_bucket",
+            le="0.0025",
+            **labels
+        )
+        == 2
+    )
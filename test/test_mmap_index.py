@@ -0,0 +1,95 @@
+import struct
+from datetime import datetime, timezone
+
+import pytest
+
+from guid_slurp import database_sync
+from guid_slurp.generations import read_current_generation
+from guid_slurp.mmap_index import HEADER, MmapIndex, write_index
+
+
+@pytest.fixture
+def lookup_file(podcast_dump, tmp_path):
+    path = tmp_path / "gen1.idx"
+    write_index(
+        str(podcast_dump), str(path), "gen1", datetime(2024, 3, 3, tzinfo=timezone.utc)
+    )
+    return path
+
+
+def test_mmap_index_lookup(lookup_file):
+    index = MmapIndex(str(lookup_file))
+    try:
+        assert index.generation == "gen1"
+        assert len(index) == 3
+
+        results = index.lookup("podcastGuid", "856cd618-7f34-57ea-9b84-3600f1f65e7f")
+        assert [doc["podcastIndexId"] for doc in results] == [41504, 3756449]
+        assert results[0] == {
+            "podcastGuid": "856cd618-7f34-57ea-9b84-3600f1f65e7f",
+            "url": "http://feed.nashownotes.com/rss.xml",
+            "originalUrl": "http://feed.nashownotes.com/rss.xml",
+            "podcastIndexId": 41504,
+            "itunesId": 269169796,
+            "timestamp": datetime(2024, 3, 3, tzinfo=timezone.utc),
+        }
+        assert results[1]["itunesId"] is None
+
+        assert index.lookup("url", "https://podnews.net/rss")[0]["itunesId"] == (
+            1244054180
+        )
+        # Scheme, host case and trailing slash variants all match
+        assert index.lookup("url", "http://PodNews.net/rss/")[0]["url"] == (
+            "https://podnews.net/rss"
+        )
+        assert index.lookup("url", "https://podnews.net/rss/other") == []
+        assert index.lookup("itunesId", 269169796)[0]["podcastIndexId"] == 41504
+        assert index.lookup("podcastIndexId", 920666)[0]["url"] == (
+            "https://podnews.net/rss"
+        )
+        assert index.lookup("podcastIndexId", 2**70) == []
+        assert index.lookup_many("podcastIndexId", [1, 41504])[1] == []
+    finally:
+        index.close()
+
+
+def test_mmap_index_rejects_other_versions(lookup_file):
+    data = bytearray(lookup_file.read_bytes())
+    struct.pack_into("<I", data, 8, 99)
+    lookup_file.write_bytes(bytes(data))
+    with pytest.raises(ValueError, match="format version 99"):
+        MmapIndex(str(lookup_file))
+
+    lookup_file.write_bytes(b"\x00" * HEADER.size)
+    with pytest.raises(ValueError, match="not a guid-slurp lookup file"):
+        MmapIndex(str(lookup_file))
+
+
+def test_publish_and_remap_generation(podcast_dump, tmp_path, monkeypatch):
+    monkeypatch.setattr(database_sync, "DIRECTORY", str(tmp_path))
+    monkeypatch.setattr(database_sync, "UNTAR_PATH", str(podcast_dump))
+    timestamp = datetime(2024, 3, 3, tzinfo=timezone.utc)
+    for generation in ("gen1", "gen2", "gen3"):
+        snapshot = database_sync.write_lookup_snapshot(generation)
+        index_file = database_sync.write_lookup_index(generation, snapshot, timestamp)
+        database_sync.publish_generation(
+            generation,
+            {"timestamp": timestamp},
+            {"sqlite": snapshot, "index": index_file},
+        )
+
+    current = read_current_generation(str(tmp_path))
+    assert current["index"] == "indexes/gen3.idx"
+    index = MmapIndex.from_generation(str(tmp_path), current)
+    assert index.generation == "gen3"
+    assert index.lookup("itunesId", 1244054180)[0]["podcastIndexId"] == 920666
+    index.close()
+
+    # Only the newest generations are kept
+    assert sorted(p.name for p in (tmp_path / "indexes").iterdir()) == [
+        "gen2.idx",
+        "gen3.idx",
+    ]
+
+    with pytest.raises(ValueError, match="expected gen1"):
+        MmapIndex.from_generation(str(tmp_path), {**current, "generation": "gen1"})
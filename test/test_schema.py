@@ -0,0 +1,170 @@
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import bson
+import mongomock
+from bson.binary import Binary
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+from guid_slurp import database_sync, main
+from guid_slurp.main import app
+from guid_slurp.schema import (
+    COMPACT,
+    FULL,
+    PROJECTIONS,
+    decode_guid,
+    encode_guid,
+    public_document,
+    stored_document,
+)
+from test.conftest import PODCASTS
+
+client = TestClient(app)
+TIMESTAMP = datetime(2024, 3, 3, tzinfo=timezone.utc)
+
+
+def test_guid_encoding():
+    guid = "856cd618-7f34-57ea-9b84-3600f1f65e7f"
+    encoded = encode_guid(guid)
+    assert isinstance(encoded, Binary) and len(encoded) == 16
+    assert decode_guid(encoded) == guid
+    # Only canonical UUIDs are converted, so every GUID round trips exactly
+    assert encode_guid(guid.upper()) == guid.upper()
+    assert encode_guid("not-a-uuid") == "not-a-uuid"
+    assert encode_guid("") == ""
+    assert encode_guid(None) is None
+
+
+def test_compact_documents():
+    rows = PODCASTS + [
+        # A moved feed, and one whose originalUrl is NULL
+        ("new-guid", "https://example.com/rss", "http://old.example.com/rss", 7, None),
+        ("", "https://example.com/null", None, 8, 1),
+    ]
+    for row in rows:
+        full = stored_document(FULL, row, TIMESTAMP)
+        compact = stored_document(COMPACT, row, TIMESTAMP)
+        if row in PODCASTS:
+            assert len(bson.encode(compact)) < len(bson.encode(full)) * 0.6
+        expected = {key: full[key] for key in PROJECTIONS[FULL] if key != "_id"}
+        # Covered queries return the fields compact documents leave out as null
+        covered = {
+            key: compact.get(key) for key in PROJECTIONS[COMPACT] if key != "_id"
+        }
+        assert public_document(COMPACT, covered, TIMESTAMP) == expected
+
+
+def test_resolve_compact_schema(podcast_dump, tmp_path, monkeypatch):
+    monkeypatch.setattr(database_sync, "DIRECTORY", str(tmp_path))
+    monkeypatch.setattr(database_sync, "UNTAR_PATH", str(podcast_dump))
+    monkeypatch.setattr(database_sync, "MONGODB_SCHEMA", COMPACT)
+    mongo = mongomock.MongoClient()
+    db = mongo[database_sync.MONGODB_DATABASE]
+    db["fileInfo"].insert_one({"etag": '"compact"', "timestamp": TIMESTAMP})
+    with patch("guid_slurp.database_sync.MongoClient") as mock:
+        mock.return_value.__enter__.return_value = mongo
+        snapshot = database_sync.write_lookup_snapshot("gen1")
+        database_sync.create_database(snapshot, None)
+        database_sync.finish_database_import(True, snapshot)
+
+    stored = db[database_sync.MONGODB_COLLECTION].find_one({"i": 41504})
+    assert set(stored) == {"_id", "g", "u", "i", "t", "k"}
+    assert "podcastGuid" in db[database_sync.MONGODB_COLLECTION].index_information()
+    imported_at = db["fileInfo"].find_one()["importedAt"]
+
+    with patch("guid_slurp.main.get_mongo_client") as mock:
+        mock.return_value = AsyncMongoMockClient(mock_mongo_client=mongo)
+        response = client.get("/guid/856cd618-7f34-57ea-9b84-3600f1f65e7f")
+        assert response.status_code == 200
+        # The partitioned load inserts the podcasts in no particular order
+        podcasts = sorted(
+            response.json(), key=lambda podcast: podcast["podcastIndexId"]
+        )
+        assert [podcast["podcastIndexId"] for podcast in podcasts] == [
+            41504,
+            3756449,
+        ]
+        assert podcasts[1] == {
+            "podcastGuid": "856cd618-7f34-57ea-9b84-3600f1f65e7f",
+            "url": "https://noagendalite.glump.net/noagendalite.rss",
+            "originalUrl": "https://noagendalite.glump.net/noagendalite.rss",
+            "podcastIndexId": 3756449,
+            "itunesId": None,
+            "timestamp": podcasts[1]["timestamp"],
+        }
+        assert datetime.fromisoformat(podcasts[1]["timestamp"]) == imported_at
+
+        response = client.get("/url/?url=http://podnews.net/rss/")
+        assert response.json()[0]["podcastIndexId"] == 920666
+        assert client.get("/itunesId/269169796").json()[0]["podcastIndexId"] == 41504
+
+        response = client.post(
+            "/batch/",
+            json={
+                "guid": ["917393e3-1b1e-5cef-ace4-edaa54e1f810"],
+                "url": ["https://podnews.net/rss"],
+            },
+        )
+        batch = response.json()
+        podcast = batch["guid"]["917393e3-1b1e-5cef-ace4-edaa54e1f810"][0]
+        assert podcast["itunesId"] == 1244054180
+        assert batch["url"]["https://podnews.net/rss"][0]["podcastGuid"] == (
+            "917393e3-1b1e-5cef-ace4-edaa54e1f810"
+        )
+
+
+def test_schema_swap_between_polls(podcast_dump, tmp_path, monkeypatch):
+    """
+    Lookups keep finding podcasts when an import swaps in the compact
+    schema before the workers' next poll of the generation
+    """
+    monkeypatch.setattr(database_sync, "DIRECTORY", str(tmp_path))
+    monkeypatch.setattr(database_sync, "UNTAR_PATH", str(podcast_dump))
+    mongo = mongomock.MongoClient()
+    db = mongo[database_sync.MONGODB_DATABASE]
+
+    def import_dump(schema: str, etag: str, timestamp: datetime):
+        monkeypatch.setattr(database_sync, "MONGODB_SCHEMA", schema)
+        db["fileInfo"].insert_one({"etag": etag, "timestamp": timestamp})
+        with patch("guid_slurp.database_sync.MongoClient") as mock:
+            mock.return_value.__enter__.return_value = mongo
+            snapshot = database_sync.write_lookup_snapshot(etag.strip('"'))
+            database_sync.create_database(snapshot, None)
+            database_sync.finish_database_import(True, snapshot)
+
+    import_dump(FULL, '"full"', TIMESTAMP)
+    with patch("guid_slurp.main.get_mongo_client") as mock:
+        mock.return_value = AsyncMongoMockClient(mock_mongo_client=mongo)
+        response = client.get("/guid/856cd618-7f34-57ea-9b84-3600f1f65e7f")
+        assert response.status_code == 200
+
+        import_dump(COMPACT, '"compact"', datetime(2024, 3, 4, tzinfo=timezone.utc))
+        assert db[database_sync.MONGODB_COLLECTION].find_one({"i": 41504})
+        # Within SCHEMA_RECHECK_SECONDS of the last read misses are not
+        # re-checked, so they cost no extra round trip
+        reads = []
+        read_fileinfo = main.check_imported_fileinfo
+
+        async def counted_read():
+            reads.append(1)
+            return await read_fileinfo()
+
+        monkeypatch.setattr(main, "check_imported_fileinfo", counted_read)
+        assert client.get("/itunesId/269169796").status_code == 404
+        assert reads == []
+        main.response_cache.clear()
+        monkeypatch.setattr(
+            main,
+            "dataset_generation_checked",
+            main.dataset_generation_checked - main.SCHEMA_RECHECK_SECONDS,
+        )
+        assert client.get("/itunesId/269169796").json()[0]["podcastIndexId"] == 41504
+        response = client.post(
+            "/batch/", json={"guid": ["917393e3-1b1e-5cef-ace4-edaa54e1f810"]}
+        )
+        podcast = response.json()["guid"]["917393e3-1b1e-5cef-ace4-edaa54e1f810"][0]
+        assert podcast["podcastIndexId"] == 920666
+        assert client.get("/info/").json()["generation"] == '"compact"'
+        assert client.get("/podcastIndexId/1").status_code == 404
+    assert len(reads) == 1
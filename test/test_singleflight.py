@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from guid_slurp.singleflight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_lookup():
+    single_flight = SingleFlight()
+    calls = 0
+
+    async def lookup():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return ["result"]
+
+    results = await asyncio.gather(
+        *(single_flight.do("key", lookup) for _ in range(20))
+    )
+    assert results == [["result"]] * 20
+    assert calls == 1
+    assert single_flight.stats() == {"in_flight": 0, "calls": 1, "coalesced": 19}
+
+    # Once finished the next call does its own lookup
+    await single_flight.do("key", lookup)
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_caller():
+    single_flight = SingleFlight()
+
+    async def lookup():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("database down")
+
+    results = await asyncio.gather(
+        *(single_flight.do("key", lookup) for _ in range(3)), return_exceptions=True
+    )
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert len(single_flight) == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_others():
+    single_flight = SingleFlight()
+
+    async def lookup():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    first = asyncio.ensure_future(single_flight.do("key", lookup))
+    second = asyncio.ensure_future(single_flight.do("key", lookup))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert await second == "done"
+    with pytest.raises(asyncio.CancelledError):
+        await first
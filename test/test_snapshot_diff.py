@@ -0,0 +1,116 @@
+import sqlite3
+from datetime import datetime
+from unittest.mock import patch
+
+import mongomock
+
+from guid_slurp import database_sync
+
+
+def test_diff_import(podcast_dump, tmp_path, monkeypatch):
+    monkeypatch.setattr(database_sync, "DIRECTORY", str(tmp_path))
+    monkeypatch.setattr(database_sync, "UNTAR_PATH", str(podcast_dump))
+    monkeypatch.setattr(database_sync, "IMPORT_BATCH_SIZE", 1)
+    mongo = mongomock.MongoClient()
+    db = mongo[database_sync.MONGODB_DATABASE]
+    live = db[database_sync.MONGODB_COLLECTION]
+    db["fileInfo"].insert_one({"etag": '"gen1"', "timestamp": datetime(2024, 3, 3)})
+
+    with patch("guid_slurp.database_sync.MongoClient") as mock:
+        mock.return_value.__enter__.return_value = mongo
+        previous = database_sync.write_lookup_snapshot("gen1")
+        assert database_sync.create_database(previous, None) is True
+        database_sync.finish_database_import(staged=True)
+        assert live.count_documents({}) == 3
+        unchanged = live.find_one({"podcastIndexId": 41504})
+
+        conn = sqlite3.connect(podcast_dump)
+        conn.execute(
+            "UPDATE podcasts SET url = 'https://podnews.net/feed' WHERE id = 920666"
+        )
+        conn.execute("DELETE FROM podcasts WHERE id = 3756449")
+        conn.execute(
+            "INSERT INTO podcasts (id, url, originalUrl, itunesId, podcastGuid) "
+            "VALUES (7, 'https://example.com/rss', 'https://example.com/rss', "
+            "NULL, 'new-guid')"
+        )
+        conn.commit()
+        conn.close()
+
+        snapshot = database_sync.write_lookup_snapshot("gen2")
+        with database_sync.SnapshotDiff(
+            str(tmp_path / snapshot), str(tmp_path / previous)
+        ) as diff:
+            assert sorted(row[3] for _, row in diff.changed()) == [7, 920666]
+            assert list(diff.deleted()) == [[3756449]]
+
+        # Only the changes are written, straight to the live collection
+        assert (
+            database_sync.create_database(snapshot, previous, previous_etag='"gen1"')
+            is False
+        )
+        database_sync.finish_database_import(staged=False)
+
+    assert sorted(doc["podcastIndexId"] for doc in live.find()) == [7, 41504, 920666]
+    changed = live.find_one({"podcastIndexId": 920666})
+    assert changed["urlKey"] == "podnews.net/feed"
+    assert changed["originalUrlKey"] == "podnews.net/rss"
+    assert live.find_one({"podcastIndexId": 41504}) == unchanged
+    assert db[database_sync.MONGODB_DUPLICATES].count_documents({}) == 0
+    assert (
+        database_sync.staging_name(database_sync.MONGODB_DUPLICATES)
+        not in db.list_collection_names()
+    )
+
+
+def test_diff_falls_back_without_hashes(podcast_dump, tmp_path, monkeypatch):
+    monkeypatch.setattr(database_sync, "DIRECTORY", str(tmp_path))
+    monkeypatch.setattr(database_sync, "UNTAR_PATH", str(podcast_dump))
+    mongo = mongomock.MongoClient()
+    live = mongo[database_sync.MONGODB_DATABASE][database_sync.MONGODB_COLLECTION]
+    live.insert_one({"podcastIndexId": 1})
+    # A snapshot written before row hashes were added
+    conn = sqlite3.connect(tmp_path / "old.db")
+    conn.execute("ATTACH DATABASE ? AS dump", (str(podcast_dump),))
+    conn.execute(
+        "CREATE TABLE podcasts AS "
+        "SELECT podcastGuid, url, originalUrl, id, itunesId FROM dump.podcasts"
+    )
+    conn.commit()
+    conn.close()
+
+    with patch("guid_slurp.database_sync.MongoClient") as mock:
+        mock.return_value.__enter__.return_value = mongo
+        snapshot = database_sync.write_lookup_snapshot("gen2")
+        assert database_sync.create_database(snapshot, "old.db") is True
+
+
+def test_diff_needs_the_generation_mongodb_serves(podcast_dump, tmp_path, monkeypatch):
+    """
+    An import that was swapped in but never published: the next import
+    must not diff from the published generation, MongoDB holds another
+    """
+    monkeypatch.setattr(database_sync, "DIRECTORY", str(tmp_path))
+    monkeypatch.setattr(database_sync, "UNTAR_PATH", str(podcast_dump))
+    mongo = mongomock.MongoClient()
+    db = mongo[database_sync.MONGODB_DATABASE]
+    live = db[database_sync.MONGODB_COLLECTION]
+
+    with patch("guid_slurp.database_sync.MongoClient") as mock:
+        mock.return_value.__enter__.return_value = mongo
+        db["fileInfo"].insert_one({"etag": '"gen1"', "timestamp": datetime(2024, 3, 3)})
+        previous = database_sync.write_lookup_snapshot("gen1")
+        assert database_sync.create_database(previous, None) is True
+        database_sync.finish_database_import(staged=True)
+        # gen2 is swapped in, then the import fails before publishing it
+        db["fileInfo"].insert_one({"etag": '"gen2"', "timestamp": datetime(2024, 3, 4)})
+        database_sync.finish_database_import(staged=False)
+        live.delete_one({"podcastIndexId": 41504})
+
+        snapshot = database_sync.write_lookup_snapshot("gen3")
+        assert (
+            database_sync.create_database(snapshot, previous, previous_etag='"gen1"')
+            is True
+        )
+        database_sync.finish_database_import(staged=True)
+    assert live.count_documents({}) == 3
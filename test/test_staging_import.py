@@ -0,0 +1,55 @@
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import mongomock
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+from guid_slurp import database_sync
+from guid_slurp.main import app
+
+client = TestClient(app)
+
+
+def test_import_swaps_staging_collections(podcast_dump, monkeypatch):
+    mongo = mongomock.MongoClient()
+    db = mongo[database_sync.MONGODB_DATABASE]
+    live = db[database_sync.MONGODB_COLLECTION]
+    live.insert_one(
+        {
+            "podcastGuid": "old-guid",
+            "url": "https://old.example.com/rss",
+            "podcastIndexId": 1,
+        }
+    )
+    db["fileInfo"].insert_one(
+        {"etag": '"new"', "timestamp": datetime(2024, 3, 3, tzinfo=timezone.utc)}
+    )
+    monkeypatch.setattr(database_sync, "UNTAR_PATH", str(podcast_dump))
+    mock_motor = AsyncMongoMockClient(mock_mongo_client=mongo)
+
+    with patch("guid_slurp.database_sync.MongoClient") as mock, patch(
+        "guid_slurp.main.get_mongo_client"
+    ) as api_mock:
+        mock.return_value.__enter__.return_value = mongo
+        api_mock.return_value = mock_motor
+
+        assert database_sync.create_database() is True
+        # The live collection keeps serving the old generation meanwhile
+        assert live.count_documents({}) == 1
+        staging = db[database_sync.staging_name(database_sync.MONGODB_COLLECTION)]
+        assert staging.count_documents({}) == 3
+        assert client.get("/podcastIndexId/1").status_code == 200
+        assert client.get("/podcastIndexId/920666").status_code == 404
+
+        database_sync.finish_database_import(staged=True)
+
+    names = db.list_collection_names()
+    assert database_sync.staging_name(database_sync.MONGODB_COLLECTION) not in names
+    assert database_sync.staging_name(database_sync.MONGODB_DUPLICATES) not in names
+    assert live.count_documents({}) == 3
+    assert live.find_one({"podcastIndexId": 1}) is None
+    assert "urlKey" in live.index_information()
+    duplicates = list(db[database_sync.MONGODB_DUPLICATES].find())
+    assert [doc["count"] for doc in duplicates] == [2]
+    assert db["fileInfo"].find_one()["importedAt"] is not None
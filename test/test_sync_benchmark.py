@@ -0,0 +1,105 @@
+import sqlite3
+from collections import Counter
+from unittest.mock import patch
+
+import httpx
+import mongomock
+
+from guid_slurp import database_sync, sync_benchmark
+from guid_slurp.archive import extract_member
+from guid_slurp.synthetic import (
+    PLATFORMS,
+    synthetic_rows,
+    updated_rows,
+    write_archive,
+    write_dump,
+)
+
+
+def test_synthetic_distributions():
+    rows = list(synthetic_rows(20000, duplicate_rate=0.05))
+    groups = Counter(Counter(row[0] for row in rows).values())
+    del groups[1]
+    # Mostly pairs, and groups far larger than a uniform pick would give
+    assert groups.most_common(1)[0][0] == 2
+    assert max(groups) >= 10
+    hosts = Counter(row[1].split("/")[2] for row in rows)
+    top_host, top_count = hosts.most_common(1)[0]
+    assert PLATFORMS[0].startswith(top_host) and top_count > 0.1 * len(rows)
+    moved = sum(row[1] != row[2] for row in rows)
+    assert 0.08 < moved / len(rows) < 0.16
+    assert len({row[1] for row in rows}) == len(rows)
+
+    updated = list(updated_rows(rows, share=0.1))
+    assert len(updated) == len(rows)
+    ids = [row[3] for row in updated]
+    assert len(set(ids)) == len(ids) and max(ids) > len(rows)
+    assert 0.08 < len(set(updated) - set(rows)) / len(rows) < 0.12
+
+
+def test_dump_archive(tmp_path):
+    db_path = tmp_path / "podcastindex_feeds.db"
+    rows = list(synthetic_rows(300, duplicate_rate=0.1))
+    assert write_dump(str(db_path), rows) == 300
+    archive = tmp_path / "podcastindex_feeds.db.tgz"
+    write_archive(str(db_path), str(archive), database_sync.DB_MEMBER)
+
+    extracted = tmp_path / "extracted.db"
+    with open(archive, "rb") as f:
+        assert extract_member(f, database_sync.DB_MEMBER, str(extracted))
+    conn = sqlite3.connect(extracted)
+    found = conn.execute(
+        f"SELECT {database_sync.SNAPSHOT_COLUMNS} FROM podcasts ORDER BY id"
+    ).fetchall()
+    assert found == rows
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(podcasts)")]
+    assert len(columns) == 40 and "newestEnclosureDuration" in columns
+    conn.close()
+
+
+def test_archive_server(tmp_path):
+    path = tmp_path / "feeds.db.tgz"
+    path.write_bytes(b"0123456789")
+    with sync_benchmark.ArchiveServer() as server, httpx.Client(
+        trust_env=False
+    ) as client:
+        server.publish(str(path))
+        response = client.get(server.url)
+        assert response.content == b"0123456789"
+        etag = response.headers["etag"]
+        assert client.head(server.url, headers={"If-None-Match": etag}).status_code == (
+            304
+        )
+        response = client.get(
+            server.url, headers={"Range": "bytes=4-", "If-Range": etag}
+        )
+        assert response.status_code == 206 and response.content == b"456789"
+        response = client.get(
+            server.url, headers={"Range": "bytes=4-", "If-Range": '"x"'}
+        )
+        assert response.status_code == 200 and response.content == b"0123456789"
+
+
+def test_sync_benchmark_run():
+    args = sync_benchmark.build_parser().parse_args(
+        ["--rows=400", "--update-share=0.2", "--download-mode=stream"]
+    )
+    mongo = mongomock.MongoClient()
+    with patch("guid_slurp.database_sync.MongoClient") as mock, patch(
+        "guid_slurp.sync_benchmark.MongoClient"
+    ) as benchmark_mock:
+        mock.return_value.__enter__.return_value = mongo
+        benchmark_mock.return_value.__enter__.return_value = mongo
+        report = sync_benchmark.run(args)
+
+    full, update = report["runs"]
+    assert full["dump"]["rows"] == 400 and full["dump"]["archive_bytes"] > 0
+    assert full["mode"] == "full" and full["rows"] == 400
+    assert update["mode"] == "diff" and update["etag"] != full["etag"]
+    phases = {phase["name"]: phase for phase in full["phases"]}
+    assert phases["download"]["bytes"] == full["dump"]["archive_bytes"]
+    assert phases["download"]["streamed"] is True
+    assert report["config"]["mongodb"] is None
+    # The scratch database is dropped and the settings restored
+    assert not [name for name in mongo.list_database_names() if "sync" in name]
+    assert database_sync.DOWNLOAD_URL.startswith("https://public.podcastindex.org/")
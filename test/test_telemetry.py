@@ -0,0 +1,85 @@
+import asyncio
+import shutil
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import mongomock
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+from guid_slurp import database_sync
+from guid_slurp.main import app
+from guid_slurp.telemetry import ImportTelemetry
+
+client = TestClient(app)
+
+
+def test_phase_records():
+    telemetry = ImportTelemetry(trace_memory=True)
+    with telemetry.phase("read") as record:
+        record["rows"] = 1000
+        data = [0] * 100000
+    del data
+    with telemetry.phase("swap"):
+        pass
+    telemetry.finish()
+
+    read, swap = telemetry.phases
+    assert read["name"] == "read"
+    assert read["rows"] == 1000
+    assert read["rows_per_second"] > 0
+    assert read["peak_rss_bytes"] > 0
+    assert read["peak_traced_bytes"] >= 800000
+    assert swap["rows"] is None and swap["rows_per_second"] is None
+    assert telemetry.as_dict()["phases"] == [read, swap]
+
+
+def test_import_stores_telemetry(podcast_dump, tmp_path, monkeypatch):
+    dump = tmp_path / "dump.db"
+    shutil.copy(podcast_dump, dump)
+    monkeypatch.setattr(database_sync, "DIRECTORY", str(tmp_path))
+    monkeypatch.setattr(database_sync, "UNTAR_PATH", str(dump))
+    monkeypatch.setenv("ADMIN_HEADER_SECRET", "secret")
+    mongo = mongomock.MongoClient()
+    db = mongo[database_sync.MONGODB_DATABASE]
+    db["fileInfo"].insert_one(
+        {"etag": '"abc"', "timestamp": datetime(2024, 3, 3, tzinfo=timezone.utc)}
+    )
+
+    with patch("guid_slurp.database_sync.MongoClient") as mock, patch(
+        "guid_slurp.database_sync.check_new_podcastindex_database", return_value=False
+    ):
+        mock.return_value.__enter__.return_value = mongo
+        asyncio.run(database_sync.startup_import())
+
+    telemetry = db["fileInfo"].find_one()["importTelemetry"]
+    phases = {phase["name"]: phase for phase in telemetry["phases"]}
+    assert list(phases) == [
+        "download",
+        "extract",
+        "read",
+        "insert",
+        "lookup_index",
+        "bloom_filters",
+        "index_build",
+        "duplicates",
+        "swap",
+        "duplicates_report",
+    ]
+    assert phases["read"]["rows"] == 3
+    assert phases["insert"]["mode"] == "full"
+    assert phases["insert"]["rows"] == 3
+    assert [stage["name"] for stage in phases["insert"]["stages"]] == [
+        "read",
+        "build",
+        "write",
+    ]
+    assert phases["duplicates"]["rows"] == 1
+    assert phases["extract"]["bytes"] > 0
+
+    with patch("guid_slurp.main.get_mongo_client") as mock:
+        mock.return_value = AsyncMongoMockClient(mock_mongo_client=mongo)
+        response = client.get("/admin", headers={"X-secret": "secret"})
+    assert response.status_code == 200
+    admin_phases = response.json()[0]["importTelemetry"]["phases"]
+    assert [phase["name"] for phase in admin_phases] == list(phases)
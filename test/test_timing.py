@@ -0,0 +1,83 @@
+import re
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from guid_slurp import main, timing
+from guid_slurp.main import app
+from test.test_api import setup_mongo_mock
+
+client = TestClient(app)
+
+
+def server_timing(response) -> dict:
+    """
+    The Server-Timing metrics of a response by name
+    """
+    metrics = {}
+    for metric in response.headers["Server-Timing"].split(", "):
+        name, *params = metric.split(";")
+        metrics[name] = dict(param.split("=", 1) for param in params)
+    return metrics
+
+
+def test_server_timing_header():
+    mock_mongo_client, _ = setup_mongo_mock()
+    with patch("guid_slurp.main.get_mongo_client") as mock:
+        mock.return_value = mock_mongo_client
+        response = client.get("/url/?url=http://feed.nashownotes.com/rss.xml")
+        assert response.status_code == 200
+        metrics = server_timing(response)
+        assert list(metrics) == ["validate", "cache", "db", "serialize", "total"]
+        assert metrics["cache"] == {"desc": '"miss"'}
+        assert metrics["db"]["desc"] == '"mongo"'
+        for name in ("validate", "db", "serialize", "total"):
+            assert re.fullmatch(r"\d+\.\d{3}", metrics[name]["dur"])
+        assert response.headers["Timing-Allow-Origin"] == "*"
+
+        response = client.get("/url/?url=http://feed.nashownotes.com/rss.xml")
+        metrics = server_timing(response)
+        assert metrics["cache"] == {"desc": '"hit"'}
+        assert "db" not in metrics
+
+        response = client.post(
+            "/batch/",
+            json={"guid": ["856cd618-7f34-57ea-9b84-3600f1f65e7f"], "itunesId": [1]},
+        )
+        assert response.status_code == 200
+        metrics = server_timing(response)
+        assert metrics["cache-podcastGuid"] == {"desc": '"0 hit 1 miss"'}
+        assert "db-podcastGuid" in metrics and "db-itunesId" in metrics
+        assert list(metrics)[-2:] == ["serialize", "total"]
+
+        # Routes off the resolver path only report the total
+        response = client.get("/no/such/path")
+        assert list(server_timing(response)) == ["total"]
+
+
+def test_span_outside_request():
+    with timing.span("db"):
+        pass
+    timing.note("cache", "hit")
+    timing.end_validation()
+
+
+def test_slow_request_log(monkeypatch):
+    log = timing.SlowRequestLog(top=2, interval=3600)
+    for ms in (5.0, 50.0, 1.0, 20.0):
+        log.record(ms, f"GET /guid/{ms}")
+    with patch("guid_slurp.timing.logging.info") as info:
+        log.flush()
+    lines = [call.args[0] for call in info.call_args_list]
+    assert lines == [
+        "Slowest 2 of 4 requests in the last 3600s",
+        "Slow request 50.000ms GET /guid/50.0",
+        "Slow request 20.000ms GET /guid/20.0",
+    ]
+    assert log.slowest == [] and log.count == 0
+
+    monkeypatch.setattr(main, "slow_request_log", timing.SlowRequestLog(1, 3600))
+    client.get("/no/such/path")
+    ((_, _, description),) = main.slow_request_log.slowest
+    assert description.startswith("GET /no/such/path query:  status: 404")
+    assert "Server-Timing: total;dur=" in description
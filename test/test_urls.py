@@ -0,0 +1,36 @@
+import pytest
+
+from guid_slurp.urls import canonical_url, exact_first, url_keys
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "https://feed.example.com/rss",
+        "http://feed.example.com/rss",
+        "HTTPS://Feed.Example.COM/rss/",
+        "http://feed.example.com:80/rss",
+        "https://feed.example.com:443/rss#top",
+        "feed.example.com/rss",
+    ],
+)
+def test_canonical_url_variants(url):
+    assert canonical_url(url) == "feed.example.com/rss"
+
+
+def test_canonical_url_keeps_what_matters():
+    assert canonical_url("https://feed.example.com/RSS") == "feed.example.com/RSS"
+    assert canonical_url("https://feed.example.com:8080/rss") == (
+        "feed.example.com:8080/rss"
+    )
+    assert canonical_url("https://example.com/feed?id=1") == "example.com/feed?id=1"
+    assert canonical_url("https://example.com/") == "example.com"
+
+
+def test_url_keys_and_ordering():
+    assert url_keys("https://example.com/rss", "http://example.com/rss/") == [
+        "example.com/rss"
+    ]
+    assert url_keys("https://example.com/rss", None) == ["example.com/rss"]
+    documents = [{"url": "http://example.com/rss"}, {"url": "https://example.com/rss"}]
+    assert exact_first(documents, "https://example.com/rss")[0] == documents[1]